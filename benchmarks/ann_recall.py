@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of the vector index backends against exact search
+
+Builds one user index of --size clustered unit vectors (summaries are
+not uniformly random, and neither ANN method helps on uniform data),
+then runs --queries new vectors from the same distribution through:
+- exact: UserVectors (matrix-vector product + argpartition)
+- ivf:   IVFVectors at several nprobe values
+- hnsw:  HNSWVectors at several ef values (needs hnswlib)
+and reports recall@k against exact plus p50/p99 query latency.
+
+Usage:
+    python benchmarks/ann_recall.py
+    python benchmarks/ann_recall.py --size 100000 --dim 768 --k 3 --queries 200
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory.vector_index import UserVectors, IVFVectors, HNSWVectors  # noqa: E402
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def clustered(rng, centers, size, spread):
+    data = centers[rng.integers(len(centers), size=size)]
+    data = data + spread * rng.standard_normal(data.shape, dtype=np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def run_queries(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append({item_id for item_id, _, _ in hits})
+    return latencies, results
+
+
+def report(name, build_s, latencies, results, truth):
+    recall = np.mean([len(r & t) / len(t) for r, t in zip(results, truth)])
+    print(f"{name:<16} recall@k={recall:.3f}  p50={percentile(latencies, 50):>8.3f} ms  "
+          f"p99={percentile(latencies, 99):>8.3f} ms  build={build_s:>7.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=2.5, help="within-cluster noise (higher is harder)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", default="4,16,64")
+    parser.add_argument("--ef", default="32,64,128")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    data = clustered(rng, centers, args.size, args.spread)
+    queries = clustered(rng, centers, args.queries, args.spread)
+    ids = [str(i) for i in range(args.size)]
+    print(f"size={args.size} dim={args.dim} k={args.k} queries={args.queries}")
+
+    started = time.perf_counter()
+    exact = UserVectors(args.dim, capacity=args.size)
+    for i in range(args.size):
+        exact.upsert(ids[i], data[i], "")
+    exact_build = time.perf_counter() - started
+    latencies, truth = run_queries(exact, queries, args.k)
+    report("exact", exact_build, latencies, truth, truth)
+
+    started = time.perf_counter()
+    ivf = IVFVectors(args.dim, capacity=args.size, min_vectors=1)
+    for i in range(args.size):
+        ivf.upsert(ids[i], data[i], "")
+    ivf.install_training(*ivf.train_job()())
+    ivf_build = time.perf_counter() - started
+    for nprobe in [int(n) for n in args.nprobe.split(",")]:
+        ivf.nprobe = nprobe
+        latencies, results = run_queries(ivf, queries, args.k)
+        report(f"ivf nprobe={nprobe}", ivf_build, latencies, results, truth)
+
+    try:
+        started = time.perf_counter()
+        hnsw = HNSWVectors(args.dim, capacity=args.size)
+        for start in range(0, args.size, 10000):
+            # Batch the build; per-item upserts are what the service does
+            batch = data[start:start + 10000]
+            labels = np.arange(start, start + len(batch))
+            hnsw.index.add_items(batch, labels)
+            for label in labels.tolist():
+                hnsw.labels[ids[label]] = label
+                hnsw.ids_by_label[label] = ids[label]
+                hnsw.texts[label] = ""
+        hnsw.next_label = args.size
+        hnsw_build = time.perf_counter() - started
+    except ImportError:
+        print("hnsw             skipped (pip install hnswlib)")
+        return
+    for ef in [int(e) for e in args.ef.split(",")]:
+        hnsw.index.set_ef(max(ef, args.k))
+        latencies, results = run_queries(hnsw, queries, args.k)
+        report(f"hnsw ef={ef}", hnsw_build, latencies, results, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag under concurrent MemoryStore load
+
+Runs the same read/write mix twice against a temp MemoryStore:
+- inline: MEMORY_IO_THREADS=0, file I/O on the event loop (old behavior)
+- pooled: MEMORY_IO_THREADS=N, file I/O on the memory I/O pool
+and reports how late a 10 ms ticker coroutine wakes up while it runs,
+i.e. how long any other request on the worker would have been stalled.
+
+Usage:
+    python benchmarks/event_loop_lag.py
+    python benchmarks/event_loop_lag.py --ops 4000 --concurrency 64 --turns 3000 --threads 8
+    python benchmarks/event_loop_lag.py --backend sqlite
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory import io_pool  # noqa: E402
+from modules.ai.memory.memory_store import MemoryStore  # noqa: E402
+from modules.ai.memory.sqlite_store import SQLiteMemoryStore  # noqa: E402
+
+TICK_SECONDS = 0.01
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def ticker(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+def populate(store: MemoryStore, args):
+    """Build long conversations up front (synchronously, not measured)"""
+    turns = [{"role": "user", "content": "x" * args.turn_bytes}] * args.turns
+    for c in range(args.conversations):
+        store._save_turns_sync("bench_user", f"conv_{c}", turns)
+
+
+async def workload(store: MemoryStore, args):
+    rng = random.Random(7)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        async with semaphore:
+            conversation_id = f"conv_{rng.randrange(args.conversations)}"
+            roll = rng.random()
+            if roll < 0.4:
+                await store.save_turn("bench_user", conversation_id, "a new turn", "user")
+            elif roll < 0.7:
+                # Full-history reads (e.g. get_conversation_context)
+                await store.get_conversation_history("bench_user", conversation_id)
+            elif roll < 0.9:
+                await store.get_conversation_history("bench_user", conversation_id, limit=20)
+            else:
+                await store.get_all_conversations("bench_user")
+
+    await asyncio.gather(*[one(i) for i in range(args.ops)])
+
+
+async def run_mode(name: str, threads: int, store: MemoryStore, args):
+    os.environ["MEMORY_IO_THREADS"] = str(threads)
+    io_pool.shutdown_io_pool()
+
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    await workload(store, args)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick_task
+
+    stats = io_pool.get_io_stats()
+    print(f"{name:<8} threads={threads:<3} ops/s={args.ops / elapsed:>8.1f}  "
+          f"loop lag p50={percentile(lags, 50) * 1000:>6.2f} ms  "
+          f"p99={percentile(lags, 99) * 1000:>7.2f} ms  max={max(lags or [0]) * 1000:>7.2f} ms  "
+          f"io p99={stats['io_ms_p99']:.2f} ms  max queue={stats['max_queue_depth']}")
+
+
+async def main_async(args):
+    data_dir = tempfile.mkdtemp(prefix="promptlearn-lag-")
+    if args.backend == "sqlite":
+        store = SQLiteMemoryStore(str(Path(data_dir) / "memory.db"))
+    else:
+        store = MemoryStore(data_dir)
+    populate(store, args)
+    await run_mode("inline", 0, store, args)
+    await run_mode("pooled", args.threads, store, args)
+    io_pool.shutdown_io_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=1000, help="turns per conversation before the run")
+    parser.add_argument("--turn-bytes", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the /ai/generate pipeline against the mock upstream
+
+Runs the FastAPI app in-process with LLM_PROVIDER=mock and
+EMBEDDING_PROVIDER=mock, fires concurrent requests and reports latency
+percentiles plus the limiter/breaker/mock metrics.
+
+Usage:
+    python benchmarks/mock_load_test.py --requests 500 --concurrency 50 --users 20
+    MOCK_LLM_429_RATE=0.1 MOCK_LLM_RETRY_AFTER=0.5 python benchmarks/mock_load_test.py
+    MEMORY_WRITE_BEHIND=1 python benchmarks/mock_load_test.py --metrics
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("LLM_PROVIDER", "mock")
+os.environ.setdefault("EMBEDDING_PROVIDER", "mock")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import httpx  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(args):
+    from main import app
+    from modules.ai import ai_service
+    from modules.ai.memory.memory_store import MemoryStore
+    from modules.ai.memory.write_behind import WriteBehindStore, write_behind_enabled
+
+    # Keep benchmark data out of the real data/memory tree
+    store = MemoryStore(tempfile.mkdtemp(prefix="promptlearn-bench-"))
+    if write_behind_enabled():
+        store = WriteBehindStore(store)
+    ai_service.memory_manager.set_store(store)
+
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    path = "/ai/generate/stream" if args.stream else "/ai/generate"
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+            async def one(i):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post(path, json={
+                        "user_id": f"bench_user_{i % args.users}",
+                        "conversation_id": f"bench_conv_{i % (args.users * 2)}",
+                        "message": f"Explain concept #{i % args.distinct_prompts} in JavaScript",
+                    })
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*[one(i) for i in range(args.requests)])
+            elapsed = time.perf_counter() - started
+
+            metrics = (await client.get("/ai/metrics")).json()
+
+    print(f"requests={args.requests} concurrency={args.concurrency} elapsed={elapsed:.2f}s "
+          f"throughput={args.requests / elapsed:.1f} req/s")
+    print(f"statuses={statuses}")
+    for p in (50, 90, 99):
+        print(f"p{p}={percentile(latencies, p) * 1000:.1f} ms")
+    if args.metrics:
+        print(json.dumps(metrics, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--distinct-prompts", type=int, default=50)
+    parser.add_argument("--stream", action="store_true", help="use /ai/generate/stream")
+    parser.add_argument("--metrics", action="store_true", help="dump /ai/metrics afterwards")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
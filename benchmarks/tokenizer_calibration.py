@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Calibrate the offline token counters against a reference
+
+Compares the legacy chars * 0.3 heuristic and the BPE approximation
+(memory/tokenizer.py) on prose, code and mixed tutor content. The
+reference is, in order of preference:
+- Gemini countTokens (--gemini, needs GOOGLE_API_KEY)
+- tiktoken cl100k_base (if installed and its encoding is cached)
+Without a reference, only the two estimates and their timing are shown.
+
+Usage:
+    python benchmarks/tokenizer_calibration.py
+    python benchmarks/tokenizer_calibration.py --gemini --model models/gemini-2.0-flash
+    python benchmarks/tokenizer_calibration.py --file some_transcript.txt
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory.tokenizer import (  # noqa: E402
+    BPEApproxTokenizer, HeuristicTokenizer, TokenCounter, create_tokenizer
+)
+
+SAMPLES = {
+    "prose": (
+        "A closure is a function that remembers the variables from the scope in which "
+        "it was created, even after that scope has finished executing. This lets you "
+        "keep private state between calls without using a global variable. Think of it "
+        "like a backpack the function carries around with everything it needs."
+    ),
+    "code_js": (
+        "function makeCounter() {\n"
+        "  let count = 0;\n"
+        "  return function increment() {\n"
+        "    count += 1;\n"
+        "    return count;\n"
+        "  };\n"
+        "}\n\n"
+        "const counter = makeCounter();\n"
+        "console.log(counter()); // 1\n"
+        "console.log(counter()); // 2\n"
+    ),
+    "code_py": (
+        "class MemoryStore:\n"
+        "    def __init__(self, storage_path: str = None):\n"
+        "        self.storage_path = Path(storage_path)\n"
+        "        self.storage_path.mkdir(parents=True, exist_ok=True)\n\n"
+        "    async def save_turn(self, user_id, conversation_id, message, role):\n"
+        "        data = {\"turns\": [], \"metadata\": {}}\n"
+        "        data[\"turns\"].append({\"role\": role, \"content\": message})\n"
+    ),
+    "mixed": (
+        "Here's how `Array.prototype.map` works:\n\n"
+        "1. It calls your callback once per element\n"
+        "2. It returns a **new** array (the original is untouched)\n\n"
+        "```js\nconst doubled = [1, 2, 3].map(n => n * 2); // [2, 4, 6]\n```\n\n"
+        "Follow-up: what do you think `[1, 2, 3].map(String)` returns?"
+    ),
+    "json": (
+        '{"user_id": "42", "conversation_id": "7f077e0e-9ada-444e-b94f-d613fed28f78", '
+        '"turns": [{"role": "user", "content": "hi", "timestamp": "2026-01-05T10:00:00"}]}'
+    ),
+}
+
+
+def gemini_reference(model: str):
+    import httpx
+    api_key = os.environ["GOOGLE_API_KEY"]
+    url = f"https://generativelanguage.googleapis.com/v1beta/{model}:countTokens"
+
+    def count(text: str) -> int:
+        response = httpx.post(url, params={"key": api_key},
+                              json={"contents": [{"parts": [{"text": text}]}]}, timeout=30)
+        response.raise_for_status()
+        return response.json()["totalTokens"]
+
+    return "gemini", count
+
+
+def tiktoken_reference():
+    tokenizer = create_tokenizer("tiktoken")
+    if tokenizer.name != "tiktoken":
+        return None, None
+    return "tiktoken", tokenizer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini", action="store_true", help="use Gemini countTokens as reference")
+    parser.add_argument("--model", default="models/gemini-2.0-flash")
+    parser.add_argument("--file", action="append", default=[], help="extra text files to include")
+    args = parser.parse_args()
+
+    samples = dict(SAMPLES)
+    for path in args.file:
+        samples[Path(path).name] = Path(path).read_text()
+
+    ref_name, reference = gemini_reference(args.model) if args.gemini else tiktoken_reference()
+    heuristic = HeuristicTokenizer()
+    bpe = BPEApproxTokenizer()
+
+    header = f"{'sample':<14}{'chars':>7}{'heuristic':>11}{'bpe':>7}"
+    if reference:
+        header += f"{ref_name:>10}{'heur err':>10}{'bpe err':>9}"
+    print(header)
+
+    heur_errors, bpe_errors = [], []
+    for name, text in samples.items():
+        h, b = heuristic.count(text), bpe.count(text)
+        row = f"{name:<14}{len(text):>7}{h:>11}{b:>7}"
+        if reference:
+            r = reference(text)
+            heur_errors.append(abs(h - r) / r)
+            bpe_errors.append(abs(b - r) / r)
+            row += f"{r:>10}{(h - r) / r:>+10.0%}{(b - r) / r:>+9.0%}"
+        print(row)
+
+    if reference:
+        print(f"\nmean abs error: heuristic {sum(heur_errors) / len(heur_errors):.1%}, "
+              f"bpe {sum(bpe_errors) / len(bpe_errors):.1%}")
+
+    # Cost of counting, cold vs memoized (build_context recounts the same messages)
+    messages = [{"role": "user", "content": text} for text in samples.values()] * 200
+    counter = TokenCounter(bpe)
+    started = time.perf_counter()
+    counter.count_messages(messages[:len(samples)])
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    counter.count_messages(messages)
+    warm = time.perf_counter() - started
+    print(f"\nbpe cold: {cold / len(samples) * 1e6:.1f} us/message, "
+          f"memoized: {warm / len(messages) * 1e6:.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Top-k summary similarity: pure-Python loop vs NumPy matrix
+
+For each memory count, builds random unit vectors and times one query:
+- python: the old path, a pure-Python cosine similarity per vector
+  plus a full sort (skipped above --python-max, it takes minutes)
+- numpy: UserVectors.search, one matrix-vector product + argpartition
+Also checks both return the same top-k.
+
+Usage:
+    python benchmarks/vector_topk.py
+    python benchmarks/vector_topk.py --sizes 10,1000,100000 --dim 3072 --k 3
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory.vector_index import UserVectors  # noqa: E402
+
+
+def time_it(fn, repeat: int) -> float:
+    """Best-of-`repeat` wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def cosine_similarity(vec1, vec2) -> float:
+    """The retriever's former per-vector similarity"""
+    if vec1 is None or vec2 is None or len(vec1) == 0 or len(vec1) != len(vec2):
+        return 0.0
+
+    dot_product = sum(a * b for a, b in zip(vec1, vec2))
+    magnitude1 = sum(a * a for a in vec1) ** 0.5
+    magnitude2 = sum(b * b for b in vec2) ** 0.5
+
+    if magnitude1 == 0 or magnitude2 == 0:
+        return 0.0
+
+    return dot_product / (magnitude1 * magnitude2)
+
+
+def python_topk(query, vectors, k):
+    scored = [(cosine_similarity(query, vector), i) for i, vector in enumerate(vectors)]
+    scored.sort(reverse=True)
+    return [i for _, i in scored[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--dim", type=int, default=768,
+                        help="embedding dimensions (100k x 3072 float32 needs 1.2 GB)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--python-max", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    print(f"dim={args.dim} k={args.k}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        data = rng.standard_normal((size, args.dim), dtype=np.float32)
+        query = rng.standard_normal(args.dim, dtype=np.float32)
+
+        vectors = UserVectors(args.dim, capacity=size)
+        started = time.perf_counter()
+        for i in range(size):
+            vectors.upsert(str(i), data[i], "")
+        build_ms = (time.perf_counter() - started) * 1000
+
+        numpy_ms = time_it(lambda: vectors.search(query, args.k), args.repeat)
+        line = f"n={size:<7} numpy={numpy_ms:>9.3f} ms  build={build_ms:>9.1f} ms"
+
+        if size <= args.python_max:
+            rows = data.tolist()
+            query_list = query.tolist()
+            python_ms = time_it(lambda: python_topk(query_list, rows, args.k), max(1, args.repeat // 2))
+            same = python_topk(query_list, rows, args.k) == [int(i) for i, _, _ in vectors.search(query, args.k)]
+            line += f"  python={python_ms:>10.3f} ms  speedup={python_ms / numpy_ms:>7.1f}x  same_topk={same}"
+        else:
+            line += "  python=   skipped"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Archive old conversation turns into compressed segments
+
+Sweeps every user's conversations and moves turns older than
+MEMORY_COMPACT_MAX_AGE_DAYS (or covered by the conversation summary)
+into immutable segment files, keeping MEMORY_COMPACT_KEEP_TURNS live.
+The service compacts a conversation after each consolidation; run this
+periodically (e.g. nightly) to catch conversations that went idle,
+while the service is stopped: store locks are per process, so a turn
+appended by the service while this rewrites that live log would be lost.
+
+--train-dict samples live turns and trains a zstd dictionary (needs the
+optional zstandard package); set MEMORY_ARCHIVE_ZSTD_DICT_ID to the
+printed id to compress new segments with it.
+
+Usage:
+    python scripts/compact_memory.py
+    python scripts/compact_memory.py --data-dir /srv/promptlearn/data/memory --max-age-days 7
+    python scripts/compact_memory.py --train-dict
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory.archive import train_dictionary  # noqa: E402
+from modules.ai.memory.memory_store import MemoryStore  # noqa: E402
+
+
+def sample_turns(store: MemoryStore, limit: int = 20000):
+    """Raw turn lines from live logs, for dictionary training"""
+    samples = []
+    for user_id in store._iter_user_ids():
+        for log_file in store._get_user_dir(user_id).glob("*.jsonl"):
+            samples.extend(line for line in log_file.read_bytes().splitlines() if line.strip())
+            if len(samples) >= limit:
+                return samples[:limit]
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", help="memory storage path (default: data/memory)")
+    parser.add_argument("--max-age-days", type=float, help="override MEMORY_COMPACT_MAX_AGE_DAYS")
+    parser.add_argument("--train-dict", action="store_true", help="train a zstd dictionary instead of compacting")
+    parser.add_argument("--dict-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    if args.max_age_days is not None:
+        os.environ["MEMORY_COMPACT_MAX_AGE_DAYS"] = str(args.max_age_days)
+    store = MemoryStore(args.data_dir)
+
+    if args.train_dict:
+        samples = sample_turns(store)
+        dict_id = train_dictionary(store.storage_path, samples, args.dict_size)
+        print(f"Trained a {args.dict_size} byte dictionary on {len(samples)} turns")
+        print(f"MEMORY_ARCHIVE_ZSTD_DICT_ID={dict_id}")
+        return
+
+    started = time.perf_counter()
+    users = set(store._iter_user_ids()) | set(store._flat_users)
+    archived = sum(store._compact_user_sync(user_id) for user_id in sorted(users))
+    stats = store.stats()["archive"]
+    print(f"Archived {archived} turns from {len(users)} users in {time.perf_counter() - started:.2f}s "
+          f"({stats['codec']}, {stats['bytes_before']} -> {stats['bytes_after']} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Move a data/memory tree from the flat layout to the sharded one
+
+    conversations/{user_id}/...  ->  conversations/ab/cd/{user_id}/...
+    summaries/{user_id}/...      ->  summaries/ab/cd/{user_id}/...
+
+Safe to run while the service is up: files are renamed one at a time,
+never over an existing file, and the service moves any user it touches
+before this script gets to them. Re-running it is a no-op.
+
+Usage:
+    python scripts/migrate_memory_layout.py
+    python scripts/migrate_memory_layout.py --data-dir /srv/promptlearn/data/memory --dry-run
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modules.ai.memory.memory_store import MemoryStore, _find_flat_user_dirs  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", help="memory storage path (default: data/memory)")
+    parser.add_argument("--dry-run", action="store_true", help="only list the users that would move")
+    args = parser.parse_args()
+
+    store = MemoryStore(args.data_dir)
+    users = sorted(
+        _find_flat_user_dirs(store.conversations_dir) | _find_flat_user_dirs(store.summaries_dir)
+    )
+    print(f"{len(users)} user directories in the flat layout under {store.storage_path}")
+
+    if args.dry_run:
+        for user_id in users:
+            print(f"  {user_id}")
+        return
+
+    started = time.perf_counter()
+    moved = store._migrate_layout_sync()
+    remaining = _find_flat_user_dirs(store.conversations_dir) | _find_flat_user_dirs(store.summaries_dir)
+    print(f"Migrated {moved} users in {time.perf_counter() - started:.2f}s; {len(remaining)} left in place")
+    for user_id in sorted(remaining):
+        print(f"  {user_id} (conflicting files, see messages above)")
+
+
+if __name__ == "__main__":
+    main()
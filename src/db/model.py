@@ -0,0 +1,62 @@
+"""
+DB Model - SQLite schema for the memory store
+Applied idempotently when a connection pool is opened
+"""
+import sqlite3
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    turn_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    last_updated TEXT,
+    PRIMARY KEY (user_id, conversation_id)
+) WITHOUT ROWID;
+
+-- Clustered on (user_id, conversation_id, seq): tail reads are one range scan
+CREATE TABLE IF NOT EXISTS turns (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (user_id, conversation_id, seq)
+) WITHOUT ROWID;
+
+-- Summary text plus the rest of the conversation state as JSON
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    summary TEXT,
+    state TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (user_id, conversation_id)
+) WITHOUT ROWID;
+
+-- float32 vectors keyed by content hash and embedding model
+CREATE TABLE IF NOT EXISTS embeddings (
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (content_hash, model)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+    ON conversations (user_id, last_updated);
+"""
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Create tables and indexes if missing and record the schema version"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
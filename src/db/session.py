@@ -0,0 +1,125 @@
+"""
+DB Session - Small SQLite connection pool (WAL mode)
+Connections are shared across the memory I/O threads, one at a time
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from db.model import init_schema
+
+
+class SQLitePool:
+    """
+    Fixed-size pool of SQLite connections to one database file
+
+    WAL lets readers proceed while a writer commits; write transactions
+    use BEGIN IMMEDIATE so concurrent writers queue on busy_timeout
+    instead of failing with "database is locked" mid-transaction.
+    """
+
+    def __init__(self, path: str, size: int = 4, busy_timeout_ms: int = 5000):
+        self.path = str(path)
+        self.size = max(1, size)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self.waits = 0
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self.connection() as conn:
+            init_schema(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+
+        self.waits += 1
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection (autocommit; each statement is its own transaction)"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection inside a write transaction (commit or roll back)"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+        self._idle = queue.LifoQueue()
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "open": len(self._all),
+            "idle": self._idle.qsize(),
+            "waits": self.waits,
+        }
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def default_sqlite_path() -> Path:
+    base_dir = Path(__file__).resolve().parent.parent.parent
+    return Path(os.getenv("MEMORY_SQLITE_PATH") or base_dir / "data" / "memory" / "memory.db")
+
+
+def get_sqlite_pool(path: Optional[str] = None) -> SQLitePool:
+    """Get or create the shared pool for a database file"""
+    path = str(path or default_sqlite_path())
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            size = int(os.getenv("MEMORY_SQLITE_POOL_SIZE") or os.getenv("MEMORY_IO_THREADS") or "8")
+            pool = SQLitePool(path, size=size)
+            _pools[path] = pool
+    return pool
+
+
+def close_sqlite_pools():
+    """Close every pooled connection (app shutdown)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -7,11 +7,30 @@ ENV_PATH = BASE_DIR / ".env"
 
 load_dotenv(dotenv_path=ENV_PATH)
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from modules.ai.ai_routes import router as ai_router
 from modules.ai.memory_routes import router as memory_router
-
-app = FastAPI(title="PromptLearn AI Service")
+from shared.http_client import init_http_client, close_http_client
+from modules.ai.memory.io_pool import shutdown_io_pool
+from modules.ai.memory.memory_manager import get_memory_manager
+from db.session import close_sqlite_pools
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: one pooled HTTP client shared by all LLM/embedding calls
+    await init_http_client()
+    yield
+    # Shutdown: flush buffered memory writes, then release pooled connections
+    await get_memory_manager().close()
+    await close_http_client()
+    # Let queued memory writes finish before the process exits
+    shutdown_io_pool()
+    close_sqlite_pools()
+
+
+app = FastAPI(title="PromptLearn AI Service", lifespan=lifespan)
 
 app.include_router(ai_router)
 app.include_router(memory_router)
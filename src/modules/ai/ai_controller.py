@@ -1,6 +1,15 @@
-from modules.ai.ai_schemas import GenerateRequest, GenerateResponse
-from modules.ai.ai_service import generate_response
+from typing import AsyncIterator, Dict
+from modules.ai.ai_schemas import GenerateRequest, GenerateResponse, BatchGenerateRequest
+from modules.ai.ai_service import generate_response, generate_response_stream, generate_batch
 
 
 async def generate(req: GenerateRequest) -> GenerateResponse:
     return await generate_response(req)
+
+
+def generate_stream(req: GenerateRequest) -> AsyncIterator[Dict]:
+    return generate_response_stream(req)
+
+
+def generate_many(req: BatchGenerateRequest) -> AsyncIterator[Dict]:
+    return generate_batch(req)
@@ -2,20 +2,9 @@
 AI Memory - Public API for memory operations
 Provides simple interface for managing conversation memory
 """
-from modules.ai.memory.memory_manager import MemoryManager
+from modules.ai.memory.memory_manager import get_memory_manager
 from typing import Dict, List, Optional
 
-# Global memory manager instance
-_memory_manager = None
-
-
-def get_memory_manager() -> MemoryManager:
-    """Get or create memory manager singleton"""
-    global _memory_manager
-    if _memory_manager is None:
-        _memory_manager = MemoryManager()
-    return _memory_manager
-
 
 async def save_message(
     user_id: str,
@@ -1,19 +1,165 @@
-from fastapi import APIRouter, HTTPException
-from modules.ai.ai_controller import generate
-from modules.ai.ai_schemas import GenerateRequest, GenerateResponse
+import os
+import json
+import asyncio
+from contextlib import aclosing
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from modules.ai.ai_controller import generate, generate_stream, generate_many
+from modules.ai.ai_schemas import GenerateRequest, GenerateResponse, BatchGenerateRequest
 from shared.llm_client import ModelBusyError
+from shared.deadline import deadline_scope, DeadlineExceeded
+from shared.http_client import get_pool_stats
+from shared.llm_cache import get_response_cache
+from shared.single_flight import single_flight_stats
+from shared.rate_limiter import get_rate_limiter
+from shared.hedging import get_hedger
+from shared.circuit_breaker import get_breakers
+from shared.mock_llm import llm_mock_enabled, embedding_mock_enabled, get_mock_upstream
+from modules.ai.memory.tokenizer import get_token_counter
+from modules.ai.memory.io_pool import get_io_stats
+from modules.ai.memory.memory_manager import get_memory_manager
 import traceback
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
 
+# Non-standard "client closed request" status, for logs only (nobody is listening)
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away before the response was ready"""
+
+
+def _request_budget(req: GenerateRequest) -> Optional[float]:
+    """Seconds the request may take: REQUEST_DEADLINE_SECONDS, optionally lowered per request"""
+    budget = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+    if req.deadline_ms is not None:
+        budget = min(budget, req.deadline_ms / 1000)
+    return budget if budget > 0 else None
+
+
+async def _run_until_disconnect(request: Request, coro):
+    """
+    Await `coro`, cancelling it if the client disconnects first
+
+    Cancellation propagates through the memory pipeline and call_llm,
+    so queued limiter slots are released and in-flight upstream requests
+    are aborted instead of burning quota for nobody.
+    """
+    poll_interval = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            # Retrieve the outcome so a late error isn't logged as unhandled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
 @router.post("/generate", response_model=GenerateResponse)
-async def generate_route(req: GenerateRequest):
+async def generate_route(req: GenerateRequest, request: Request):
     try:
-        return await generate(req)
+        # The deadline is inherited by the generation task (contextvars)
+        with deadline_scope(_request_budget(req)):
+            return await _run_until_disconnect(request, generate(req))
+    except ClientDisconnected:
+        print(f"Client disconnected, cancelled /ai/generate for user {req.user_id}")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except ModelBusyError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"ERROR in /ai/generate: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_stream_route(req: GenerateRequest):
+    async def event_source():
+        # The body is iterated after the route returns, so the deadline is
+        # set here, in the task that streams the response. aclosing()
+        # guarantees the generator (and the per-user lock it holds) is
+        # released when the client disconnects mid-stream
+        with deadline_scope(_request_budget(req)):
+            async with aclosing(generate_stream(req)) as events:
+                try:
+                    async for event in events:
+                        yield _format_sse(event["event"], event["data"])
+                except DeadlineExceeded as e:
+                    yield _format_sse("error", {"status": 504, "detail": str(e)})
+                except ModelBusyError as e:
+                    yield _format_sse("error", {"status": 503, "detail": str(e)})
+                except Exception as e:
+                    print(f"ERROR in /ai/generate/stream: {str(e)}")
+                    print(traceback.format_exc())
+                    yield _format_sse("error", {"status": 500, "detail": str(e)})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/generate/batch")
+async def generate_batch_route(req: BatchGenerateRequest):
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+    if not req.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(req.items) > max_items:
+        raise HTTPException(status_code=400, detail=f"At most {max_items} items per batch")
+
+    async def ndjson():
+        async with aclosing(generate_many(req)) as results:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/metrics")
+async def metrics_route():
+    """Upstream client metrics for monitoring"""
+    metrics = {
+        "http_pool": get_pool_stats(),
+        "response_cache": get_response_cache().stats(),
+        "single_flight": single_flight_stats(),
+        "rate_limiter": get_rate_limiter().stats(),
+        "hedging": get_hedger().stats(),
+        "token_counter": get_token_counter().stats(),
+        "memory_io": get_io_stats()
+    }
+    manager = get_memory_manager()
+    metrics["vector_index"] = manager.retriever.index.stats()
+    if manager.retriever.chunks is not None:
+        metrics["chunk_index"] = manager.retriever.chunks.stats()
+    metrics["embedding_batcher"] = manager.retriever.batcher.stats()
+    metrics["embedding_cache"] = manager.retriever.embeddings_cache.stats()
+    store = manager.store
+    if hasattr(store, "stats"):
+        metrics["memory_store"] = store.stats()
+    if llm_mock_enabled() or embedding_mock_enabled():
+        metrics["mock_upstream"] = get_mock_upstream().stats()
+    return metrics
+
+
+@router.get("/breakers")
+async def breakers_route():
+    """Circuit breaker state per (provider, model)"""
+    return {
+        "breakers": get_breakers().stats()
+    }
@@ -13,8 +13,27 @@ class GenerateRequest(BaseModel):
     message: str
     messages: List[Message] = []
     options: Optional[Dict] = None
+    # Overall time budget for the request (capped by REQUEST_DEADLINE_SECONDS)
+    deadline_ms: Optional[int] = None
 
 
 class GenerateResponse(BaseModel):
     assistant_message: str
     meta: Dict
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    message: str
+    messages: List[Message] = []
+    conversation_id: Optional[Union[int, str]] = None
+    options: Optional[Dict] = None
+
+
+class BatchGenerateRequest(BaseModel):
+    user_id: Union[int, str]
+    items: List[BatchItem]
+    system_prompt: Optional[str] = None
+    options: Optional[Dict] = None
+    use_memory: bool = False
+    concurrency: int = 8
@@ -2,15 +2,23 @@
 AI Service - Main business logic for AI generation
 Now with full memory system integration
 """
+import os
+import time
 import asyncio
-from modules.ai.ai_schemas import GenerateRequest, GenerateResponse
-from modules.ai.memory.memory_manager import MemoryManager
+import weakref
+from typing import AsyncIterator, Dict, List
+from modules.ai.ai_schemas import GenerateRequest, GenerateResponse, BatchGenerateRequest, BatchItem
+from modules.ai.memory.memory_manager import get_memory_manager
 from modules.ai.context_builder import SYSTEM_PROMPT
-from shared.llm_client import call_llm
+from shared.llm_client import call_llm, stream_llm, ModelBusyError
 
-# Initialize memory manager (singleton)
-memory_manager = MemoryManager()
+# Shared memory manager (singleton, also used by the /ai/memory API)
+memory_manager = get_memory_manager()
 _user_locks = {}
+# Held from the user turn to the assistant turn, so turns of one
+# conversation never interleave; always taken before the user lock.
+# Entries go away once no request holds or waits on them.
+_conversation_locks = weakref.WeakValueDictionary()
 
 
 def _get_user_lock(user_id: str) -> asyncio.Lock:
@@ -21,6 +29,61 @@ def _get_user_lock(user_id: str) -> asyncio.Lock:
     return lock
 
 
+def _get_conversation_lock(user_id: str, conversation_id: str) -> asyncio.Lock:
+    key = (user_id, conversation_id)
+    lock = _conversation_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _conversation_locks[key] = lock
+    return lock
+
+
+async def _prepare_generation(req: GenerateRequest):
+    """
+    Run the memory pipeline and build the LLM input for a request
+
+    Returns (memory_result, enriched_context, options)
+    """
+    # 1️⃣ Process conversation through memory system
+    memory_result = await memory_manager.process_conversation(
+        user_id=str(req.user_id),
+        conversation_id=str(req.conversation_id),
+        new_message=req.message,
+        conversation_history=req.messages,
+        max_context_tokens=3000
+    )
+
+    # 2️⃣ Get enriched context
+    enriched_context = memory_result["context"]
+
+    # 3️⃣ Add system prompt if not present
+    if not any(msg.get("role") == "system" for msg in enriched_context):
+        enriched_context.insert(0, {
+            "role": "system",
+            "content": SYSTEM_PROMPT.strip()
+        })
+
+    # 4️⃣ Sensible defaults for "smart" responses
+    options = req.options or {
+        "temperature": 0.4,
+        "top_p": 0.9,
+        "response_length": "long",
+    }
+    return memory_result, enriched_context, options
+
+
+def _build_meta(memory_result: Dict) -> Dict:
+    """Rich response metadata about the memory pipeline"""
+    return {
+        "pipeline_version": "memory_v2",
+        "memory": memory_result["metadata"],
+        "context_tokens": memory_result["metadata"]["total_tokens"],
+        "stm_enabled": True,
+        "ltm_enabled": True,
+        "smart_retrieval": memory_result["metadata"]["ltm_memories_retrieved"] > 0
+    }
+
+
 async def generate_response(req: GenerateRequest) -> GenerateResponse:
     """
     Generate AI response with full memory system
@@ -33,56 +96,167 @@ async def generate_response(req: GenerateRequest) -> GenerateResponse:
     """
 
     # Serialize requests per user to avoid API bursts/rate limits
+    conversation_lock = _get_conversation_lock(str(req.user_id), str(req.conversation_id))
     user_lock = _get_user_lock(str(req.user_id))
-    async with user_lock:
-        # 1️⃣ Process conversation through memory system
-        memory_result = await memory_manager.process_conversation(
-            user_id=str(req.user_id),
-            conversation_id=str(req.conversation_id),
-            new_message=req.message,
-            conversation_history=req.messages,
-            max_context_tokens=3000
-        )
+    async with conversation_lock, user_lock:
+        memory_result, enriched_context, options = await _prepare_generation(req)
 
-        # 2️⃣ Get enriched context
-        enriched_context = memory_result["context"]
-
-        # 3️⃣ Add system prompt if not present
-        if not any(msg.get("role") == "system" for msg in enriched_context):
-            enriched_context.insert(0, {
-                "role": "system",
-                "content": SYSTEM_PROMPT.strip()
-            })
-
-        # 4️⃣ Call LLM with sensible defaults for "smart" responses
-        options = req.options or {
-            "temperature": 0.4,
-            "top_p": 0.9,
-            "response_length": "long",
-        }
+        # 5️⃣ Call LLM
         assistant_text = await call_llm(enriched_context, options=options)
 
-        # 5️⃣ Save assistant response to memory
+        # 6️⃣ Save assistant response to memory
         await memory_manager.save_assistant_response(
             user_id=str(req.user_id),
             conversation_id=str(req.conversation_id),
             response=assistant_text
         )
 
-    # 6️⃣ Return response with rich metadata
+    # 7️⃣ Return response with rich metadata
     return GenerateResponse(
         assistant_message=assistant_text,
-        meta={
-            "pipeline_version": "memory_v2",
-            "memory": memory_result["metadata"],
-            "context_tokens": memory_result["metadata"]["total_tokens"],
-            "stm_enabled": True,
-            "ltm_enabled": True,
-            "smart_retrieval": memory_result["metadata"]["ltm_memories_retrieved"] > 0
-        }
+        meta=_build_meta(memory_result)
     )
 
 
+async def generate_response_stream(req: GenerateRequest) -> AsyncIterator[Dict]:
+    """
+    Generate AI response as a stream of events
+
+    Yields {"event": ..., "data": ...} dicts:
+    - meta: memory metadata, sent before the first token
+    - token: a chunk of assistant text
+    - done: the stream completed and the assistant turn was saved
+
+    The assistant turn is only saved once the full completion has been
+    received. If the client disconnects the generator is closed before
+    that point, so no partial turn reaches the memory store.
+    """
+    conversation_lock = _get_conversation_lock(str(req.user_id), str(req.conversation_id))
+    user_lock = _get_user_lock(str(req.user_id))
+    async with conversation_lock, user_lock:
+        memory_result, enriched_context, options = await _prepare_generation(req)
+        yield {"event": "meta", "data": _build_meta(memory_result)}
+
+        chunks = []
+        async for chunk in stream_llm(enriched_context, options=options):
+            chunks.append(chunk)
+            yield {"event": "token", "data": {"text": chunk}}
+
+        assistant_text = "".join(chunks)
+
+        # Shield the write so a disconnect racing the save can't interrupt it
+        await asyncio.shield(memory_manager.save_assistant_response(
+            user_id=str(req.user_id),
+            conversation_id=str(req.conversation_id),
+            response=assistant_text
+        ))
+
+    yield {"event": "done", "data": {"characters": len(assistant_text)}}
+
+
+def _batch_concurrency(requested: int) -> int:
+    max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+    return max(1, min(requested, max_concurrency))
+
+
+async def _generate_batch_item(req: BatchGenerateRequest, item: BatchItem) -> str:
+    """Generate one batch item, optionally through the memory system"""
+    # Batch traffic queues behind interactive requests in the rate limiter
+    options = {
+        "temperature": 0.4,
+        "top_p": 0.9,
+        "response_length": "long",
+        **(req.options or {}),
+        **(item.options or {}),
+        "priority": "batch",
+    }
+
+    if not req.use_memory:
+        context: List[Dict] = [{
+            "role": "system",
+            "content": (req.system_prompt or SYSTEM_PROMPT).strip()
+        }]
+        context.extend({"role": m.role, "content": m.content} for m in item.messages)
+        context.append({"role": "user", "content": item.message})
+        return await call_llm(context, options=options)
+
+    conversation_id = item.conversation_id if item.conversation_id is not None else item.id
+    if conversation_id is None:
+        raise ValueError("use_memory requires a conversation_id or id on each item")
+    conversation_id = str(conversation_id)
+    single = GenerateRequest(
+        user_id=req.user_id,
+        conversation_id=conversation_id,
+        message=item.message,
+        messages=item.messages,
+        options=options,
+    )
+
+    # Items (and interactive requests) on the same conversation run one
+    # at a time; across conversations only the memory reads/writes are
+    # serialized per user, the LLM calls are not
+    user_lock = _get_user_lock(str(req.user_id))
+    async with _get_conversation_lock(str(req.user_id), conversation_id):
+        async with user_lock:
+            _, enriched_context, _ = await _prepare_generation(single)
+        if req.system_prompt:
+            enriched_context.insert(0, {"role": "system", "content": req.system_prompt.strip()})
+
+        assistant_text = await call_llm(enriched_context, options=options)
+
+        async with user_lock:
+            await memory_manager.save_assistant_response(
+                user_id=str(req.user_id),
+                conversation_id=conversation_id,
+                response=assistant_text
+            )
+    return assistant_text
+
+
+async def generate_batch(req: BatchGenerateRequest) -> AsyncIterator[Dict]:
+    """
+    Generate many prompts with bounded concurrency
+
+    Yields one result dict per item in completion order, then a summary.
+    Closing the generator (client disconnect) cancels unfinished items.
+    """
+    semaphore = asyncio.Semaphore(_batch_concurrency(req.concurrency))
+    batch_started = time.perf_counter()
+
+    async def run_item(index: int, item: BatchItem) -> Dict:
+        async with semaphore:
+            started = time.perf_counter()
+            result = {"type": "result", "index": index, "id": item.id}
+            try:
+                result["assistant_message"] = await _generate_batch_item(req, item)
+                result["status"] = "ok"
+            except ModelBusyError as e:
+                result.update(status="busy", error=str(e))
+            except Exception as e:
+                result.update(status="error", error=str(e))
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+    tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(req.items)]
+    counts: Dict[str, int] = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            yield result
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    yield {
+        "type": "summary",
+        "total": len(req.items),
+        "statuses": counts,
+        "elapsed_ms": round((time.perf_counter() - batch_started) * 1000, 1),
+    }
+
+
 async def get_conversation_summary(user_id: str, conversation_id: str) -> str:
     """Get summary of a conversation"""
     return await memory_manager.get_conversation_summary(
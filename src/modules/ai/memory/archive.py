@@ -0,0 +1,118 @@
+"""
+Archive Segments - Compressed, immutable files of old conversation turns
+Written by MemoryStore compaction, read back for full-history requests
+
+A segment holds turns [start, end) of one conversation as compressed
+JSONL, named {conversation_id}.seg-{start:08d}-{end:08d}.jsonl.{zst|gz}.
+zstd is used when the optional zstandard package is installed
+(MEMORY_ARCHIVE_CODEC=zstd|gzip), optionally with a trained dictionary:
+dictionaries live in {storage}/archive_dicts/{dict_id}.zdict, and the
+one named by MEMORY_ARCHIVE_ZSTD_DICT_ID is used for new segments.
+Each zstd frame records its dictionary id, so old segments stay
+readable after switching dictionaries.
+"""
+import os
+import re
+import gzip
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SEGMENT_PATTERN = re.compile(r"^(?P<conv>.+)\.seg-(?P<start>\d{8})-(?P<end>\d{8})\.jsonl\.(?P<ext>zst|gz)$")
+DICT_DIR_NAME = "archive_dicts"
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def segment_name(conversation_id: str, start: int, end: int, ext: str) -> str:
+    return f"{conversation_id}.seg-{start:08d}-{end:08d}.jsonl.{ext}"
+
+
+def parse_segment_name(name: str) -> Optional[Tuple[str, int, int]]:
+    """(conversation_id, start, end) for a segment file name, else None"""
+    match = SEGMENT_PATTERN.match(name)
+    if not match:
+        return None
+    return match.group("conv"), int(match.group("start")), int(match.group("end"))
+
+
+class SegmentCodec:
+    """Compresses and decompresses segment payloads"""
+
+    def __init__(self, storage_path: Path):
+        self.dict_dir = Path(storage_path) / DICT_DIR_NAME
+        self._dicts: Dict[int, object] = {}
+
+        # Default: zstd when installed, else gzip
+        codec = (os.getenv("MEMORY_ARCHIVE_CODEC") or "").strip().lower()
+        self.level = int(os.getenv("MEMORY_ARCHIVE_LEVEL", "0")) or None
+        if codec in ("", "zstd") and _zstd() is None:
+            if codec:
+                print("MEMORY_ARCHIVE_CODEC=zstd unavailable (zstandard not installed); using gzip")
+            codec = "gzip"
+        elif not codec:
+            codec = "zstd"
+        self.codec = "zstd" if codec == "zstd" else "gzip"
+        self.ext = "zst" if self.codec == "zstd" else "gz"
+
+        self.dict_id = int(os.getenv("MEMORY_ARCHIVE_ZSTD_DICT_ID", "0"))
+
+    def _load_dict(self, dict_id: int):
+        zstd_dict = self._dicts.get(dict_id)
+        if zstd_dict is None:
+            data = (self.dict_dir / f"{dict_id}.zdict").read_bytes()
+            zstd_dict = _zstd().ZstdCompressionDict(data)
+            self._dicts[dict_id] = zstd_dict
+        return zstd_dict
+
+    def compress(self, payload: bytes) -> bytes:
+        if self.codec == "gzip":
+            return gzip.compress(payload, compresslevel=self.level or 6)
+
+        zstandard = _zstd()
+        kwargs = {"level": self.level or 10}
+        if self.dict_id:
+            kwargs["dict_data"] = self._load_dict(self.dict_id)
+        return zstandard.ZstdCompressor(**kwargs).compress(payload)
+
+    def decompress(self, data: bytes, ext: str) -> bytes:
+        if ext == "gz":
+            return gzip.decompress(data)
+
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst archive segments")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        kwargs = {"dict_data": self._load_dict(dict_id)} if dict_id else {}
+        return zstandard.ZstdDecompressor(**kwargs).decompress(data)
+
+    def encode_turns(self, turns: List[Dict]) -> bytes:
+        payload = b"".join(json.dumps(turn).encode("utf-8") + b"\n" for turn in turns)
+        return self.compress(payload)
+
+    def decode_turns(self, data: bytes, ext: str) -> List[Dict]:
+        return [json.loads(line) for line in self.decompress(data, ext).splitlines() if line.strip()]
+
+
+def train_dictionary(storage_path: Path, samples: List[bytes], size: int = 64 * 1024) -> int:
+    """
+    Train a zstd dictionary on sample turn payloads and save it
+
+    Returns the dictionary id; set MEMORY_ARCHIVE_ZSTD_DICT_ID to it to
+    compress new segments with it.
+    """
+    zstandard = _zstd()
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to train a dictionary")
+
+    trained = zstandard.train_dictionary(size, samples)
+    dict_dir = Path(storage_path) / DICT_DIR_NAME
+    dict_dir.mkdir(parents=True, exist_ok=True)
+    (dict_dir / f"{trained.dict_id()}.zdict").write_bytes(trained.as_bytes())
+    return trained.dict_id()
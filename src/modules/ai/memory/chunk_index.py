@@ -0,0 +1,368 @@
+"""
+Chunk Index - Embedded windows of consecutive conversation turns
+Filled in the background as turns are saved, searched by the retriever
+
+Turns are grouped into chunks of MEMORY_CHUNK_TURNS (default 2, one
+user/assistant exchange) aligned at multiples of the chunk size, so a
+chunk is keyed by (user, conversation, turn range). Each user's chunks
+are searched through one in-memory VectorIndex, but saved one file per
+conversation under {storage}/vector_index/chunks/ab/{user}/, so workers
+indexing different conversations of a user don't overwrite each other's
+chunks, and clearing a conversation deletes its file. A trailing
+partial chunk is replaced once the rest of its turns arrive.
+"""
+import os
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from shared.deadline import spawn_detached
+from shared.lru_cache import BoundedLRU
+
+from modules.ai.memory.io_pool import run_io
+from modules.ai.memory.vector_index import VectorIndex, _pack_strings, _unpack_strings
+
+# A conversation's chunks as saved: (ids, texts, unit vectors), None once cleared
+ConversationState = Optional[Tuple[List[str], List[str], np.ndarray]]
+
+
+def chunk_index_enabled() -> bool:
+    return os.getenv("MEMORY_CHUNK_INDEX", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def chunk_id(conversation_id: str, start: int, end: int) -> str:
+    return f"{conversation_id}:{start}-{end}"
+
+
+def parse_chunk_id(item_id: str) -> Tuple[str, int, int]:
+    """(conversation_id, start, end) of a chunk id"""
+    conversation_id, turn_range = item_id.rsplit(":", 1)
+    start, end = turn_range.split("-")
+    return conversation_id, int(start), int(end)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+class ChunkIndex:
+    """
+    Per-user turn-chunk vectors plus the chunk layout of each conversation
+
+    Unlike summary indexes these can't be rebuilt from the store without
+    re-embedding every turn. Users share the MEMORY_CHUNK_INDEX_MAX_BYTES
+    budget (LRU); an evicted user's changed conversations are written
+    out first, and the index is loaded from disk again on next use.
+    Changed conversations are saved every MEMORY_VECTOR_INDEX_SAVE_EVERY
+    changes, and at shutdown.
+
+    Disk reads and writes of one user run one after another, and a load
+    applies snapshots still waiting to be written over what it read.
+    """
+
+    def __init__(self, persist_dir: Optional[Path] = None):
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.chunk_turns = max(1, int(os.getenv("MEMORY_CHUNK_TURNS", "2")))
+        self.max_chars = int(os.getenv("MEMORY_CHUNK_MAX_CHARS", "8000"))
+        self.save_every = int(os.getenv("MEMORY_VECTOR_INDEX_SAVE_EVERY", "32"))
+        # Saved per conversation below, not through VectorIndex's per-user files
+        self.vectors = VectorIndex(
+            None, max_bytes=int(os.getenv("MEMORY_CHUNK_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+        )
+        self.vectors.evict_listeners.append(self._on_evicted)
+        # user_id -> conversation_id -> chunk start -> chunk id (loaded users only)
+        self._layout: Dict[str, Dict[str, Dict[int, str]]] = {}
+        # Bumped when a conversation is cleared, so in-flight indexing
+        # of its old turns is discarded
+        self._epochs: Dict[Tuple[str, str], int] = {}
+        # Disk loads in progress (awaited by every caller)
+        self._loads: Dict[str, asyncio.Task] = {}
+        # Users found to have nothing saved, so their first chunk starts a new index
+        self._empty = BoundedLRU(max_entries=10000)
+        # Changes per conversation not saved yet
+        self._dirty: Dict[str, Dict[str, int]] = {}
+        # Snapshots whose write hasn't finished
+        self._pending: Dict[Tuple[str, str], ConversationState] = {}
+        # Last disk read or write started per user
+        self._disk_ops: Dict[str, asyncio.Task] = {}
+        self.saves = 0
+        self.loads = 0
+
+    async def ensure_loaded(self, user_id: str):
+        """Load the user's saved chunks on first use after a restart or eviction"""
+        if self.vectors.get(user_id) is not None or user_id in self._empty:
+            return
+        task = self._loads.get(user_id)
+        if task is None:
+            task = self._disk_op(user_id, lambda: self._load(user_id), "load")
+            self._loads[user_id] = task
+            task.add_done_callback(lambda _: self._loads.pop(user_id, None))
+        await asyncio.shield(task)
+
+    async def _load(self, user_id: str):
+        saved = await run_io(self._load_sync, user_id)
+        if self.vectors.get(user_id) is not None:
+            return
+
+        for (pending_user, conversation_id), state in list(self._pending.items()):
+            if pending_user == user_id:
+                # Moved to the end: newer than anything on disk
+                saved.pop(conversation_id, None)
+                saved[conversation_id] = state
+        saved = {conversation_id: state for conversation_id, state in saved.items() if state and state[0]}
+        if not saved:
+            self._empty.set(user_id, True)
+            return
+
+        # After an embedding model change, keep the newest conversation's dimension
+        dim = list(saved.values())[-1][2].shape[1]
+        vectors = self.vectors.create(user_id, dim)
+        layout = self._layout[user_id] = {}
+        for conversation_id, (ids, texts, matrix) in saved.items():
+            if matrix.shape[1] != dim:
+                continue
+            starts = layout.setdefault(conversation_id, {})
+            for item_id, text, vector in zip(ids, texts, matrix):
+                if vectors.upsert(item_id, vector, text):
+                    starts[parse_chunk_id(item_id)[1]] = item_id
+        self.vectors.changed(user_id, 0)
+
+    def epoch(self, user_id: str, conversation_id: str) -> int:
+        return self._epochs.get((user_id, conversation_id), 0)
+
+    def next_turn(self, user_id: str, conversation_id: str) -> int:
+        """First turn not yet covered by a complete chunk"""
+        starts = self._layout.get(user_id, {}).get(conversation_id)
+        if not starts:
+            return 0
+        last = max(starts)
+        _, _, end = parse_chunk_id(starts[last])
+        return end if end - last >= self.chunk_turns else last
+
+    def make_chunks(self, start: int, turns: List[Dict]) -> List[Tuple[int, int, str]]:
+        """Split turns (the first at position `start`) into (start, end, text) chunks"""
+        chunks = []
+        for offset in range(0, len(turns), self.chunk_turns):
+            part = turns[offset:offset + self.chunk_turns]
+            text = "\n".join(f"{turn.get('role', 'user')}: {turn.get('content', '')}" for turn in part)
+            chunks.append((start + offset, start + offset + len(part), text[:self.max_chars]))
+        return chunks
+
+    def add(self, user_id: str, conversation_id: str, start: int, end: int, vector, text: str, epoch: int) -> bool:
+        """
+        Index one chunk; False if it was dropped (conversation cleared, or
+        the user's index evicted, since the caller's ensure_loaded)
+        """
+        if epoch != self.epoch(user_id, conversation_id):
+            return False
+
+        vectors = self.vectors.get(user_id)
+        if vectors is None and self.persist_dir is not None and user_id not in self._empty:
+            return False
+        if vectors is None or vectors.dim != len(vector):
+            # First chunk, or the embedding model changed
+            vectors = self.vectors.create(user_id, len(vector))
+            self._layout[user_id] = {}
+            self._empty.pop(user_id)
+
+        starts = self._layout.setdefault(user_id, {}).setdefault(conversation_id, {})
+        item_id = chunk_id(conversation_id, start, end)
+        previous = starts.get(start)
+        if previous is not None and previous != item_id:
+            vectors.remove(previous)
+        if not vectors.upsert(item_id, vector, text):
+            return False
+        starts[start] = item_id
+        self.vectors.changed(user_id)
+        self._mark_dirty(user_id, conversation_id)
+        return True
+
+    def forget(self, user_id: str, conversation_id: str):
+        """Drop a cleared conversation's chunks and delete its saved file"""
+        key = (user_id, conversation_id)
+        self._epochs[key] = self._epochs.get(key, 0) + 1
+        starts = self._layout.get(user_id, {}).pop(conversation_id, None)
+        vectors = self.vectors.get(user_id)
+        if starts and vectors is not None:
+            for item_id in starts.values():
+                vectors.remove(item_id)
+            self.vectors.changed(user_id, len(starts))
+        # Saved right away, so the cleared turns don't stay on disk
+        self._mark_dirty(user_id, conversation_id, self.save_every)
+
+    def search(
+        self,
+        user_id: str,
+        query,
+        k: int,
+        conversation_id: Optional[str] = None,
+        exclude_conversation: Optional[str] = None
+    ) -> List[Tuple[str, str, float]]:
+        """
+        Top-k chunks: [(chunk_id, text, similarity)]
+
+        With conversation_id, only that conversation's chunks are scored
+        (exactly); exclude_conversation leaves one conversation out.
+        """
+        vectors = self.vectors.get(user_id)
+        if vectors is None:
+            return []
+        self.vectors.searches += 1
+        layout = self._layout.get(user_id, {})
+        if conversation_id is not None:
+            return vectors.search_items(query, list(layout.get(conversation_id, {}).values()), k)
+        excluded = list(layout.get(exclude_conversation, {}).values()) if exclude_conversation else None
+        return vectors.search(query, k, exclude=excluded)
+
+    # Persistence
+
+    def _user_dir(self, user_id: str) -> Path:
+        digest = _digest(user_id)
+        return self.persist_dir / digest[:2] / digest
+
+    def _mark_dirty(self, user_id: str, conversation_id: str, count: int = 1):
+        if self.persist_dir is None:
+            return
+        conversations = self._dirty.setdefault(user_id, {})
+        conversations[conversation_id] = conversations.get(conversation_id, 0) + count
+        if sum(conversations.values()) >= self.save_every:
+            self._save(user_id)
+
+    def _on_evicted(self, user_id: str, vectors):
+        """VectorIndex evict listener: write out what changed, then drop the layout"""
+        self._save(user_id, vectors)
+        self._layout.pop(user_id, None)
+
+    def _save(self, user_id: str, vectors=None):
+        """Snapshot the user's changed conversations and write them in the background"""
+        conversations = self._dirty.pop(user_id, None)
+        if not conversations:
+            return
+        if vectors is None:
+            vectors = self.vectors.get(user_id)
+        layout = self._layout.get(user_id, {})
+
+        states: Dict[str, ConversationState] = {}
+        for conversation_id in conversations:
+            item_ids = list(layout.get(conversation_id, {}).values())
+            state = vectors.export_items(item_ids) if vectors is not None and item_ids else None
+            states[conversation_id] = state
+            self._pending[(user_id, conversation_id)] = state
+        self._disk_op(user_id, lambda: self._write(user_id, states), "save")
+
+    def _disk_op(self, user_id: str, make_coro: Callable[[], Awaitable], name: str) -> asyncio.Task:
+        """Start a load or write of a user's files once the previous one is done"""
+        previous = self._disk_ops.get(user_id)
+
+        async def run():
+            if previous is not None:
+                await asyncio.wait([previous])
+            await make_coro()
+
+        task = spawn_detached(run())
+        self._disk_ops[user_id] = task
+
+        def done(task: asyncio.Task):
+            if self._disk_ops.get(user_id) is task:
+                del self._disk_ops[user_id]
+            if not task.cancelled() and task.exception() is not None:
+                print(f"Chunk index {name} failed for user {user_id}: {task.exception()}")
+
+        task.add_done_callback(done)
+        return task
+
+    async def _write(self, user_id: str, states: Dict[str, ConversationState]):
+        try:
+            await run_io(self._write_sync, user_id, states)
+        finally:
+            for conversation_id, state in states.items():
+                # Unless a newer snapshot replaced ours meanwhile
+                if self._pending.get((user_id, conversation_id), False) is state:
+                    del self._pending[(user_id, conversation_id)]
+
+    def _write_sync(self, user_id: str, states: Dict[str, ConversationState]):
+        user_dir = self._user_dir(user_id)
+        for conversation_id, state in states.items():
+            path = user_dir / f"{_digest(conversation_id)}.npz"
+            if state is None:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                continue
+            ids, texts, matrix = state
+            user_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    conversation=_pack_strings([conversation_id]),
+                    ids=_pack_strings(ids),
+                    texts=_pack_strings(texts),
+                    matrix=matrix,
+                )
+            os.replace(tmp_path, path)
+        self.saves += 1
+
+    def _load_sync(self, user_id: str) -> Dict[str, ConversationState]:
+        """Read a user's saved conversations, oldest file first (blocking)"""
+        saved: Dict[str, ConversationState] = {}
+        if self.persist_dir is None:
+            return saved
+
+        # Whole-user chunk file from before chunks were saved per conversation.
+        # Chunks are derived data: conversations are re-chunked as they get new turns.
+        digest = _digest(user_id)
+        legacy = self.persist_dir / digest[:2] / f"{digest}.npz"
+        if legacy.exists():
+            print(f"Removing superseded chunk file {legacy}")
+            try:
+                legacy.unlink()
+            except FileNotFoundError:
+                pass
+
+        user_dir = self._user_dir(user_id)
+        if not user_dir.is_dir():
+            return saved
+        files = []
+        for path in user_dir.glob("*.npz"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Deleted by another worker meanwhile
+                continue
+        for _, path in sorted(files):
+            try:
+                with np.load(path) as data:
+                    conversation_id = _unpack_strings(data["conversation"])[0]
+                    saved[conversation_id] = (
+                        _unpack_strings(data["ids"]),
+                        _unpack_strings(data["texts"]),
+                        data["matrix"],
+                    )
+            except Exception as e:
+                print(f"Ignoring unreadable chunk file {path}: {e}")
+        self.loads += 1
+        return saved
+
+    def dirty_users(self) -> List[str]:
+        return list(self._dirty)
+
+    async def close(self):
+        """Save every user's changed conversations and wait for the writes (app shutdown)"""
+        for user_id in self.dirty_users():
+            self._save(user_id)
+        if self._disk_ops:
+            await asyncio.gather(*list(self._disk_ops.values()), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "chunk_turns": self.chunk_turns,
+            "conversations": sum(len(convs) for convs in self._layout.values()),
+            "unsaved_users": len(self._dirty),
+            "pending_writes": len(self._pending),
+            **self.vectors.stats(),
+            "saves": self.saves,
+            "loads": self.loads,
+        }
@@ -4,6 +4,7 @@ Ensures optimal use of available context space
 """
 from typing import List, Dict, Optional
 from modules.ai.ai_schemas import Message
+from modules.ai.memory.tokenizer import TokenCounter, get_token_counter
 
 
 class ContextManager:
@@ -14,17 +15,16 @@ class ContextManager:
     - Dynamic context building
     """
 
-    def __init__(self, avg_tokens_per_char: float = 0.3):
+    def __init__(self, token_counter: Optional[TokenCounter] = None):
         """
-        avg_tokens_per_char: Rough estimate for token counting
-        (actual tokenization would use tiktoken, but this is good enough)
+        token_counter: Tokenizer-backed counter with per-message memoization
+        (defaults to the shared instance, see memory/tokenizer.py)
         """
-        self.avg_tokens_per_char = avg_tokens_per_char
+        self.token_counter = token_counter or get_token_counter()
 
     def count_tokens(self, messages: List[Dict]) -> int:
-        """Estimate token count for messages"""
-        total_chars = sum(len(msg.get("content", "")) for msg in messages)
-        return int(total_chars * self.avg_tokens_per_char)
+        """Count tokens for messages (cached per message content)"""
+        return self.token_counter.count_messages(messages)
 
     def should_consolidate(
         self,
@@ -0,0 +1,172 @@
+"""
+Embedding Batcher - Micro-batches concurrent embedding requests
+Texts queued within a short window share one batchEmbedContents call
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from shared.deadline import spawn_detached
+
+# Recent batch sizes / queue waits kept for percentiles
+_SAMPLES = 1024
+
+# One batch call: texts in, one vector per text out (in order)
+BatchFetch = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class EmbeddingBatchError(Exception):
+    """An item failed inside an otherwise successful batch"""
+
+
+class EmbeddingBatcher:
+    """
+    Collects embed requests and sends them upstream in batches
+
+    - A batch is sent when MEMORY_EMBED_BATCH_MAX texts are queued, or
+      MEMORY_EMBED_BATCH_WINDOW_MS after the first one was queued
+    - Identical texts within a batch are sent once
+    - Per-item errors (a missing or empty vector) fail only that item;
+      a batch rejected as a whole with a 400 is retried one text per
+      call so a single bad input cannot fail its neighbours
+    - Other batch errors (429, 5xx, network) go to every caller in it
+    - Callers that gave up (cancelled) before the send are dropped
+    """
+
+    def __init__(self, fetch_batch: BatchFetch, max_batch: int = None, window_ms: float = None):
+        self.fetch_batch = fetch_batch
+        # Gemini accepts at most 100 requests per batchEmbedContents call
+        self.max_batch = max(1, min(100, max_batch or int(os.getenv("MEMORY_EMBED_BATCH_MAX", "100"))))
+        if window_ms is None:
+            window_ms = float(os.getenv("MEMORY_EMBED_BATCH_WINDOW_MS", "5"))
+        self.window = max(0.0, window_ms) / 1000
+
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = set()
+
+        self.batches = 0
+        self.items = 0
+        self.deduplicated = 0
+        self.batch_errors = 0
+        self.item_errors = 0
+        self.split_retries = 0
+        self._batch_sizes = deque(maxlen=_SAMPLES)
+        self._wait_ms = deque(maxlen=_SAMPLES)
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue one text and wait for its vector"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            task = spawn_detached(self._send(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        now = time.perf_counter()
+        waiting: Dict[str, List[asyncio.Future]] = {}
+        for text, future, queued_at in batch:
+            if future.done():
+                continue
+            self._wait_ms.append((now - queued_at) * 1000)
+            waiting.setdefault(text, []).append(future)
+        if not waiting:
+            return
+
+        texts = list(waiting)
+        self.batches += 1
+        self.items += len(texts)
+        self.deduplicated += sum(len(f) for f in waiting.values()) - len(texts)
+        self._batch_sizes.append(len(texts))
+
+        try:
+            vectors = await self.fetch_batch(texts)
+        except Exception as e:
+            if len(texts) > 1 and getattr(getattr(e, "response", None), "status_code", None) == 400:
+                self.split_retries += 1
+                await asyncio.gather(*[self._send_one(t, waiting[t]) for t in texts])
+                return
+            self.batch_errors += 1
+            for futures in waiting.values():
+                _fail(futures, e)
+            return
+
+        for i, text in enumerate(texts):
+            vector = vectors[i] if i < len(vectors) else None
+            if vector:
+                _resolve(waiting[text], vector)
+            else:
+                self.item_errors += 1
+                _fail(waiting[text], EmbeddingBatchError(f"no embedding returned for item {i} of {len(texts)}"))
+
+    async def _send_one(self, text: str, futures: List[asyncio.Future]):
+        try:
+            vectors = await self.fetch_batch([text])
+        except Exception as e:
+            self.item_errors += 1
+            _fail(futures, e)
+            return
+        if vectors and vectors[0]:
+            _resolve(futures, vectors[0])
+        else:
+            self.item_errors += 1
+            _fail(futures, EmbeddingBatchError("no embedding returned"))
+
+    async def close(self):
+        """Send anything still queued and wait for in-flight batches (app shutdown)"""
+        self._flush()
+        if self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        sizes = list(self._batch_sizes)
+        return {
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000,
+            "queued": len(self._pending),
+            "in_flight_batches": len(self._in_flight),
+            "batches": self.batches,
+            "items": self.items,
+            "deduplicated": self.deduplicated,
+            "batch_errors": self.batch_errors,
+            "item_errors": self.item_errors,
+            "split_retries": self.split_retries,
+            "batch_size_mean": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "batch_size_p50": _percentile(sizes, 50),
+            "batch_size_max": max(sizes) if sizes else 0,
+            "queue_wait_ms_p50": _percentile(self._wait_ms, 50),
+            "queue_wait_ms_p99": _percentile(self._wait_ms, 99),
+        }
+
+
+def _resolve(futures: List[asyncio.Future], vector: List[float]):
+    for future in futures:
+        if not future.done():
+            future.set_result(vector)
+
+
+def _fail(futures: List[asyncio.Future], error: Exception):
+    for future in futures:
+        if not future.done():
+            future.set_exception(error)
+
+
+def _percentile(samples, p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
@@ -0,0 +1,113 @@
+"""
+IO Pool - Bounded thread pool for blocking memory-store I/O
+Keeps file reads/writes off the asyncio event loop
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Recent latencies kept for percentiles
+_LATENCY_SAMPLES = 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "running": 0,
+    "max_queue_depth": 0,
+}
+_wait_ms = deque(maxlen=_LATENCY_SAMPLES)
+_io_ms = deque(maxlen=_LATENCY_SAMPLES)
+
+
+def _io_threads() -> int:
+    """MEMORY_IO_THREADS (0 = run I/O inline on the event loop, the old behavior)"""
+    return int(os.getenv("MEMORY_IO_THREADS", "8"))
+
+
+def _get_executor() -> Optional[ThreadPoolExecutor]:
+    global _executor
+    threads = _io_threads()
+    if threads <= 0:
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="memory-io")
+    return _executor
+
+
+def _queue_depth() -> int:
+    return _stats["submitted"] - _stats["completed"] - _stats["failed"] - _stats["running"]
+
+
+def _timed(fn: Callable[..., T], submitted_at: float, *args) -> T:
+    started = time.perf_counter()
+    with _stats_lock:
+        _stats["running"] += 1
+        _wait_ms.append((started - submitted_at) * 1000)
+    ok = False
+    try:
+        result = fn(*args)
+        ok = True
+        return result
+    finally:
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["completed" if ok else "failed"] += 1
+            _io_ms.append((time.perf_counter() - started) * 1000)
+
+
+async def run_io(fn: Callable[..., T], *args) -> T:
+    """Run a blocking I/O function on the memory I/O pool"""
+    executor = _get_executor()
+    submitted_at = time.perf_counter()
+    with _stats_lock:
+        _stats["submitted"] += 1
+        _stats["max_queue_depth"] = max(_stats["max_queue_depth"], _queue_depth())
+
+    if executor is None:
+        return _timed(fn, submitted_at, *args)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, _timed, fn, submitted_at, *args
+    )
+
+
+def shutdown_io_pool():
+    """Wait for queued writes to finish and stop the pool (app shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    _executor = None
+
+
+def _percentile(samples, p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+
+
+def get_io_stats() -> Dict:
+    """Memory I/O pool statistics for monitoring"""
+    with _stats_lock:
+        wait_ms = list(_wait_ms)
+        io_ms = list(_io_ms)
+        stats = dict(_stats)
+        queue_depth = _queue_depth()
+
+    return {
+        "threads": max(0, _io_threads()),
+        "queue_depth": queue_depth,
+        **stats,
+        "wait_ms_p50": _percentile(wait_ms, 50),
+        "wait_ms_p99": _percentile(wait_ms, 99),
+        "io_ms_p50": _percentile(io_ms, 50),
+        "io_ms_p99": _percentile(io_ms, 99),
+    }
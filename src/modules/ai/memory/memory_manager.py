@@ -2,9 +2,12 @@
 Memory Manager - Orchestrates the entire AI memory system
 Handles STM, LTM, retrieval, and consolidation
 """
+import os
+import asyncio
 from typing import List, Dict, Optional
+from shared import deadline
 from modules.ai.ai_schemas import Message
-from modules.ai.memory.memory_store import MemoryStore
+from modules.ai.memory.memory_store import create_memory_store
 from modules.ai.memory.context_manager import ContextManager
 from modules.ai.memory.summarizer import Summarizer
 from modules.ai.memory.retriever import MemoryRetriever
@@ -22,10 +25,80 @@ class MemoryManager:
     """
 
     def __init__(self):
-        self.store = MemoryStore()
         self.context_manager = ContextManager()
         self.summarizer = Summarizer()
-        self.retriever = MemoryRetriever(self.store)
+        self.set_store(create_memory_store())
+
+        # Deadline budgets (seconds): optional stages are skipped when less
+        # than their minimum is left, and never eat into the reserve kept
+        # for the final LLM call
+        self.summary_min_budget = float(os.getenv("MEMORY_SUMMARY_MIN_BUDGET_SECONDS", "25"))
+        self.ltm_min_budget = float(os.getenv("MEMORY_LTM_MIN_BUDGET_SECONDS", "12"))
+        self.generation_reserve = float(os.getenv("MEMORY_GENERATION_RESERVE_SECONDS", "8"))
+
+        # Follow-up work started after a consolidation, keyed by
+        # (job, user_id, conversation_id); at most one of each in flight
+        self._background: Dict[tuple, asyncio.Task] = {}
+
+    def set_store(self, store):
+        """
+        Use `store` for memory (e.g. a temporary one in benchmarks)
+
+        Call before serving requests: the retriever is rebuilt for the new
+        store, so its vector indexes are kept next to that store's data.
+        """
+        self.store = store
+        self.retriever = MemoryRetriever(store)
+        # Turns are chunked and embedded for retrieval as they are saved
+        store.add_turn_listener(self.retriever.on_turns_saved)
+
+    def _spawn(self, job: str, user_id: str, conversation_id: str, make_coro):
+        """Run a follow-up job off the request path (skipped if already running)"""
+        key = (job, user_id, conversation_id)
+        if key in self._background:
+            return
+
+        def done(task: asyncio.Task):
+            self._background.pop(key, None)
+            if not task.cancelled() and task.exception() is not None:
+                print(f"{job} failed for {user_id}/{conversation_id}: {task.exception()}")
+
+        task = deadline.spawn_detached(make_coro())
+        self._background[key] = task
+        task.add_done_callback(done)
+
+    def _after_summary(self, user_id: str, conversation_id: str, summary: str):
+        """Embed the new summary, and archive the turns it covers"""
+        self._spawn(
+            "Summary embedding", user_id, conversation_id,
+            lambda: self.retriever.index_summary(user_id, conversation_id, summary)
+        )
+        compact = getattr(self.store, "compact_conversation", None)
+        if compact is not None:
+            self._spawn("Compaction", user_id, conversation_id, lambda: compact(user_id, conversation_id))
+
+    async def _within_budget(self, stage: str, min_budget: float, coro, fallback, degraded: List[str]):
+        """
+        Run an optional stage if the request deadline allows it
+
+        Returns `fallback` (and records the stage as degraded) when the
+        budget is too low to start, or when the stage would run into the
+        time reserved for generation.
+        """
+        if not deadline.has_budget(min_budget):
+            coro.close()
+            degraded.append(stage)
+            return fallback
+
+        left = deadline.remaining()
+        if left is None:
+            return await coro
+
+        try:
+            return await asyncio.wait_for(coro, max(0.0, left - self.generation_reserve))
+        except (asyncio.TimeoutError, deadline.DeadlineExceeded):
+            degraded.append(stage)
+            return fallback
 
     async def process_conversation(
         self,
@@ -56,19 +129,37 @@ class MemoryManager:
         # 1. Load or create conversation state
         conv_state = await self.store.get_conversation_state(user_id, conversation_id)
 
+        # Stages skipped because the request deadline was too close
+        degraded: List[str] = []
+
         # 2. Check if we need to consolidate memory (context too large)
+        #    (deferred to a later turn if the deadline is tight)
         if self.context_manager.should_consolidate(effective_history):
-            summary = await self.summarizer.summarize_conversation(effective_history)
-            await self.store.save_summary(user_id, conversation_id, summary)
-            conv_state["summary"] = summary
-            conv_state["consolidation_count"] = conv_state.get("consolidation_count", 0) + 1
-
-        # 3. Retrieve relevant memories from LTM
-        relevant_memories = await self.retriever.find_relevant_context(
-            user_id=user_id,
-            conversation_id=conversation_id,
-            current_query=new_message,
-            max_memories=3
+            summary = await self._within_budget(
+                "consolidation",
+                self.summary_min_budget,
+                self.summarizer.summarize_conversation(effective_history),
+                None,
+                degraded
+            )
+            if summary:
+                await self.store.save_summary(user_id, conversation_id, summary)
+                conv_state["summary"] = summary
+                conv_state["consolidation_count"] = conv_state.get("consolidation_count", 0) + 1
+                self._after_summary(user_id, conversation_id, summary)
+
+        # 3. Retrieve relevant memories from LTM (dropped first under time pressure)
+        relevant_memories = await self._within_budget(
+            "ltm_retrieval",
+            self.ltm_min_budget,
+            self.retriever.find_relevant_context(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                current_query=new_message,
+                max_memories=3
+            ),
+            [],
+            degraded
         )
 
         # 4. Build optimal context within token limits
@@ -97,7 +188,8 @@ class MemoryManager:
                 "ltm_memories_retrieved": len(relevant_memories),
                 "has_summary": bool(conv_state.get("summary")),
                 "consolidation_count": conv_state.get("consolidation_count", 0),
-                "total_tokens": self.context_manager.count_tokens(context)
+                "total_tokens": self.context_manager.count_tokens(context),
+                "degraded": degraded
             }
         }
 
@@ -124,6 +216,13 @@ class MemoryManager:
         state = await self.store.get_conversation_state(user_id, conversation_id)
         return state.get("summary")
 
+    async def close(self):
+        """Finish background jobs and flush buffered memory writes (app shutdown)"""
+        if self._background:
+            await asyncio.gather(*self._background.values(), return_exceptions=True)
+        await self.retriever.close()
+        await self.store.close()
+
     async def clear_conversation_memory(
         self,
         user_id: str,
@@ -131,3 +230,20 @@ class MemoryManager:
     ):
         """Clear all memory for a conversation"""
         await self.store.clear_conversation(user_id, conversation_id)
+        self.retriever.forget_conversation(user_id, conversation_id)
+
+
+_memory_manager: Optional[MemoryManager] = None
+
+
+def get_memory_manager() -> MemoryManager:
+    """
+    Get or create the process-wide memory manager
+
+    Shared by /ai/generate and the /ai/memory API so both see the same
+    store (and the same write-behind buffer, if enabled).
+    """
+    global _memory_manager
+    if _memory_manager is None:
+        _memory_manager = MemoryManager()
+    return _memory_manager
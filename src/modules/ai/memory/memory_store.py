@@ -1,13 +1,158 @@
 """
 Memory Store - Persistent storage for conversation memory
 Uses JSON files for simplicity (can be swapped with Redis/PostgreSQL)
+
+Conversation turns are an append-only JSONL log per conversation
+({conversation_id}.jsonl) with a small {conversation_id}.meta.json side
+record, so a write costs the same on turn 2 as on turn 200. Legacy
+{conversation_id}.json files are migrated on first access.
+
+Each user directory also holds a _manifest.json index
+(conversation_id -> turn_count, last_updated, has_summary, summary_hash),
+so listing a user's conversations is one small read. Writes append the changed entry
+to _manifest.log instead of rewriting the index; the log is replayed on
+load and folded back into _manifest.json once it outgrows the index.
+Both are rebuilt from the per-conversation files if missing or unreadable.
+
+User directories are hash-sharded two levels deep
+(conversations/ab/cd/{user_id}/, same under summaries/) and created on
+first write only. Users still in the old flat layout
+(conversations/{user_id}/) are moved over on first access, or all at
+once with scripts/migrate_memory_layout.py, which is safe to run while
+the service is up.
+
+Compaction moves old turns (past MEMORY_COMPACT_MAX_AGE_DAYS, or
+covered by the last summary) out of the live log into compressed,
+immutable segment files (archive.py), leaving only the hot tail live.
+The live log then starts with an {"archived_turns": N} header line,
+and full-history reads stitch segments [0, N) back in front of it.
+
+Summary embeddings are stored under embeddings/{model}/ab/{hash}.f32
+as raw float32, keyed by content hash and embedding model, so every
+worker and every restart reuses them instead of calling the API again.
+
+Blocking file I/O runs on a bounded thread pool (io_pool.py); the
+async methods only await it. Parsed meta records, manifests, summaries
+and the last MEMORY_CACHE_TAIL_TURNS turns of each conversation are
+kept in a byte-bounded LRU, updated on every write, so hot
+conversations are served without touching the disk.
 """
 import os
+import re
+import glob
 import json
-import asyncio
-from typing import List, Dict, Optional
-from datetime import datetime
+import zlib
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional, Set, Tuple
+from datetime import datetime, timedelta
 from pathlib import Path
+from shared.lru_cache import BoundedLRU
+from modules.ai.memory.io_pool import run_io
+from modules.ai.memory.archive import SegmentCodec, parse_segment_name, segment_name
+from modules.ai.memory.vectors import content_hash, pack_float32, unpack_float32
+from modules.ai.memory.sqlite_store import SQLiteMemoryStore
+from modules.ai.memory.write_behind import WriteBehindStore, write_behind_enabled
+
+META_SUFFIX = ".meta.json"
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_LOG_NAME = "_manifest.log"
+
+# File I/O runs on the memory I/O pool, so writers are serialized with
+# fixed sets of striped locks. Writes take the user lock (guards the
+# manifest) and then the conversation lock, never the other way round;
+# reads only take the conversation lock.
+_LOCK_STRIPES = [threading.RLock() for _ in range(64)]
+_USER_LOCK_STRIPES = [threading.RLock() for _ in range(64)]
+
+
+def _conversation_lock(user_id: str, conversation_id: str) -> threading.RLock:
+    key = f"{user_id}/{conversation_id}".encode("utf-8")
+    return _LOCK_STRIPES[zlib.crc32(key) % len(_LOCK_STRIPES)]
+
+
+def _user_lock(user_id: str) -> threading.RLock:
+    key = str(user_id).encode("utf-8")
+    return _USER_LOCK_STRIPES[zlib.crc32(key) % len(_USER_LOCK_STRIPES)]
+
+
+@lru_cache(maxsize=65536)
+def _shard_dir(root: Path, user_id: str) -> Path:
+    """{root}/ab/cd/{user_id}, where abcd is the start of sha1(user_id)"""
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    return root / digest[:2] / digest[2:4] / user_id
+
+
+_SHARD_NAME = re.compile(r"^[0-9a-f]{2}$")
+
+
+def _find_flat_user_dirs(root: Path) -> Set[str]:
+    """
+    Names of user directories still in the flat layout under `root`
+
+    Shard directories only ever contain directories; a two-hex-character
+    directory holding files is a flat user directory with a short id.
+    """
+    users = set()
+    if not root.exists():
+        return users
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        if not _SHARD_NAME.match(entry.name):
+            users.add(entry.name)
+        elif any(not child.is_dir() for child in os.scandir(entry.path)):
+            users.add(entry.name)
+    return users
+
+
+_MISSING = object()
+
+# Rough per-turn overhead (dict, role, timestamp) when sizing cached tails
+_TURN_OVERHEAD_BYTES = 120
+
+
+def _turns_size(turns: List[Dict]) -> int:
+    return sum(len(turn.get("content", "")) + _TURN_OVERHEAD_BYTES for turn in turns)
+
+
+class _StoreCache:
+    """
+    Thread-safe read-through cache for parsed store files
+
+    Lookups happen on the I/O pool threads. Misses are filled while
+    holding the same conversation/user lock that writers hold, so a
+    slow reader can never put back a value older than a write.
+    """
+
+    def __init__(self):
+        max_bytes = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.enabled = max_bytes > 0
+        self._lru = BoundedLRU(
+            max_entries=int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "20000")),
+            max_bytes=max_bytes
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if not self.enabled:
+            return _MISSING
+        with self._lock:
+            return self._lru.get(key, _MISSING)
+
+    def set(self, key, value, size: int):
+        if self.enabled:
+            with self._lock:
+                self._lru.set(key, value, size=size)
+
+    def pop(self, key):
+        with self._lock:
+            self._lru.pop(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"enabled": self.enabled, **self._lru.stats()}
 
 
 class MemoryStore:
@@ -35,17 +180,330 @@ class MemoryStore:
         self.summaries_dir.mkdir(exist_ok=True)
         self.embeddings_dir.mkdir(exist_ok=True)
 
+        self.cache = _StoreCache()
+        self.tail_turns = int(os.getenv("MEMORY_CACHE_TAIL_TURNS", "50"))
+        # Manifest log entries kept before folding them into _manifest.json
+        # (at least one per conversation, so folding stays amortized O(1))
+        self.manifest_log_max = int(os.getenv("MEMORY_MANIFEST_LOG_MAX", "256"))
+
+        # Compaction policy: archive turns older than max_age_days or
+        # covered by the summary, keeping keep_turns live, in segments
+        # of at least min_turns
+        self.codec = SegmentCodec(self.storage_path)
+        self.compact_max_age_days = float(os.getenv("MEMORY_COMPACT_MAX_AGE_DAYS", "30"))
+        self.compact_keep_turns = max(self.tail_turns, int(os.getenv("MEMORY_COMPACT_KEEP_TURNS", "100")))
+        self.compact_min_turns = int(os.getenv("MEMORY_COMPACT_MIN_TURNS", "100"))
+        self.compactions = 0
+        self.turns_archived = 0
+        self.archive_bytes_in = 0
+        self.archive_bytes_out = 0
+
+        # Directories known to exist, so writes don't mkdir every time
+        self._created_dirs: Set[Path] = set()
+
+        # Users not yet moved to the sharded layout (scanned once here)
+        self._flat_users = _find_flat_user_dirs(self.conversations_dir) | _find_flat_user_dirs(self.summaries_dir)
+        self._layout_lock = threading.Lock()
+
+        # Called after turns are saved (see add_turn_listener)
+        self.turn_listeners: List[Callable[[str, str], None]] = []
+
+    def _ensure_dir(self, directory: Path):
+        """Create a directory on first write (no-op once seen)"""
+        if directory not in self._created_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    def _get_user_dir(self, user_id: str) -> Path:
+        """Get a user's conversation directory (not created until first write)"""
+        user_id = str(user_id)
+        if user_id in self._flat_users:
+            self._migrate_user_layout_sync(user_id)
+        return _shard_dir(self.conversations_dir, user_id)
+
+    def _get_user_summary_dir(self, user_id: str) -> Path:
+        user_id = str(user_id)
+        if user_id in self._flat_users:
+            self._migrate_user_layout_sync(user_id)
+        return _shard_dir(self.summaries_dir, user_id)
+
+    async def migrate_layout(self) -> int:
+        """Move every flat-layout user directory to the sharded layout"""
+        return await run_io(self._migrate_layout_sync)
+
+    def _migrate_layout_sync(self) -> int:
+        users = _find_flat_user_dirs(self.conversations_dir) | _find_flat_user_dirs(self.summaries_dir)
+        with self._layout_lock:
+            self._flat_users |= users
+        for user_id in sorted(users):
+            self._migrate_user_layout_sync(user_id)
+        return len(users)
+
+    def _migrate_user_layout_sync(self, user_id: str):
+        """
+        Move one user's flat directories into the sharded layout
+
+        Files are renamed one by one (atomic on one filesystem) and never
+        over an existing file, so this can race with another process
+        migrating the same user: whoever renames a file first wins and
+        the other skips it.
+        """
+        # Leaf lock: callers may hold conversation locks, so take no others here
+        with self._layout_lock:
+            if user_id not in self._flat_users:
+                return
+
+            for root in (self.conversations_dir, self.summaries_dir):
+                source = root / user_id
+                if not source.is_dir():
+                    continue
+                target = _shard_dir(root, user_id)
+
+                for entry in list(os.scandir(source)):
+                    if entry.is_dir():
+                        # A shard directory sharing the user's two-character name
+                        continue
+                    self._ensure_dir(target)
+                    destination = target / entry.name
+                    if destination.exists():
+                        print(f"Layout migration: keeping {destination}, {entry.path} left in place")
+                        continue
+                    try:
+                        os.replace(entry.path, destination)
+                    except FileNotFoundError:
+                        pass
+
+                try:
+                    source.rmdir()
+                except OSError:
+                    pass
+
+            self._flat_users.discard(user_id)
+
     def _get_conversation_file(self, user_id: str, conversation_id: str) -> Path:
-        """Get file path for conversation"""
-        user_dir = self.conversations_dir / str(user_id)
-        user_dir.mkdir(exist_ok=True)
-        return user_dir / f"{conversation_id}.json"
+        """Get the append-only turn log for a conversation (one JSON turn per line)"""
+        return self._get_user_dir(user_id) / f"{conversation_id}.jsonl"
+
+    def _get_meta_file(self, user_id: str, conversation_id: str) -> Path:
+        """Get the small side record (turn_count, last_updated) for a conversation"""
+        return self._get_user_dir(user_id) / f"{conversation_id}{META_SUFFIX}"
+
+    def _get_legacy_file(self, user_id: str, conversation_id: str) -> Path:
+        """Get the pre-JSONL whole-conversation file"""
+        return self._get_user_dir(user_id) / f"{conversation_id}.json"
 
     def _get_summary_file(self, user_id: str, conversation_id: str) -> Path:
         """Get file path for summary"""
-        user_dir = self.summaries_dir / str(user_id)
-        user_dir.mkdir(exist_ok=True)
-        return user_dir / f"{conversation_id}.json"
+        return self._get_user_summary_dir(user_id) / f"{conversation_id}.json"
+
+    def _write_json_atomic(self, file_path: Path, data: Dict, indent: Optional[int] = None) -> int:
+        """Write JSON via tmp file + rename; returns the size written"""
+        # Readers don't take locks, so never let them see a half-written file
+        text = json.dumps(data, indent=indent)
+        self._ensure_dir(file_path.parent)
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+        return len(text)
+
+    def _migrate_legacy(self, user_id: str, conversation_id: str):
+        """
+        Convert a legacy {conversation_id}.json file to the JSONL log + meta record
+
+        Runs on first access; the legacy file is removed only after the
+        new files are fully written.
+        """
+        with _conversation_lock(user_id, conversation_id):
+            legacy_file = self._get_legacy_file(user_id, conversation_id)
+            if not legacy_file.exists():
+                return
+
+            log_file = self._get_conversation_file(user_id, conversation_id)
+            if not log_file.exists():
+                with open(legacy_file, "r") as f:
+                    data = json.load(f)
+                turns = data.get("turns", [])
+
+                tmp_path = log_file.with_name(log_file.name + ".tmp")
+                with open(tmp_path, "w") as f:
+                    for turn in turns:
+                        f.write(json.dumps(turn) + "\n")
+                os.replace(tmp_path, log_file)
+
+                self._write_json_atomic(self._get_meta_file(user_id, conversation_id), {
+                    "turn_count": len(turns),
+                    "last_updated": data.get("metadata", {}).get("last_updated"),
+                })
+
+            legacy_file.unlink()
+
+    def _read_meta(self, user_id: str, conversation_id: str) -> Dict:
+        """Read the meta record, rebuilding it from the log if it is missing"""
+        key = ("meta", str(user_id), str(conversation_id))
+        meta = self.cache.get(key)
+        if meta is not _MISSING:
+            return dict(meta)
+
+        with _conversation_lock(user_id, conversation_id):
+            meta_file = self._get_meta_file(user_id, conversation_id)
+            log_file = self._get_conversation_file(user_id, conversation_id)
+            if meta_file.exists():
+                with open(meta_file, "r") as f:
+                    meta = json.load(f)
+            elif not log_file.exists():
+                return {"turn_count": 0, "last_updated": None}
+            else:
+                # Crash between the log append and the meta write: recount the log
+                archived, turns = _split_header(log_file.read_bytes().splitlines())
+                meta = {
+                    "turn_count": archived + len(turns),
+                    "last_updated": turns[-1].get("timestamp") if turns else None,
+                    "archived_turns": archived,
+                }
+                self._write_json_atomic(meta_file, meta)
+
+            self.cache.set(key, meta, size=256)
+            return dict(meta)
+
+    def _get_manifest_file(self, user_id: str) -> Path:
+        return self._get_user_dir(user_id) / MANIFEST_NAME
+
+    def _get_manifest_log_file(self, user_id: str) -> Path:
+        return self._get_user_dir(user_id) / MANIFEST_LOG_NAME
+
+    def _load_manifest(self, user_id: str) -> Dict[str, Dict]:
+        """
+        Load the user's manifest, rebuilding it from disk if needed
+
+        The returned dict is shared with the cache; treat it as read-only.
+        """
+        return self._load_manifest_state(user_id)[0]
+
+    def _load_manifest_state(self, user_id: str) -> Tuple[Dict[str, Dict], int]:
+        """(manifest, number of log entries not yet folded into _manifest.json)"""
+        key = ("manifest", str(user_id))
+        state = self.cache.get(key)
+        if state is not _MISSING:
+            return state
+
+        with _user_lock(user_id):
+            manifest_file = self._get_manifest_file(user_id)
+            if manifest_file.exists():
+                try:
+                    raw = manifest_file.read_bytes()
+                    manifest = json.loads(raw)["conversations"]
+                    logged = self._replay_manifest_log(user_id, manifest)
+                    self.cache.set(key, (manifest, logged), size=len(raw))
+                    return manifest, logged
+                except (ValueError, KeyError) as e:
+                    print(f"Rebuilding unreadable manifest for user {user_id}: {e}")
+            return self._rebuild_manifest_sync(user_id), 0
+
+    def _replay_manifest_log(self, user_id: str, manifest: Dict[str, Dict]) -> int:
+        """Apply logged entries to `manifest` in place; returns how many there were"""
+        log_file = self._get_manifest_log_file(user_id)
+        if not log_file.exists():
+            return 0
+        count = 0
+        for line in log_file.read_bytes().splitlines():
+            try:
+                record = json.loads(line)
+                conversation_id, entry = record["id"], record["entry"]
+            except (ValueError, KeyError, TypeError):
+                continue  # blank line or torn final write
+            if entry is None:
+                manifest.pop(conversation_id, None)
+            else:
+                manifest[conversation_id] = entry
+            count += 1
+        return count
+
+    def _write_manifest(self, user_id: str, manifest: Dict[str, Dict]):
+        size = self._write_json_atomic(self._get_manifest_file(user_id), {"conversations": manifest})
+        # Entries are absolute, so replaying a log that outlived a crash here is harmless
+        try:
+            self._get_manifest_log_file(user_id).unlink()
+        except FileNotFoundError:
+            pass
+        self.cache.set(("manifest", str(user_id)), (manifest, 0), size=size)
+
+    def _update_manifest(self, user_id: str, conversation_id: str, entry: Optional[Dict]):
+        """
+        Merge `entry` into the manifest (None removes the conversation)
+
+        Unchanged entries cost nothing; changed ones are one appended
+        log line, and the full manifest is only rewritten when the log
+        has grown past max(manifest_log_max, number of conversations).
+        """
+        with _user_lock(user_id):
+            manifest, logged = self._load_manifest_state(user_id)
+            current = manifest.get(conversation_id)
+            if entry is None:
+                if current is None:
+                    return
+                merged = None
+            else:
+                merged = {**(current or {}), **entry}
+                if merged == current:
+                    return
+
+            if merged is None or current is None:
+                # Copy-on-write: concurrent readers may be iterating the cached dict
+                manifest = dict(manifest)
+            # Replacing an existing key's value is safe for those readers
+            if merged is None:
+                manifest.pop(conversation_id, None)
+            else:
+                manifest[conversation_id] = merged
+
+            if logged >= max(self.manifest_log_max, len(manifest)):
+                self._write_manifest(user_id, manifest)
+                return
+
+            log_file = self._get_manifest_log_file(user_id)
+            self._ensure_dir(log_file.parent)
+            with open(log_file, "a+b") as f:
+                # Start on a fresh line if a previous write was torn mid-line
+                prefix = b""
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        prefix = b"\n"
+                f.write(prefix + json.dumps({"id": conversation_id, "entry": merged}).encode("utf-8") + b"\n")
+            self.cache.set(("manifest", str(user_id)), (manifest, logged + 1), size=128 * (len(manifest) + 1))
+
+    def _summary_entry(self, summary: Optional[str]) -> Dict:
+        """Manifest fields describing a conversation's summary"""
+        # The hash lets the retriever spot index entries built from an older summary
+        return {"has_summary": bool(summary), "summary_hash": content_hash(summary) if summary else None}
+
+    async def rebuild_manifest(self, user_id: str) -> Dict[str, Dict]:
+        """Rebuild a user's manifest from the conversation and summary files"""
+        return await run_io(self._rebuild_manifest_sync, user_id)
+
+    def _rebuild_manifest_sync(self, user_id: str) -> Dict[str, Dict]:
+        with _user_lock(user_id):
+            user_dir = self._get_user_dir(user_id)
+
+            # Migrate legacy files so every conversation has a meta record
+            for file_path in list(user_dir.glob("*.json")):
+                name = file_path.name
+                if name != MANIFEST_NAME and not name.endswith(META_SUFFIX):
+                    self._migrate_legacy(user_id, file_path.stem)
+
+            manifest = {}
+            for file_path in user_dir.glob("*.jsonl"):
+                conversation_id = file_path.stem
+                meta = self._read_meta(user_id, conversation_id)
+                manifest[conversation_id] = {
+                    "turn_count": meta.get("turn_count", 0),
+                    "last_updated": meta.get("last_updated"),
+                    **self._summary_entry(self._get_summary_sync(user_id, conversation_id)),
+                }
+
+            self._write_manifest(user_id, manifest)
+            return manifest
 
     async def save_turn(
         self,
@@ -54,28 +512,83 @@ class MemoryStore:
         message: str,
         role: str
     ):
-        """Save a conversation turn"""
-        file_path = self._get_conversation_file(user_id, conversation_id)
+        """Save a conversation turn (O(1) append + meta update)"""
+        await self.save_turns(user_id, conversation_id, [{"role": role, "content": message}])
 
-        # Load existing
-        data = {"turns": [], "metadata": {}}
-        if file_path.exists():
-            with open(file_path, "r") as f:
-                data = json.load(f)
-
-        # Add new turn
-        turn = {
-            "role": role,
-            "content": message,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        data["turns"].append(turn)
-        data["metadata"]["last_updated"] = datetime.utcnow().isoformat()
-        data["metadata"]["turn_count"] = len(data["turns"])
+    async def save_turns(
+        self,
+        user_id: str,
+        conversation_id: str,
+        turns: List[Dict]
+    ):
+        """Save several turns of one conversation with a single append"""
+        await run_io(self._save_turns_sync, user_id, conversation_id, turns)
+        if turns:
+            self._notify_turns(user_id, conversation_id)
+
+    def add_turn_listener(self, listener: Callable[[str, str], None]):
+        """Call listener(user_id, conversation_id) after turns are saved (on the event loop)"""
+        self.turn_listeners.append(listener)
+
+    def _notify_turns(self, user_id: str, conversation_id: str):
+        for listener in self.turn_listeners:
+            try:
+                listener(str(user_id), str(conversation_id))
+            except Exception as e:
+                print(f"Turn listener failed for {user_id}/{conversation_id}: {e}")
+
+    def _save_turns_sync(
+        self,
+        user_id: str,
+        conversation_id: str,
+        turns: List[Dict]
+    ):
+        if not turns:
+            return
+
+        with _user_lock(user_id), _conversation_lock(user_id, conversation_id):
+            self._migrate_legacy(user_id, conversation_id)
+            file_path = self._get_conversation_file(user_id, conversation_id)
+            meta = self._read_meta(user_id, conversation_id)
+
+            now = datetime.utcnow().isoformat()
+            records = [
+                {
+                    "role": turn["role"],
+                    "content": turn["content"],
+                    "timestamp": turn.get("timestamp") or now
+                }
+                for turn in turns
+            ]
+            self._ensure_dir(file_path.parent)
+            with open(file_path, "a+b") as f:
+                # Start on a fresh line if a previous write was torn mid-line
+                prefix = b""
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        prefix = b"\n"
+                lines = b"".join(json.dumps(record).encode("utf-8") + b"\n" for record in records)
+                f.write(prefix + lines)
+
+            meta["turn_count"] = meta.get("turn_count", 0) + len(records)
+            meta["last_updated"] = records[-1]["timestamp"]
+            self._write_json_atomic(self._get_meta_file(user_id, conversation_id), meta)
+            self.cache.set(("meta", str(user_id), str(conversation_id)), meta, size=256)
 
-        # Save
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
+            # Keep a cached tail current instead of dropping it
+            tail_key = ("tail", str(user_id), str(conversation_id))
+            cached = self.cache.get(tail_key)
+            if cached is not _MISSING:
+                tail, complete = cached
+                tail = (tail + records)[-self.tail_turns:]
+                complete = complete and meta["turn_count"] <= self.tail_turns
+                self.cache.set(tail_key, (tail, complete), size=_turns_size(tail))
+
+            self._update_manifest(user_id, conversation_id, {
+                "turn_count": meta["turn_count"],
+                "last_updated": meta["last_updated"],
+            })
 
     async def get_conversation_history(
         self,
@@ -83,20 +596,220 @@ class MemoryStore:
         conversation_id: str,
         limit: Optional[int] = None
     ) -> List[Dict]:
-        """Get conversation history"""
+        """Get conversation history (with a limit, only the tail of the log is read)"""
+        return await run_io(self._get_conversation_history_sync, user_id, conversation_id, limit)
+
+    def _get_conversation_history_sync(
+        self,
+        user_id: str,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        tail_key = ("tail", str(user_id), str(conversation_id))
+        cached = self.cache.get(tail_key)
+        if cached is _MISSING:
+            cached = self._fill_tail(user_id, conversation_id)
+
+        tail, complete = cached
+        if complete or (limit and limit <= len(tail)):
+            turns = tail[-limit:] if limit else tail
+            return [dict(turn) for turn in turns]
+
+        # Longer than the cached tail: read from disk
         file_path = self._get_conversation_file(user_id, conversation_id)
+        if limit:
+            archived, turns = _split_header(_read_tail_lines(file_path, limit))
+            turns = turns[-limit:]
+            if len(turns) >= limit or not archived:
+                return turns
+        else:
+            with open(file_path, "rb") as f:
+                archived, turns = _split_header(f.read().splitlines())
+            if not archived:
+                return turns
 
-        if not file_path.exists():
-            return []
+        # The live log starts after `archived` turns: prepend segments, newest first
+        older: List[Dict] = []
+        for start, end, path in reversed(self._list_segments(user_id, conversation_id, archived)):
+            older = self._read_segment(path) + older
+            if limit and len(older) + len(turns) >= limit:
+                break
+        history = older + turns
+        return history[-limit:] if limit else history
 
-        with open(file_path, "r") as f:
-            data = json.load(f)
+    async def get_turns_since(
+        self,
+        user_id: str,
+        conversation_id: str,
+        start: int
+    ) -> List[Dict]:
+        """Turns from position `start` on (0 = the first turn ever saved, archived ones included)"""
+        return await run_io(self._get_turns_since_sync, user_id, conversation_id, start)
 
-        turns = data.get("turns", [])
+    def _get_turns_since_sync(self, user_id: str, conversation_id: str, start: int) -> List[Dict]:
+        # Under the writers' lock, so the count and the log agree
+        with _conversation_lock(user_id, conversation_id):
+            count = self._read_meta(user_id, conversation_id).get("turn_count", 0)
+            if count <= start:
+                return []
+            return self._get_conversation_history_sync(user_id, conversation_id, count - start)
 
-        if limit:
-            return turns[-limit:]
-        return turns
+    def _list_segments(
+        self,
+        user_id: str,
+        conversation_id: str,
+        archived: Optional[int] = None
+    ) -> List[Tuple[int, int, Path]]:
+        """
+        Archive segments of a conversation as sorted (start, end, path)
+
+        With `archived`, only segments the live log's header commits to
+        (end <= archived); later ones are leftovers of an interrupted
+        compaction.
+        """
+        segments = []
+        pattern = glob.escape(str(conversation_id)) + ".seg-*"
+        for path in self._get_user_dir(user_id).glob(pattern):
+            parsed = parse_segment_name(path.name)
+            if parsed is None or parsed[0] != str(conversation_id):
+                continue
+            if archived is None or parsed[2] <= archived:
+                segments.append((parsed[1], parsed[2], path))
+        segments.sort()
+        return segments
+
+    def _segment_cache_key(self, path: Path) -> Tuple:
+        """
+        Cache key of a segment file as it is on disk now
+
+        Segments are immutable, but a cleared conversation reuses the same
+        names for new turns, so the key includes the file's identity.
+        """
+        st = os.stat(path)
+        return ("segment", str(path), st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_segment(self, path: Path) -> List[Dict]:
+        """Decode a segment (cached per file version)"""
+        key = self._segment_cache_key(path)
+        turns = self.cache.get(key)
+        if turns is _MISSING:
+            data = path.read_bytes()
+            turns = self.codec.decode_turns(data, path.name.rsplit(".", 1)[1])
+            self.cache.set(key, turns, size=_turns_size(turns))
+        return [dict(turn) for turn in turns]
+
+    def _delete_segment(self, path: Path):
+        """Remove a segment file and its decoded turns from the cache"""
+        try:
+            self.cache.pop(self._segment_cache_key(path))
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    async def compact_conversation(self, user_id: str, conversation_id: str) -> int:
+        """Archive old turns of one conversation; returns the number archived"""
+        return await run_io(self._compact_conversation_sync, user_id, conversation_id)
+
+    def _compact_conversation_sync(self, user_id: str, conversation_id: str) -> int:
+        with _user_lock(user_id), _conversation_lock(user_id, conversation_id):
+            self._migrate_legacy(user_id, conversation_id)
+            file_path = self._get_conversation_file(user_id, conversation_id)
+            if not file_path.exists():
+                return 0
+
+            # Cheap check from the meta record before reading the log
+            meta = self._read_meta(user_id, conversation_id)
+            live_turns = meta.get("turn_count", 0) - meta.get("archived_turns", 0)
+            if live_turns - self.compact_keep_turns < self.compact_min_turns:
+                return 0
+
+            with open(file_path, "rb") as f:
+                raw = f.read()
+            archived, live = _split_header(raw.splitlines())
+
+            max_cut = len(live) - self.compact_keep_turns
+            if max_cut < self.compact_min_turns:
+                return 0
+
+            # Turns before the last consolidation point are covered by the summary
+            summary_data = self._read_summary_data(user_id, conversation_id) or {}
+            summarized_cut = summary_data.get("summarized_turns", 0) - archived
+
+            age_cut = 0
+            if self.compact_max_age_days > 0:
+                cutoff = (datetime.utcnow() - timedelta(days=self.compact_max_age_days)).isoformat()
+                while age_cut < len(live) and (live[age_cut].get("timestamp") or "") < cutoff:
+                    age_cut += 1
+
+            cut = min(max(summarized_cut, age_cut), max_cut)
+            if cut < self.compact_min_turns:
+                return 0
+
+            # Drop segments left by a compaction that never committed
+            for start, end, path in self._list_segments(user_id, conversation_id):
+                if end > archived:
+                    self._delete_segment(path)
+
+            user_dir = file_path.parent
+            payload = self.codec.encode_turns(live[:cut])
+            segment = user_dir / segment_name(conversation_id, archived, archived + cut, self.codec.ext)
+            tmp_path = segment.with_name(segment.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, segment)
+
+            # Replacing the live log is the commit point: its header is
+            # what makes readers include the new segment
+            lines = [json.dumps({"archived_turns": archived + cut})]
+            lines.extend(json.dumps(turn) for turn in live[cut:])
+            tmp_path = file_path.with_name(file_path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, file_path)
+
+            meta["archived_turns"] = archived + cut
+            self._write_json_atomic(self._get_meta_file(user_id, conversation_id), meta)
+            self.cache.set(("meta", str(user_id), str(conversation_id)), meta, size=256)
+
+            self.compactions += 1
+            self.turns_archived += cut
+            self.archive_bytes_in += len(raw)
+            self.archive_bytes_out += len(payload) + sum(len(line) + 1 for line in lines)
+            return cut
+
+    async def compact_user(self, user_id: str) -> int:
+        """Compact every conversation of a user; returns turns archived"""
+        return await run_io(self._compact_user_sync, user_id)
+
+    def _compact_user_sync(self, user_id: str) -> int:
+        if not self._get_user_dir(user_id).exists():
+            return 0
+        archived = 0
+        for conversation_id in list(self._load_manifest(user_id)):
+            try:
+                archived += self._compact_conversation_sync(user_id, conversation_id)
+            except Exception as e:
+                print(f"Compaction failed for {user_id}/{conversation_id}: {e}")
+        return archived
+
+    def _iter_user_ids(self) -> List[str]:
+        """Every user with conversations (sharded layout)"""
+        return [path.name for path in self.conversations_dir.glob("*/*/*") if path.is_dir()]
+
+    def _fill_tail(self, user_id: str, conversation_id: str):
+        """Load the last tail_turns turns into the cache: (turns, is_whole_conversation)"""
+        with _conversation_lock(user_id, conversation_id):
+            self._migrate_legacy(user_id, conversation_id)
+            file_path = self._get_conversation_file(user_id, conversation_id)
+
+            if not file_path.exists():
+                tail, complete = [], True
+            else:
+                tail = _parse_turns(_read_tail_lines(file_path, self.tail_turns))[-self.tail_turns:]
+                complete = self._read_meta(user_id, conversation_id).get("turn_count", 0) <= len(tail)
+
+            self.cache.set(("tail", str(user_id), str(conversation_id)), (tail, complete), size=_turns_size(tail))
+            return tail, complete
 
     async def save_summary(
         self,
@@ -105,17 +818,30 @@ class MemoryStore:
         summary: str
     ):
         """Save conversation summary"""
-        file_path = self._get_summary_file(user_id, conversation_id)
+        await run_io(self._save_summary_sync, user_id, conversation_id, summary)
 
-        data = {
-            "summary": summary,
-            "created_at": datetime.utcnow().isoformat(),
-            "conversation_id": conversation_id,
-            "user_id": user_id
-        }
+    def _save_summary_sync(
+        self,
+        user_id: str,
+        conversation_id: str,
+        summary: str
+    ):
+        with _user_lock(user_id), _conversation_lock(user_id, conversation_id):
+            file_path = self._get_summary_file(user_id, conversation_id)
 
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
+            data = {
+                "summary": summary,
+                "created_at": datetime.utcnow().isoformat(),
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                # Consolidation point: turns before it may be archived
+                "summarized_turns": self._read_meta(user_id, conversation_id).get("turn_count", 0)
+            }
+
+            size = self._write_json_atomic(file_path, data, indent=2)
+            self.cache.set(("summary", str(user_id), str(conversation_id)), data, size=size)
+
+            self._update_manifest(user_id, conversation_id, self._summary_entry(summary))
 
     async def get_summary(
         self,
@@ -123,15 +849,31 @@ class MemoryStore:
         conversation_id: str
     ) -> Optional[str]:
         """Get conversation summary"""
-        file_path = self._get_summary_file(user_id, conversation_id)
+        return await run_io(self._get_summary_sync, user_id, conversation_id)
 
-        if not file_path.exists():
-            return None
+    def _get_summary_sync(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Optional[str]:
+        data = self._read_summary_data(user_id, conversation_id)
+        return data.get("summary") if data else None
 
-        with open(file_path, "r") as f:
-            data = json.load(f)
+    def _read_summary_data(self, user_id: str, conversation_id: str) -> Optional[Dict]:
+        """Read the parsed summary/state file (None if missing; cached either way)"""
+        key = ("summary", str(user_id), str(conversation_id))
+        data = self.cache.get(key)
+        if data is not _MISSING:
+            return data
 
-        return data.get("summary")
+        with _conversation_lock(user_id, conversation_id):
+            file_path = self._get_summary_file(user_id, conversation_id)
+            data, size = None, 64
+            if file_path.exists():
+                raw = file_path.read_bytes()
+                data, size = json.loads(raw), len(raw)
+            self.cache.set(key, data, size=size)
+            return data
 
     async def get_conversation_state(
         self,
@@ -139,7 +881,14 @@ class MemoryStore:
         conversation_id: str
     ) -> Dict:
         """Get conversation state (summary, metadata, etc.)"""
-        summary = await self.get_summary(user_id, conversation_id)
+        return await run_io(self._get_conversation_state_sync, user_id, conversation_id)
+
+    def _get_conversation_state_sync(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Dict:
+        summary = self._get_summary_sync(user_id, conversation_id)
 
         return {
             "summary": summary,
@@ -153,18 +902,27 @@ class MemoryStore:
         state: Dict
     ):
         """Update conversation state"""
-        file_path = self._get_summary_file(user_id, conversation_id)
+        await run_io(self._update_conversation_state_sync, user_id, conversation_id, state)
 
-        data = {}
-        if file_path.exists():
-            with open(file_path, "r") as f:
-                data = json.load(f)
+    def _update_conversation_state_sync(
+        self,
+        user_id: str,
+        conversation_id: str,
+        state: Dict
+    ):
+        with _user_lock(user_id), _conversation_lock(user_id, conversation_id):
+            file_path = self._get_summary_file(user_id, conversation_id)
+
+            # Copy: the cached dict may be in use by readers
+            data = dict(self._read_summary_data(user_id, conversation_id) or {})
+            data.update(state)
+            data["updated_at"] = datetime.utcnow().isoformat()
 
-        data.update(state)
-        data["updated_at"] = datetime.utcnow().isoformat()
+            size = self._write_json_atomic(file_path, data, indent=2)
+            self.cache.set(("summary", str(user_id), str(conversation_id)), data, size=size)
 
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
+            if "summary" in state:
+                self._update_manifest(user_id, conversation_id, self._summary_entry(state["summary"]))
 
     async def clear_conversation(
         self,
@@ -172,30 +930,158 @@ class MemoryStore:
         conversation_id: str
     ):
         """Clear all memory for a conversation"""
-        conv_file = self._get_conversation_file(user_id, conversation_id)
-        summary_file = self._get_summary_file(user_id, conversation_id)
+        await run_io(self._clear_conversation_sync, user_id, conversation_id)
+
+    def _clear_conversation_sync(
+        self,
+        user_id: str,
+        conversation_id: str
+    ):
+        with _user_lock(user_id), _conversation_lock(user_id, conversation_id):
+            files = [
+                self._get_conversation_file(user_id, conversation_id),
+                self._get_meta_file(user_id, conversation_id),
+                self._get_legacy_file(user_id, conversation_id),
+                self._get_summary_file(user_id, conversation_id),
+            ]
+            for _, _, path in self._list_segments(user_id, conversation_id):
+                self._delete_segment(path)
+
+            for file_path in files:
+                if file_path.exists():
+                    file_path.unlink()
+
+            for kind in ("meta", "tail", "summary"):
+                self.cache.pop((kind, str(user_id), str(conversation_id)))
 
-        if conv_file.exists():
-            conv_file.unlink()
+            if self._get_user_dir(user_id).exists():
+                self._update_manifest(user_id, conversation_id, None)
 
-        if summary_file.exists():
-            summary_file.unlink()
+    async def close(self):
+        """Nothing buffered here; writes are durable when they return"""
+
+    def _get_embedding_file(self, content_hash: str, model: str) -> Path:
+        model_dir = re.sub(r"[^A-Za-z0-9._-]", "_", model)
+        return self.embeddings_dir / model_dir / content_hash[:2] / f"{content_hash}.f32"
+
+    async def get_embedding(self, content_hash: str, model: str) -> Optional[List[float]]:
+        """Get a stored embedding (None if this text/model was never stored)"""
+        return await run_io(self._get_embedding_sync, content_hash, model)
+
+    def _get_embedding_sync(self, content_hash: str, model: str) -> Optional[List[float]]:
+        try:
+            return unpack_float32(self._get_embedding_file(content_hash, model).read_bytes())
+        except FileNotFoundError:
+            return None
+
+    async def save_embedding(self, content_hash: str, model: str, vector: List[float]):
+        """Store an embedding as float32 (content-addressed, so rewrites are harmless)"""
+        await run_io(self._save_embedding_sync, content_hash, model, vector)
+
+    def _save_embedding_sync(self, content_hash: str, model: str, vector: List[float]):
+        file_path = self._get_embedding_file(content_hash, model)
+        self._ensure_dir(file_path.parent)
+        tmp_path = file_path.with_name(f"{file_path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(pack_float32(vector))
+        os.replace(tmp_path, file_path)
+
+    def stats(self) -> Dict:
+        return {
+            "cache": self.cache.stats(),
+            "archive": {
+                "codec": self.codec.codec,
+                "compactions": self.compactions,
+                "turns_archived": self.turns_archived,
+                "bytes_before": self.archive_bytes_in,
+                "bytes_after": self.archive_bytes_out,
+            },
+        }
 
     async def get_all_conversations(self, user_id: str) -> List[Dict]:
         """Get all conversations for a user"""
-        user_dir = self.conversations_dir / str(user_id)
+        return await run_io(self._get_all_conversations_sync, user_id)
 
-        if not user_dir.exists():
+    def _get_all_conversations_sync(self, user_id: str) -> List[Dict]:
+        if not self._get_user_dir(user_id).exists():
             return []
 
-        conversations = []
-        for file_path in user_dir.glob("*.json"):
-            with open(file_path, "r") as f:
-                data = json.load(f)
-                conversations.append({
-                    "conversation_id": file_path.stem,
-                    "turn_count": len(data.get("turns", [])),
-                    "last_updated": data.get("metadata", {}).get("last_updated")
-                })
+        manifest = self._load_manifest(user_id)
+        return [
+            {
+                "conversation_id": conversation_id,
+                "turn_count": entry.get("turn_count", 0),
+                "last_updated": entry.get("last_updated"),
+                "has_summary": entry.get("has_summary", False),
+                "summary_hash": entry.get("summary_hash")
+            }
+            for conversation_id, entry in manifest.items()
+        ]
+
+
+def _split_header(lines: List[bytes]) -> Tuple[int, List[Dict]]:
+    """
+    Decode JSONL turn lines, skipping blanks and a torn final write
+
+    Returns (archived_turns, turns); archived_turns comes from the header
+    line a compacted log starts with (0 if it isn't among `lines`).
+    """
+    archived = 0
+    turns = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "role" not in record and "archived_turns" in record:
+            archived = record["archived_turns"]
+            continue
+        turns.append(record)
+    return archived, turns
+
+
+def _parse_turns(lines: List[bytes]) -> List[Dict]:
+    return _split_header(lines)[1]
+
+
+def _read_tail_lines(file_path: Path, count: int, block_size: int = 8192) -> List[bytes]:
+    """Read the last `count` lines of a file by seeking backwards from the end"""
+    with open(file_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # count + 1 newlines guarantees `count` complete lines (the log ends with one)
+        while position > 0 and data.count(b"\n") <= count:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+
+    lines = data.splitlines()
+    if position > 0:
+        # First line may be a partial one cut by the block boundary
+        lines = lines[1:]
+    return lines[-count:]
+
+
+def create_memory_store():
+    """
+    Create the configured memory store backend
+
+    MEMORY_BACKEND=json (default): per-conversation JSONL files
+    MEMORY_BACKEND=sqlite: SQLite database at MEMORY_SQLITE_PATH
+    MEMORY_WRITE_BEHIND=1 additionally buffers writes (write_behind.py)
+    """
+    backend = (os.getenv("MEMORY_BACKEND") or "json").strip().lower()
+    if backend == "sqlite":
+        store = SQLiteMemoryStore()
+    else:
+        if backend != "json":
+            print(f"Unknown MEMORY_BACKEND={backend!r}; using json")
+        store = MemoryStore()
 
-        return conversations
+    if write_behind_enabled():
+        return WriteBehindStore(store)
+    return store
@@ -4,9 +4,20 @@ Uses semantic similarity to retrieve contextually relevant past conversations
 """
 import os
 import json
-import httpx
-from typing import List, Dict, Optional
+import asyncio
+from typing import List, Dict, Optional, Set, Tuple
 from pathlib import Path
+import numpy as np
+from shared.http_client import get_http_client, get_timeout, track_request
+from shared.deadline import spawn_detached
+from shared.single_flight import get_single_flight
+from shared.rate_limiter import get_rate_limiter
+from shared.mock_llm import embedding_mock_enabled, MOCK_BASE_URL
+from modules.ai.memory.vectors import content_hash, EmbeddingCache
+from modules.ai.memory.io_pool import run_io
+from modules.ai.memory.vector_index import VectorIndex, normalize
+from modules.ai.memory.embedding_batcher import EmbeddingBatcher
+from modules.ai.memory.chunk_index import ChunkIndex, chunk_index_enabled, parse_chunk_id
 
 
 class MemoryRetriever:
@@ -17,12 +28,29 @@ class MemoryRetriever:
 
     def __init__(self, memory_store):
         self.store = memory_store
-        self.embeddings_cache = {}
+        self.embeddings_cache = EmbeddingCache()
+        index_dir = _index_dir(memory_store)
+        self.index = VectorIndex(index_dir)
+        self.index.evict_listeners.append(self._on_evicted)
+        # Users whose saved index was already tried since startup or eviction
+        self._disk_checked: Set[str] = set()
+        # user_id -> (index, conversation_id -> hash of the summary indexed for it)
+        self._summary_hashes: Dict[str, Tuple[object, Dict[str, str]]] = {}
+        # Turn chunks, embedded as turns are saved (on_turns_saved)
+        self.chunks = ChunkIndex(index_dir / "chunks" if index_dir else None) if chunk_index_enabled() else None
+        # Conversations with turns saved since their last chunking pass
+        self._unchunked: Set[Tuple[str, str]] = set()
+        # Index training / saving / chunking jobs, at most one of each per key
+        self._jobs: Dict[tuple, asyncio.Task] = {}
         self.embedding_model = os.getenv("GEMINI_EMBEDDING_MODEL", "models/gemini-embedding-001")
-        self.gemini_embedding_endpoint = (
-            "https://generativelanguage.googleapis.com/v1beta/"
-            f"{self.embedding_model}:embedContent"
+        self.use_mock = embedding_mock_enabled()
+        base_url = (
+            f"{MOCK_BASE_URL}/v1beta" if self.use_mock
+            else "https://generativelanguage.googleapis.com/v1beta"
         )
+        self.gemini_embedding_endpoint = f"{base_url}/{self.embedding_model}:batchEmbedContents"
+        # Concurrent embed requests share batchEmbedContents calls
+        self.batcher = EmbeddingBatcher(self._fetch_embeddings)
 
     async def find_relevant_context(
         self,
@@ -36,121 +64,335 @@ class MemoryRetriever:
 
         Strategy:
         1. Get current query embedding
-        2. Compare with stored conversation embeddings
-        3. Return top N most similar contexts
+        2. Score it against the user's summary embedding matrix, and
+           against the turn chunks of their other conversations
+        3. Return top N most similar contexts (summaries or exchanges)
         """
-        # Get all conversations for user
+        # Get all conversations for user that have a summary to compare
         all_conversations = await self.store.get_all_conversations(user_id)
-
-        # Filter out current conversation
-        other_conversations = [
-            c for c in all_conversations
-            if c["conversation_id"] != conversation_id
-        ]
-
-        if not other_conversations:
+        others = {c["conversation_id"] for c in all_conversations} - {conversation_id}
+        summarized = {
+            c["conversation_id"]: c.get("summary_hash")
+            for c in all_conversations
+            if c.get("has_summary", True)
+        }
+
+        if not others or (self.chunks is None and not summarized.keys() & others):
             return []
 
         # Get query embedding
         query_embedding = await self._get_embedding(current_query)
 
-        if not query_embedding:
+        if query_embedding is None:
             return []
 
-        # Find most similar conversations
-        similarities = []
-
-        for conv in other_conversations:
-            conv_id = conv["conversation_id"]
-
-            # Get conversation summary
-            summary = await self.store.get_summary(user_id, conv_id)
-
-            if not summary:
-                continue
-
-            # Get summary embedding
-            summary_embedding = await self._get_embedding(summary)
-
-            if not summary_embedding:
-                continue
-
-            # Calculate similarity
-            similarity = self._cosine_similarity(query_embedding, summary_embedding)
-
-            similarities.append({
-                "conversation_id": conv_id,
-                "summary": summary,
-                "similarity": similarity
-            })
-
-        # Sort by similarity and return top N
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        top_memories = similarities[:max_memories]
-
-        # Format memories
-        formatted_memories = []
-        for mem in top_memories:
-            formatted_memories.append({
-                "content": mem["summary"],
-                "similarity": mem["similarity"],
-                "source": f"conversation_{mem['conversation_id']}"
-            })
-
-        return formatted_memories
+        # Nearest summaries from the user's vector index (vector_index.py)
+        vectors = await self._user_vectors(user_id, summarized, len(query_embedding))
+        self.index.searches += 1
+        memories = [
+            {
+                "content": summary,
+                "similarity": similarity,
+                "source": f"conversation_{conv_id}"
+            }
+            for conv_id, summary, similarity in vectors.search(query_embedding, max_memories, exclude=conversation_id)
+        ]
 
-    async def _get_embedding(self, text: str) -> Optional[List[float]]:
+        # Nearest past exchanges (chunk_index.py)
+        if self.chunks is not None:
+            await self.chunks.ensure_loaded(user_id)
+            hits = self.chunks.search(user_id, query_embedding, max_memories, exclude_conversation=conversation_id)
+            for item_id, text, similarity in hits:
+                conv_id, start, end = parse_chunk_id(item_id)
+                # Skip chunks of conversations cleared by another worker
+                if conv_id in others:
+                    memories.append({
+                        "content": text,
+                        "similarity": similarity,
+                        "source": f"conversation_{conv_id}_turns_{start}-{end}"
+                    })
+            memories.sort(key=lambda memory: memory["similarity"], reverse=True)
+
+        return memories[:max_memories]
+
+    async def _user_vectors(self, user_id: str, summaries: Dict[str, Optional[str]], dim: int):
+        """
+        Get the user's summary index, brought in line with the manifest
+
+        `summaries` maps each summarized conversation to its summary hash
+        (None if the store doesn't track one). On first use after a
+        restart the saved index is loaded; otherwise it is built from the
+        stored summaries and embeddings. Entries of cleared conversations
+        are dropped; conversations not indexed yet, or indexed from a
+        summary that has since been replaced (e.g. by another worker, or
+        before a crash), are loaded concurrently (summary + stored embedding).
+        """
+        vectors = self.index.get(user_id)
+        if vectors is None and user_id not in self._disk_checked:
+            self._disk_checked.add(user_id)
+            vectors = await run_io(self.index.load_sync, user_id, dim)
+            if vectors is not None and self.index.get(user_id) is None:
+                self.index.adopt(user_id, vectors)
+            vectors = self.index.get(user_id)
+        if vectors is None or vectors.dim != dim:
+            vectors = self.index.create(user_id, dim)
+
+        indexed = self._indexed_hashes(user_id, vectors)
+        stale = [c for c in vectors.ids if c not in summaries]
+        for conv_id in stale:
+            vectors.remove(conv_id)
+            indexed.pop(conv_id, None)
+        self.index.changed(user_id, len(stale))
+
+        outdated = [
+            c for c, summary_hash in summaries.items()
+            if c not in vectors or (summary_hash is not None and self._indexed_hash(vectors, indexed, c) != summary_hash)
+        ]
+        if outdated:
+            seen = {c: indexed.get(c) for c in outdated}
+            loaded = await asyncio.gather(*[self._load_summary_vector(user_id, c) for c in outdated])
+            added = 0
+            for conv_id, (summary, embedding) in zip(outdated, loaded):
+                # index_summary may have indexed a newer summary meanwhile
+                if summary and embedding is not None and indexed.get(conv_id) == seen[conv_id]:
+                    if vectors.upsert(conv_id, embedding, summary):
+                        indexed[conv_id] = content_hash(summary)
+                        added += 1
+            self.index.changed(user_id, added)
+
+        self._maintain(user_id, vectors)
+        return vectors
+
+    def _indexed_hashes(self, user_id: str, vectors) -> Dict[str, str]:
+        """Summary hashes of a user's index entries (reset when the index object changes)"""
+        entry = self._summary_hashes.get(user_id)
+        if entry is None or entry[0] is not vectors:
+            entry = (vectors, {})
+            self._summary_hashes[user_id] = entry
+        return entry[1]
+
+    def _indexed_hash(self, vectors, indexed: Dict[str, str], conversation_id: str) -> str:
+        # Entries loaded from disk are hashed from their text on first check
+        summary_hash = indexed.get(conversation_id)
+        if summary_hash is None:
+            summary_hash = indexed[conversation_id] = content_hash(vectors.text(conversation_id))
+        return summary_hash
+
+    def _maintain(self, user_id: str, vectors, index: VectorIndex = None):
+        """Start background (re)training and saving of a user's index when due"""
+        if index is None:
+            index = self.index
+        prefix = "" if index is self.index else "chunk "
+        if vectors.needs_training():
+            self._spawn((prefix + "train", user_id), lambda: self._train(user_id, vectors, index))
+        if index.needs_save(user_id):
+            self._spawn((prefix + "save", user_id), lambda: self._save(user_id, index))
+
+    def _spawn(self, key: tuple, make_coro):
+        if key in self._jobs:
+            return
+
+        def done(task: asyncio.Task):
+            self._jobs.pop(key, None)
+            if not task.cancelled() and task.exception() is not None:
+                print(f"Vector index {key[0]} failed for user {key[1]}: {task.exception()}")
+
+        task = spawn_detached(make_coro())
+        self._jobs[key] = task
+        task.add_done_callback(done)
+
+    async def _train(self, user_id: str, vectors, index: VectorIndex):
+        # k-means runs on a snapshot in the I/O pool; installing it is quick
+        centroids, ids, assign = await run_io(vectors.train_job())
+        if index.get(user_id) is vectors:
+            vectors.install_training(centroids, ids, assign)
+            index.trainings += 1
+            # Save the trained quantizer with the next save job
+            index.changed(user_id, index.save_every)
+            self._maintain(user_id, vectors, index)
+
+    async def _save(self, user_id: str, index: VectorIndex = None):
+        if index is None:
+            index = self.index
+        job = index.save_job(user_id)
+        while job is not None:
+            await run_io(job)
+            # Evicted during the write: save the changes made since the snapshot too
+            job = index.save_job(user_id) if index.is_parked(user_id) else None
+        index.release(user_id)
+
+    def _on_evicted(self, user_id: str, vectors):
+        """Summary index evict listener: reload from disk on next use, saving unsaved changes first"""
+        self._disk_checked.discard(user_id)
+        self._summary_hashes.pop(user_id, None)
+        if self.index.is_parked(user_id):
+            self._spawn(("save", user_id), lambda: self._save(user_id))
+
+    async def close(self):
+        """Finish index jobs and save indexes with unsaved changes (app shutdown)"""
+        if self._jobs:
+            await asyncio.gather(*list(self._jobs.values()), return_exceptions=True)
+        await self.batcher.close()
+        for user_id in self.index.dirty_users():
+            try:
+                await self._save(user_id)
+            except Exception as e:
+                print(f"Vector index save failed for user {user_id}: {e}")
+        if self.chunks is not None:
+            await self.chunks.close()
+
+    def on_turns_saved(self, user_id: str, conversation_id: str):
+        """Store turn listener: chunk and embed the new turns in the background"""
+        if self.chunks is None:
+            return
+        self._unchunked.add((user_id, conversation_id))
+        self._spawn(("chunking", user_id, conversation_id), lambda: self._chunk_turns(user_id, conversation_id))
+
+    async def _chunk_turns(self, user_id: str, conversation_id: str):
+        # Turns saved while a pass runs are picked up by another pass
+        key = (user_id, conversation_id)
+        while key in self._unchunked:
+            self._unchunked.discard(key)
+            await self._chunk_pass(user_id, conversation_id)
+
+    async def _chunk_pass(self, user_id: str, conversation_id: str):
+        """Embed and index the turns of a conversation not yet in complete chunks"""
+        chunks = self.chunks
+        await chunks.ensure_loaded(user_id)
+        epoch = chunks.epoch(user_id, conversation_id)
+        start = chunks.next_turn(user_id, conversation_id)
+        turns = await self.store.get_turns_since(user_id, conversation_id, start)
+        if not turns:
+            return
+
+        # Embedded together, so they share batch calls
+        pieces = chunks.make_chunks(start, turns)
+        embeddings = await asyncio.gather(*[self._get_embedding(text) for _, _, text in pieces])
+        for (chunk_start, chunk_end, text), embedding in zip(pieces, embeddings):
+            if embedding is None:
+                # Retried with the next saved turn
+                break
+            if not chunks.add(user_id, conversation_id, chunk_start, chunk_end, embedding, text, epoch):
+                break
+
+        vectors = chunks.vectors.get(user_id)
+        if vectors is not None:
+            self._maintain(user_id, vectors, chunks.vectors)
+
+    async def _catch_up_chunks(self, user_id: str, conversation_id: str):
+        """Index any turns of a conversation not chunked yet (e.g. saved before a restart)"""
+        self.on_turns_saved(user_id, conversation_id)
+        task = self._jobs.get(("chunking", user_id, conversation_id))
+        if task is not None:
+            # The pass outlives a cancelled caller; its errors are logged by _spawn
+            await asyncio.wait([task])
+
+    async def _load_summary_vector(self, user_id: str, conversation_id: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        summary = await self.store.get_summary(user_id, conversation_id)
+        if not summary:
+            return None, None
+        # Normally stored when the summary was saved
+        return summary, await self._get_embedding(summary, persist=True)
+
+    async def index_summary(self, user_id: str, conversation_id: str, summary: str):
+        """Embed a newly saved summary, persist the vector and update the user's index"""
+        embedding = await self._get_embedding(summary, persist=True)
+        if embedding is not None:
+            self.index.upsert(user_id, conversation_id, embedding, summary)
+            vectors = self.index.get(user_id)
+            if vectors is not None:
+                if conversation_id in vectors:
+                    self._indexed_hashes(user_id, vectors)[conversation_id] = content_hash(summary)
+                self._maintain(user_id, vectors)
+
+    def forget_conversation(self, user_id: str, conversation_id: str):
+        """Drop a cleared conversation from the user's indexes"""
+        self.index.remove(user_id, conversation_id)
+        entry = self._summary_hashes.get(user_id)
+        if entry is not None:
+            entry[1].pop(conversation_id, None)
+        if self.chunks is not None:
+            self.chunks.forget(user_id, conversation_id)
+
+    async def _get_embedding(self, text: str, persist: bool = False) -> Optional[np.ndarray]:
         """
         Get embedding for text using Gemini Embedding API
+
+        Returns a read-only float32 array shared with the embedding cache.
+        With persist=True (summaries), the vector is also looked up in and
+        saved to the memory store, keyed by content hash and model, so it
+        survives restarts and is shared between workers.
         """
-        # Check cache first
-        if text in self.embeddings_cache:
-            return self.embeddings_cache[text]
+        key = content_hash(text)
 
-        api_key = os.getenv("GOOGLE_API_KEY")
+        # Check cache first
+        cached = self.embeddings_cache.get(self.embedding_model, key)
+        if cached is not None:
+            return cached
+
+        if persist:
+            try:
+                stored = await self.store.get_embedding(key, self.embedding_model)
+            except Exception as e:
+                print(f"Error loading stored embedding: {e}")
+                stored = None
+            if stored:
+                return self.embeddings_cache.set(self.embedding_model, key, stored)
+
+        api_key = "mock-key" if self.use_mock else os.getenv("GOOGLE_API_KEY")
         if not api_key:
             return None
 
         try:
-            async with httpx.AsyncClient(timeout=15) as client:
+            # Concurrent requests for the same text share one upstream call
+            embedding = await get_single_flight("embedding").do(
+                (self.embedding_model, text),
+                lambda: self.batcher.embed(text)
+            )
+
+        except Exception as e:
+            print(f"Error getting embedding: {e}")
+            return None
+
+        if persist and embedding:
+            try:
+                await self.store.save_embedding(key, self.embedding_model, embedding)
+            except Exception as e:
+                print(f"Error storing embedding: {e}")
+
+        # Cache it
+        return self.embeddings_cache.set(self.embedding_model, key, embedding)
+
+    async def _fetch_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Call the Gemini batchEmbedContents endpoint for a batch of texts"""
+        api_key = "mock-key" if self.use_mock else os.getenv("GOOGLE_API_KEY")
+        client = get_http_client()
+        # Embeddings are background traffic with their own limiter scope
+        async with get_rate_limiter().slot(
+            "gemini", self.embedding_model, "background", kind="embedding"
+        ) as permit:
+            with track_request():
                 response = await client.post(
                     self.gemini_embedding_endpoint,
                     params={"key": api_key},
                     headers={"Content-Type": "application/json"},
                     json={
-                        "content": {
-                            "parts": [{"text": text}]
-                        }
-                    }
+                        "requests": [
+                            {
+                                "model": self.embedding_model,
+                                "content": {"parts": [{"text": text}]}
+                            }
+                            for text in texts
+                        ]
+                    },
+                    timeout=get_timeout("embedding")
                 )
+            permit.observe(response)
 
-                response.raise_for_status()
-                data = response.json()
-
-                embedding = data.get("embedding", {}).get("values", [])
-
-                # Cache it
-                self.embeddings_cache[text] = embedding
+        response.raise_for_status()
+        data = response.json()
 
-                return embedding
-
-        except Exception as e:
-            print(f"Error getting embedding: {e}")
-            return None
-
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
-        if not vec1 or not vec2 or len(vec1) != len(vec2):
-            return 0.0
-
-        dot_product = sum(a * b for a, b in zip(vec1, vec2))
-        magnitude1 = sum(a * a for a in vec1) ** 0.5
-        magnitude2 = sum(b * b for b in vec2) ** 0.5
-
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0
-
-        return dot_product / (magnitude1 * magnitude2)
+        return [item.get("values", []) for item in data.get("embeddings", [])]
 
     async def get_conversation_context(
         self,
@@ -160,7 +402,20 @@ class MemoryRetriever:
     ) -> Optional[str]:
         """
         Get the most relevant context from a specific conversation
+
+        With the chunk index this is a lookup of the best-matching chunk
+        (a past exchange); turns not chunked yet are indexed first.
+        Without it (MEMORY_CHUNK_INDEX=0), every turn is embedded and
+        the best single turn returned.
         """
+        if self.chunks is not None:
+            await self._catch_up_chunks(user_id, conversation_id)
+            query_emb = await self._get_embedding(query)
+            if query_emb is None:
+                return None
+            hits = self.chunks.search(user_id, query_emb, 1, conversation_id=conversation_id)
+            return hits[0][1] if hits else None
+
         turns = await self.store.get_conversation_history(user_id, conversation_id)
 
         if not turns:
@@ -169,23 +424,40 @@ class MemoryRetriever:
         # Get embeddings for query and all turns
         query_emb = await self._get_embedding(query)
 
-        if not query_emb:
+        query_unit = normalize(query_emb) if query_emb is not None else None
+        if query_unit is None:
             return None
 
         best_match = None
         best_similarity = -1
 
-        for turn in turns:
-            turn_text = turn.get("content", "")
-            turn_emb = await self._get_embedding(turn_text)
+        # Requested together so they share batch calls
+        turn_texts = [turn.get("content", "") for turn in turns]
+        turn_embs = await asyncio.gather(*[self._get_embedding(text) for text in turn_texts])
 
-            if not turn_emb:
+        for turn_text, turn_emb in zip(turn_texts, turn_embs):
+            turn_unit = normalize(turn_emb) if turn_emb is not None and len(turn_emb) == len(query_unit) else None
+            if turn_unit is None:
                 continue
 
-            similarity = self._cosine_similarity(query_emb, turn_emb)
+            similarity = float(np.dot(query_unit, turn_unit))
 
             if similarity > best_similarity:
                 best_similarity = similarity
                 best_match = turn_text
 
         return best_match
+
+
+def _index_dir(store) -> Optional[Path]:
+    """Where vector indexes are saved: MEMORY_VECTOR_INDEX_DIR, else next to the store's data"""
+    configured = os.getenv("MEMORY_VECTOR_INDEX_DIR")
+    if configured is not None:
+        return Path(configured) if configured.strip() else None
+    storage_path = getattr(store, "storage_path", None)
+    if storage_path is not None:
+        return Path(storage_path) / "vector_index"
+    pool = getattr(store, "pool", None)
+    if pool is not None:
+        return Path(pool.path).parent / "vector_index"
+    return None
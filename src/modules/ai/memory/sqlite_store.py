@@ -0,0 +1,289 @@
+"""
+SQLite Memory Store - MemoryStore-compatible backend on SQLite (WAL)
+Selected with MEMORY_BACKEND=sqlite; schema lives in db/model.py
+"""
+import json
+from typing import Callable, List, Dict, Optional
+from datetime import datetime
+from db.session import get_sqlite_pool
+from modules.ai.memory.io_pool import run_io
+from modules.ai.memory.vectors import content_hash, pack_float32, unpack_float32
+
+
+class SQLiteMemoryStore:
+    """
+    Same async API as MemoryStore, backed by one SQLite database
+
+    Listing conversations, counting turns and reading the last N turns
+    are indexed queries instead of directory globs and file parses.
+    Queries run on the memory I/O pool, like the file store's I/O.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.pool = get_sqlite_pool(db_path)
+        # Called after turns are saved (see add_turn_listener)
+        self.turn_listeners: List[Callable[[str, str], None]] = []
+
+    async def save_turn(
+        self,
+        user_id: str,
+        conversation_id: str,
+        message: str,
+        role: str
+    ):
+        """Save a conversation turn"""
+        await self.save_turns(user_id, conversation_id, [{"role": role, "content": message}])
+
+    async def save_turns(
+        self,
+        user_id: str,
+        conversation_id: str,
+        turns: List[Dict]
+    ):
+        """Save several turns of one conversation in a single transaction"""
+        await run_io(self._save_turns_sync, str(user_id), str(conversation_id), turns)
+        if turns:
+            self._notify_turns(user_id, conversation_id)
+
+    def add_turn_listener(self, listener: Callable[[str, str], None]):
+        """Call listener(user_id, conversation_id) after turns are saved (on the event loop)"""
+        self.turn_listeners.append(listener)
+
+    def _notify_turns(self, user_id: str, conversation_id: str):
+        for listener in self.turn_listeners:
+            try:
+                listener(str(user_id), str(conversation_id))
+            except Exception as e:
+                print(f"Turn listener failed for {user_id}/{conversation_id}: {e}")
+
+    def _save_turns_sync(self, user_id: str, conversation_id: str, turns: List[Dict]):
+        if not turns:
+            return
+        now = datetime.utcnow().isoformat()
+
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO conversations (user_id, conversation_id, turn_count, created_at) "
+                "VALUES (?, ?, 0, ?)",
+                (user_id, conversation_id, now)
+            )
+            turn_count = conn.execute(
+                "SELECT turn_count FROM conversations WHERE user_id = ? AND conversation_id = ?",
+                (user_id, conversation_id)
+            ).fetchone()[0]
+
+            rows = []
+            for offset, turn in enumerate(turns, start=1):
+                rows.append((
+                    user_id, conversation_id, turn_count + offset,
+                    turn["role"], turn["content"], turn.get("timestamp") or now
+                ))
+            conn.executemany(
+                "INSERT INTO turns (user_id, conversation_id, seq, role, content, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute(
+                "UPDATE conversations SET turn_count = ?, last_updated = ? "
+                "WHERE user_id = ? AND conversation_id = ?",
+                (turn_count + len(rows), rows[-1][5], user_id, conversation_id)
+            )
+
+    async def get_conversation_history(
+        self,
+        user_id: str,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """Get conversation history (the last `limit` turns if given)"""
+        return await run_io(self._get_conversation_history_sync, str(user_id), str(conversation_id), limit)
+
+    def _get_conversation_history_sync(
+        self,
+        user_id: str,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        with self.pool.connection() as conn:
+            if limit:
+                rows = conn.execute(
+                    "SELECT role, content, timestamp FROM turns "
+                    "WHERE user_id = ? AND conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                    (user_id, conversation_id, limit)
+                ).fetchall()
+                rows.reverse()
+            else:
+                rows = conn.execute(
+                    "SELECT role, content, timestamp FROM turns "
+                    "WHERE user_id = ? AND conversation_id = ? ORDER BY seq",
+                    (user_id, conversation_id)
+                ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    async def get_turns_since(
+        self,
+        user_id: str,
+        conversation_id: str,
+        start: int
+    ) -> List[Dict]:
+        """Turns from position `start` on (0 = the first turn; seq is 1-based)"""
+        return await run_io(self._get_turns_since_sync, str(user_id), str(conversation_id), start)
+
+    def _get_turns_since_sync(self, user_id: str, conversation_id: str, start: int) -> List[Dict]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT role, content, timestamp FROM turns "
+                "WHERE user_id = ? AND conversation_id = ? AND seq > ? ORDER BY seq",
+                (user_id, conversation_id, start)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def save_summary(
+        self,
+        user_id: str,
+        conversation_id: str,
+        summary: str
+    ):
+        """Save conversation summary (replaces any previous state)"""
+        await run_io(self._save_summary_sync, str(user_id), str(conversation_id), summary)
+
+    def _save_summary_sync(self, user_id: str, conversation_id: str, summary: str):
+        now = datetime.utcnow().isoformat()
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries "
+                "(user_id, conversation_id, summary, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, '{}', ?, NULL)",
+                (user_id, conversation_id, summary, now)
+            )
+
+    async def get_summary(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Optional[str]:
+        """Get conversation summary"""
+        return await run_io(self._get_summary_sync, str(user_id), str(conversation_id))
+
+    def _get_summary_sync(self, user_id: str, conversation_id: str) -> Optional[str]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT summary FROM summaries WHERE user_id = ? AND conversation_id = ?",
+                (user_id, conversation_id)
+            ).fetchone()
+        return row["summary"] if row else None
+
+    async def get_conversation_state(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Dict:
+        """Get conversation state (summary, metadata, etc.)"""
+        summary = await self.get_summary(user_id, conversation_id)
+
+        return {
+            "summary": summary,
+            "consolidation_count": 0
+        }
+
+    async def update_conversation_state(
+        self,
+        user_id: str,
+        conversation_id: str,
+        state: Dict
+    ):
+        """Update conversation state"""
+        await run_io(self._update_conversation_state_sync, str(user_id), str(conversation_id), state)
+
+    def _update_conversation_state_sync(self, user_id: str, conversation_id: str, state: Dict):
+        now = datetime.utcnow().isoformat()
+        state = dict(state)
+        has_summary = "summary" in state
+        summary = state.pop("summary", None)
+
+        with self.pool.transaction() as conn:
+            row = conn.execute(
+                "SELECT summary, state FROM summaries WHERE user_id = ? AND conversation_id = ?",
+                (user_id, conversation_id)
+            ).fetchone()
+
+            merged = json.loads(row["state"]) if row else {}
+            merged.update(state)
+            if not has_summary:
+                summary = row["summary"] if row else None
+
+            conn.execute(
+                "INSERT INTO summaries (user_id, conversation_id, summary, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, conversation_id) DO UPDATE SET "
+                "summary = excluded.summary, state = excluded.state, updated_at = excluded.updated_at",
+                (user_id, conversation_id, summary, json.dumps(merged), now)
+            )
+
+    async def clear_conversation(
+        self,
+        user_id: str,
+        conversation_id: str
+    ):
+        """Clear all memory for a conversation"""
+        await run_io(self._clear_conversation_sync, str(user_id), str(conversation_id))
+
+    def _clear_conversation_sync(self, user_id: str, conversation_id: str):
+        with self.pool.transaction() as conn:
+            for table in ("turns", "conversations", "summaries"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE user_id = ? AND conversation_id = ?",
+                    (user_id, conversation_id)
+                )
+
+    async def get_embedding(self, content_hash: str, model: str) -> Optional[List[float]]:
+        """Get a stored embedding (None if this text/model was never stored)"""
+        return await run_io(self._get_embedding_sync, content_hash, model)
+
+    def _get_embedding_sync(self, content_hash: str, model: str) -> Optional[List[float]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT vector FROM embeddings WHERE content_hash = ? AND model = ?",
+                (content_hash, model)
+            ).fetchone()
+        return unpack_float32(row["vector"]) if row else None
+
+    async def save_embedding(self, content_hash: str, model: str, vector: List[float]):
+        """Store an embedding as a float32 blob"""
+        await run_io(self._save_embedding_sync, content_hash, model, vector)
+
+    def _save_embedding_sync(self, content_hash: str, model: str, vector: List[float]):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (content_hash, model, dim, vector, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, model, len(vector), pack_float32(vector), datetime.utcnow().isoformat())
+            )
+
+    async def close(self):
+        """Nothing buffered here; writes are durable when they return"""
+
+    async def get_all_conversations(self, user_id: str) -> List[Dict]:
+        """Get all conversations for a user"""
+        return await run_io(self._get_all_conversations_sync, str(user_id))
+
+    def _get_all_conversations_sync(self, user_id: str) -> List[Dict]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT c.conversation_id, c.turn_count, c.last_updated, s.summary "
+                "FROM conversations c LEFT JOIN summaries s "
+                "ON s.user_id = c.user_id AND s.conversation_id = c.conversation_id "
+                "WHERE c.user_id = ?",
+                (user_id,)
+            ).fetchall()
+        return [
+            {
+                "conversation_id": row["conversation_id"],
+                "turn_count": row["turn_count"],
+                "last_updated": row["last_updated"],
+                "has_summary": bool(row["summary"]),
+                "summary_hash": content_hash(row["summary"]) if row["summary"] else None
+            }
+            for row in rows
+        ]
@@ -11,6 +11,9 @@ class Summarizer:
     Handles conversation summarization for long-term memory
     """
 
+    # Summaries are background work: queue behind interactive traffic
+    LLM_OPTIONS = {"priority": "background"}
+
     SUMMARIZATION_PROMPT = """You are a conversation summarizer for an AI assistant.
 
 Your task: Create a concise summary of the conversation below that captures:
@@ -46,7 +49,7 @@ Summary:"""
         # Call LLM for summarization
         summary = await call_llm([
             {"role": "user", "content": prompt}
-        ])
+        ], options=self.LLM_OPTIONS)
 
         return summary.strip()
 
@@ -75,7 +78,7 @@ Updated summary:"""
 
         updated_summary = await call_llm([
             {"role": "user", "content": prompt}
-        ])
+        ], options=self.LLM_OPTIONS)
 
         return updated_summary.strip()
 
@@ -109,7 +112,7 @@ Key facts:"""
 
         response = await call_llm([
             {"role": "user", "content": prompt}
-        ])
+        ], options=self.LLM_OPTIONS)
 
         # Parse bullet points
         facts = [
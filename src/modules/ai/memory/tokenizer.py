@@ -0,0 +1,188 @@
+"""
+Tokenizer - Offline token counting for context budgeting
+Pluggable backends with per-content memoization of counts
+
+Backends (TOKENIZER env):
+- "auto" (default): "tiktoken" when available, otherwise "bpe"
+- "tiktoken": exact cl100k_base counts if the optional tiktoken package
+  is installed (falls back to "bpe" otherwise)
+- "bpe": regex pre-tokenizer + BPE-style piece costs. Counts are an
+  APPROXIMATION of Gemini/Grok (cl100k-like) counts on prose and code,
+  not vocabulary-exact; see benchmarks/tokenizer_calibration.py
+- "heuristic": the legacy chars * 0.3 estimate
+"""
+import os
+import re
+import abc
+import hashlib
+from typing import Dict, List, Optional
+from shared.lru_cache import BoundedLRU
+
+# GPT-style pre-tokenization: contractions, words, numbers, punctuation runs, whitespace
+_PRETOKENIZE = re.compile(
+    r"""'(?:[sdmt]|ll|ve|re)| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+(?!\S)|\s+""",
+    re.IGNORECASE,
+)
+_NON_ASCII_WORD = re.compile(r"[^\x00-\x7f]")
+_CAMEL_HUMP = re.compile(r"[A-Z][a-z]+")
+
+# Common words/fragments that are single tokens in BPE vocabularies.
+# Anything else is split into sub-word pieces of roughly 4 characters.
+_SINGLE_TOKEN_WORDS = frozenset("""
+the of and to in is it that for on with as are be this was by or an at from not
+but have has can will if you your we they he she his her its their there what
+which when where who how why all any each more most other some such no only own
+same so than too very just also into over after before about between through
+use used using example first then next here one two three new like get set make
+value values type types function functions return returns class classes object
+objects method methods variable variables array arrays list lists string strings
+number numbers key keys index data code file files name names error errors true
+false null none self this const let var def import from async await promise
+callback closure scope loop loops while for else elif try catch except finally
+throw raise new delete print console log map filter reduce length size count
+python javascript java typescript react node html css sql api json http request
+response server client user users memory context model question answer learn
+state props component module package test tests run build input output result
+""".split())
+
+MESSAGE_OVERHEAD_TOKENS = 3  # role/turn markers added by chat formats
+
+
+class Tokenizer(abc.ABC):
+    """Interface: count tokens in a piece of text"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+
+
+class HeuristicTokenizer(Tokenizer):
+    """Legacy character-ratio estimate"""
+
+    name = "heuristic"
+
+    def __init__(self, tokens_per_char: float = 0.3):
+        self.tokens_per_char = tokens_per_char
+
+    def count(self, text: str) -> int:
+        return int(len(text) * self.tokens_per_char)
+
+
+class BPEApproxTokenizer(Tokenizer):
+    """
+    Approximate BPE token counts without a vocabulary download
+
+    Not a real tokenizer: there is no vocabulary, so counts are estimates
+    (benchmarks/tokenizer_calibration.py reports the error). Used only when
+    tiktoken is unavailable or TOKENIZER=bpe is set explicitly.
+    Text is pre-tokenized like GPT/Gemini tokenizers; each piece then
+    costs 1 token if it is a common word, otherwise one token per ~4
+    letters, per 3 digits, per 1-2 punctuation characters, and per
+    whitespace run (indentation is cheap, as in real BPE vocabularies).
+    """
+
+    name = "bpe"
+
+    def count(self, text: str) -> int:
+        total = 0
+        for piece in _PRETOKENIZE.findall(text):
+            total += self._piece_cost(piece)
+        return total
+
+    @staticmethod
+    def _piece_cost(piece: str) -> int:
+        stripped = piece.strip()
+        if not stripped:
+            # Whitespace runs: newlines and indentation merge aggressively
+            return 1 if len(piece) <= 8 else 1 + (len(piece) - 8) // 8
+
+        if _NON_ASCII_WORD.search(stripped):
+            # Non-Latin scripts average ~1 token per 1-2 characters
+            return max(1, (len(stripped.encode("utf-8")) + 2) // 3)
+
+        if stripped.isalpha():
+            if stripped.lower() in _SINGLE_TOKEN_WORDS or len(stripped) <= 4:
+                return 1
+            # camelCase / snake-ish identifiers split on case changes
+            humps = len(_CAMEL_HUMP.findall(stripped))
+            return max(humps, (len(stripped) + 3) // 4)
+
+        if stripped.isdigit():
+            return 1
+
+        # Punctuation/operator runs: common pairs like "()", "=>", "==" merge
+        return max(1, (len(stripped) + 1) // 2)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Exact cl100k_base counts via the optional tiktoken package"""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+def create_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    """Create a tokenizer backend by name (defaults to TOKENIZER env)"""
+    name = (name or os.getenv("TOKENIZER") or "auto").strip().lower()
+    if name == "heuristic":
+        return HeuristicTokenizer()
+    if name == "bpe":
+        return BPEApproxTokenizer()
+    try:
+        return TiktokenTokenizer(os.getenv("TIKTOKEN_ENCODING", "cl100k_base"))
+    except Exception as e:
+        # Missing package, or the encoding file can't be fetched offline
+        print(f"TOKENIZER={name} tiktoken unavailable ({e}); using approximate bpe counts")
+    return BPEApproxTokenizer()
+
+
+class TokenCounter:
+    """
+    Counts tokens for messages, memoized per content hash
+
+    One shared instance is reused by build_context, _fit_recent_messages
+    and the process_conversation metadata, so each distinct message is
+    tokenized once.
+    """
+
+    def __init__(self, tokenizer: Optional[Tokenizer] = None, max_entries: int = 20000):
+        self.tokenizer = tokenizer or create_tokenizer()
+        self._cache = BoundedLRU(max_entries=max_entries)
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        tokens = self._cache.get(key)
+        if tokens is None:
+            tokens = self.tokenizer.count(text)
+            self._cache.set(key, tokens)
+        return tokens
+
+    def count_message(self, message: Dict) -> int:
+        return self.count_text(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(self.count_message(msg) for msg in messages)
+
+    def stats(self) -> Dict:
+        return {"tokenizer": self.tokenizer.name, **self._cache.stats()}
+
+
+_token_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """Get or create the shared token counter"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter
@@ -0,0 +1,708 @@
+"""
+Vector Index - Per-user indexes of pre-normalized embeddings
+(conversation summaries, and turn chunks - see chunk_index.py)
+Pluggable backends behind one interface (upsert / remove / search):
+
+- exact: float32 matrix, one matrix-vector product + argpartition top-k
+- ivf:   exact storage plus a k-means coarse quantizer (IVF-Flat); a
+         query scores only the MEMORY_IVF_NPROBE closest lists. Users
+         below MEMORY_IVF_MIN_VECTORS are searched exactly.
+- hnsw:  graph index from the optional hnswlib package
+
+MEMORY_VECTOR_INDEX picks the backend (default ivf). Indexes are
+persisted per user under {storage}/vector_index/ so a restart doesn't
+rebuild them from every summary.
+"""
+import os
+import json
+import pickle
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Collection, Dict, List, Optional, Tuple, Union
+import numpy as np
+
+# An item id, or several, to leave out of search results
+Exclude = Optional[Union[str, Collection[str]]]
+
+# Rough per-item cost of ids, row maps and Python string headers
+_ITEM_OVERHEAD_BYTES = 128
+
+
+def normalize(vector) -> Optional[np.ndarray]:
+    """Unit-length float32 copy of a vector (None for a zero vector)"""
+    values = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(values))
+    if norm == 0.0 or not np.isfinite(norm):
+        return None
+    return values / norm
+
+
+def _pack_strings(values: List[str]) -> np.ndarray:
+    # One JSON blob instead of a fixed-width unicode array (summaries vary a lot in length)
+    return np.frombuffer(json.dumps(values).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(blob: np.ndarray) -> List[str]:
+    return json.loads(blob.tobytes().decode("utf-8"))
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+class UserVectors:
+    """
+    Exact index: summary embeddings of one user's conversations
+
+    Rows live in a preallocated float32 matrix that doubles when full;
+    removing a row moves the last row into its place, so the first
+    `size` rows are always the live ones.
+    """
+
+    kind = "exact"
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.dim = dim
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.text_bytes = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the index"""
+        return self.matrix.nbytes + self.text_bytes + _ITEM_OVERHEAD_BYTES * self.size
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.rows
+
+    def text(self, item_id: str) -> Optional[str]:
+        row = self.rows.get(item_id)
+        return None if row is None else self.texts[row]
+
+    def upsert(self, item_id: str, vector, text: str) -> bool:
+        """Insert or replace a row; returns False for unusable vectors"""
+        if len(vector) != self.dim:
+            return False
+        unit = normalize(vector)
+        if unit is None:
+            return False
+
+        row = self.rows.get(item_id)
+        if row is None:
+            if self.size == len(self.matrix):
+                self._grow(len(self.matrix) * 2)
+            row = self.size
+            self.size += 1
+            self.rows[item_id] = row
+            self.ids.append(item_id)
+            self.texts.append(text)
+        else:
+            self.text_bytes -= len(self.texts[row])
+            self.texts[row] = text
+        self.text_bytes += len(text)
+
+        self.matrix[row] = unit
+        self._row_updated(row)
+        return True
+
+    def _grow(self, capacity: int):
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self.size] = self.matrix[:self.size]
+        self.matrix = grown
+
+    def _row_updated(self, row: int):
+        """Hook for subclasses keeping per-row data"""
+
+    def _row_moved(self, source: int, target: int):
+        """Hook for subclasses keeping per-row data"""
+
+    def remove(self, item_id: str):
+        row = self.rows.pop(item_id, None)
+        if row is None:
+            return
+
+        self.text_bytes -= len(self.texts[row])
+        last = self.size - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.texts[row] = self.texts[last]
+            self.rows[self.ids[row]] = row
+            self._row_moved(last, row)
+        self.ids.pop()
+        self.texts.pop()
+        self.size = last
+
+    def _query(self, query, exclude: Exclude) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        unit = normalize(query) if len(query) == self.dim else None
+        excluded = None
+        if exclude is not None:
+            ids = [exclude] if isinstance(exclude, str) else exclude
+            excluded = np.array([self.rows[i] for i in ids if i in self.rows], dtype=np.int64)
+        return unit, excluded
+
+    def search(self, query, k: int, exclude: Exclude = None) -> List[Tuple[str, str, float]]:
+        """Top-k rows by cosine similarity: [(item_id, text, similarity)]"""
+        unit, excluded = self._query(query, exclude)
+        if unit is None or self.size == 0 or k <= 0:
+            return []
+        return self._search_rows(unit, k, np.arange(self.size), excluded)
+
+    def search_items(self, query, item_ids: Collection[str], k: int) -> List[Tuple[str, str, float]]:
+        """Exact top-k among the given items only (e.g. one conversation's chunks)"""
+        unit = normalize(query) if len(query) == self.dim else None
+        # Sorted, so a full set of rows matches _search_rows' whole-matrix case
+        rows = np.sort(np.array([self.rows[i] for i in item_ids if i in self.rows], dtype=np.int64))
+        if unit is None or k <= 0:
+            return []
+        return self._search_rows(unit, k, rows, None)
+
+    def _search_rows(self, unit: np.ndarray, k: int, rows: np.ndarray, excluded: Optional[np.ndarray]):
+        if excluded is not None and len(excluded):
+            rows = rows[~np.isin(rows, excluded)]
+        if len(rows) == 0:
+            return []
+        if len(rows) == self.size:
+            scores = self.matrix[:self.size] @ unit
+        else:
+            scores = self.matrix[rows] @ unit
+        top = _top_k(scores, min(k, len(rows)))
+        return [(self.ids[rows[i]], self.texts[rows[i]], float(scores[i])) for i in top]
+
+    def needs_training(self) -> bool:
+        return False
+
+    def export_items(self, item_ids: Collection[str]) -> Tuple[List[str], List[str], np.ndarray]:
+        """Copy out (ids, texts, unit vectors) of the given items that are present"""
+        rows = [self.rows[i] for i in item_ids if i in self.rows]
+        return [self.ids[r] for r in rows], [self.texts[r] for r in rows], self.matrix[rows].copy()
+
+    # Persistence: snapshot on the event loop, write on the I/O pool
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {
+            "kind": np.array(self.kind),
+            "dim": np.array(self.dim),
+            "ids": _pack_strings(self.ids),
+            "texts": _pack_strings(self.texts),
+            "matrix": self.matrix[:self.size].copy(),
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, np.ndarray]) -> "UserVectors":
+        ids = _unpack_strings(state["ids"])
+        vectors = cls(int(state["dim"]), capacity=max(16, len(ids)))
+        vectors.matrix[:len(ids)] = state["matrix"]
+        vectors.size = len(ids)
+        vectors.ids = ids
+        vectors.texts = _unpack_strings(state["texts"])
+        vectors.rows = {item_id: row for row, item_id in enumerate(ids)}
+        vectors.text_bytes = sum(len(text) for text in vectors.texts)
+        return vectors
+
+
+def _kmeans(data: np.ndarray, nlist: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns unit centroids (at most nlist x dim)"""
+    rng = np.random.default_rng(seed)
+    # Can't pick more distinct starting points than there are vectors
+    nlist = min(nlist, len(data))
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        norms = np.linalg.norm(sums, axis=1)
+        # Empty lists keep their previous centroid
+        filled = norms > 0
+        centroids[filled] = sums[filled] / norms[filled, None]
+    return centroids
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    out = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk):
+        out[start:start + chunk] = np.argmax(data[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+class IVFVectors(UserVectors):
+    """
+    IVF-Flat index: exact vectors grouped by a k-means coarse quantizer
+
+    Inserts are assigned to their nearest centroid right away. Training
+    (k-means on a sample, then assigning every row) runs on a snapshot
+    off the event loop, once the user reaches min_vectors and again
+    whenever the index has grown 4x since the last training; searches
+    are exact until the first training is installed.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim: int, capacity: int = 16, nprobe: int = None, min_vectors: int = None):
+        super().__init__(dim, capacity)
+        self.assign = np.full(capacity, -1, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self.nprobe = nprobe or int(os.getenv("MEMORY_IVF_NPROBE", "16"))
+        self.min_vectors = min_vectors or int(os.getenv("MEMORY_IVF_MIN_VECTORS", "4096"))
+
+    def _grow(self, capacity: int):
+        super()._grow(capacity)
+        grown = np.full(capacity, -1, dtype=np.int32)
+        grown[:self.size] = self.assign[:self.size]
+        self.assign = grown
+
+    def _row_updated(self, row: int):
+        if self.centroids is not None:
+            self.assign[row] = int(np.argmax(self.centroids @ self.matrix[row]))
+
+    def _row_moved(self, source: int, target: int):
+        self.assign[target] = self.assign[source]
+
+    def nbytes(self) -> int:
+        centroids = self.centroids.nbytes if self.centroids is not None else 0
+        return super().nbytes() + self.assign.nbytes + centroids
+
+    def search(self, query, k: int, exclude: Exclude = None) -> List[Tuple[str, str, float]]:
+        unit, excluded = self._query(query, exclude)
+        if unit is None or self.size == 0 or k <= 0:
+            return []
+        if self.centroids is None:
+            return self._search_rows(unit, k, np.arange(self.size), excluded)
+
+        probe = _top_k(self.centroids @ unit, min(self.nprobe, len(self.centroids)))
+        rows = np.flatnonzero(np.isin(self.assign[:self.size], probe))
+        return self._search_rows(unit, k, rows, excluded)
+
+    def needs_training(self) -> bool:
+        if self.centroids is None:
+            return self.size >= self.min_vectors
+        return self.size >= 4 * self.trained_size
+
+    def train_job(self) -> Callable[[], Tuple[np.ndarray, List[str], np.ndarray]]:
+        """
+        Snapshot the vectors and return a blocking job for the I/O pool
+
+        The job returns (centroids, ids, assignments); pass them to
+        install_training back on the event loop.
+        """
+        data = self.matrix[:self.size].copy()
+        ids = list(self.ids)
+        # MEMORY_IVF_MIN_VECTORS may be set below the 16-list floor
+        nlist = min(len(data), int(np.clip(np.sqrt(len(data)), 16, 4096)))
+
+        def job():
+            rng = np.random.default_rng(0)
+            # faiss-style sample: plenty of points per list, bounded cost
+            sample_size = min(len(data), 64 * nlist)
+            sample = data[rng.choice(len(data), size=sample_size, replace=False)]
+            centroids = _kmeans(sample, nlist, iterations=10)
+            return centroids, ids, _assign(data, centroids)
+
+        return job
+
+    def install_training(self, centroids: np.ndarray, ids: List[str], assign: np.ndarray):
+        """Adopt a finished training; rows added since the snapshot are assigned now"""
+        by_id = dict(zip(ids, assign.tolist()))
+        self.centroids = centroids
+        self.trained_size = len(ids)
+        for row in range(self.size):
+            known = by_id.get(self.ids[row])
+            if known is None:
+                self._row_updated(row)
+            else:
+                self.assign[row] = known
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        state = super().snapshot()
+        state["assign"] = self.assign[:self.size].copy()
+        state["trained_size"] = np.array(self.trained_size)
+        if self.centroids is not None:
+            state["centroids"] = self.centroids.copy()
+        return state
+
+    @classmethod
+    def restore(cls, state: Dict[str, np.ndarray]) -> "IVFVectors":
+        vectors = super().restore(state)
+        vectors.assign = np.full(len(vectors.matrix), -1, dtype=np.int32)
+        if "centroids" in state:
+            vectors.centroids = state["centroids"]
+            vectors.trained_size = int(state["trained_size"])
+            vectors.assign[:vectors.size] = state["assign"]
+        return vectors
+
+
+class HNSWVectors:
+    """
+    HNSW graph index from the optional hnswlib package
+
+    Conversation ids map to integer labels; removal marks the label
+    deleted and its slot is reused by later inserts.
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        import hnswlib
+        self.dim = dim
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(
+            max_elements=capacity,
+            M=int(os.getenv("MEMORY_HNSW_M", "16")),
+            ef_construction=int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", "200")),
+            allow_replace_deleted=True
+        )
+        self.index.set_ef(int(os.getenv("MEMORY_HNSW_EF", "64")))
+        self.labels: Dict[str, int] = {}
+        self.ids_by_label: Dict[int, str] = {}
+        self.texts: Dict[int, str] = {}
+        self.text_bytes = 0
+        self.next_label = 0
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self.labels)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.labels
+
+    def text(self, item_id: str) -> Optional[str]:
+        label = self.labels.get(item_id)
+        return None if label is None else self.texts[label]
+
+    def nbytes(self) -> int:
+        # Graph storage is preallocated: vector + level-0 links per slot
+        slot = self.dim * 4 + 2 * getattr(self.index, "M", 16) * 4 + 64
+        return self.index.get_max_elements() * slot + self.text_bytes + _ITEM_OVERHEAD_BYTES * len(self.labels)
+
+    def upsert(self, item_id: str, vector, text: str) -> bool:
+        if len(vector) != self.dim:
+            return False
+        unit = normalize(vector)
+        if unit is None:
+            return False
+
+        label = self.labels.get(item_id)
+        replace_deleted = False
+        if label is None:
+            if self.index.get_current_count() >= self.index.get_max_elements():
+                if self.index.get_current_count() > len(self.labels):
+                    replace_deleted = True
+                else:
+                    self.index.resize_index(self.index.get_max_elements() * 2)
+            label = self.next_label
+            self.next_label += 1
+            self.labels[item_id] = label
+            self.ids_by_label[label] = item_id
+
+        self.index.add_items(unit[None, :], np.array([label]), replace_deleted=replace_deleted)
+        self.text_bytes += len(text) - len(self.texts.get(label, ""))
+        self.texts[label] = text
+        return True
+
+    def remove(self, item_id: str):
+        label = self.labels.pop(item_id, None)
+        if label is None:
+            return
+        self.index.mark_deleted(label)
+        del self.ids_by_label[label]
+        self.text_bytes -= len(self.texts.pop(label))
+
+    def search(self, query, k: int, exclude: Exclude = None) -> List[Tuple[str, str, float]]:
+        unit = normalize(query) if len(query) == self.dim else None
+        if unit is None or not self.labels or k <= 0:
+            return []
+
+        excluded = set()
+        if exclude is not None:
+            excluded = {exclude} if isinstance(exclude, str) else set(exclude)
+        wanted = min(k + len(excluded & self.labels.keys()), len(self.labels))
+        labels, distances = self.index.knn_query(unit[None, :], k=wanted)
+        results = []
+        for label, distance in zip(labels[0].tolist(), distances[0].tolist()):
+            item_id = self.ids_by_label.get(label)
+            if item_id is None or item_id in excluded:
+                continue
+            # "ip" distance is 1 - dot product
+            results.append((item_id, self.texts[label], 1.0 - float(distance)))
+        return results[:k]
+
+    def search_items(self, query, item_ids: Collection[str], k: int) -> List[Tuple[str, str, float]]:
+        unit = normalize(query) if len(query) == self.dim else None
+        labels = [self.labels[i] for i in item_ids if i in self.labels]
+        if unit is None or not labels or k <= 0:
+            return []
+        matrix = np.asarray(self.index.get_items(labels), dtype=np.float32)
+        scores = matrix @ unit
+        top = _top_k(scores, min(k, len(labels)))
+        return [(self.ids_by_label[labels[i]], self.texts[labels[i]], float(scores[i])) for i in top]
+
+    def needs_training(self) -> bool:
+        return False
+
+    def export_items(self, item_ids: Collection[str]) -> Tuple[List[str], List[str], np.ndarray]:
+        labels = [self.labels[i] for i in item_ids if i in self.labels]
+        if not labels:
+            return [], [], np.zeros((0, self.dim), dtype=np.float32)
+        matrix = np.asarray(self.index.get_items(labels), dtype=np.float32)
+        return [self.ids_by_label[label] for label in labels], [self.texts[label] for label in labels], matrix
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {
+            "kind": np.array(self.kind),
+            "dim": np.array(self.dim),
+            "ids": _pack_strings(list(self.labels)),
+            "labels": np.array(list(self.labels.values()), dtype=np.int64),
+            "texts": _pack_strings([self.texts[label] for label in self.labels.values()]),
+            "next_label": np.array(self.next_label),
+            "graph": np.frombuffer(pickle.dumps(self.index), dtype=np.uint8),
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, np.ndarray]) -> "HNSWVectors":
+        vectors = cls.__new__(cls)
+        vectors.dim = int(state["dim"])
+        vectors.index = pickle.loads(state["graph"].tobytes())
+        vectors.index.set_ef(int(os.getenv("MEMORY_HNSW_EF", "64")))
+        ids = _unpack_strings(state["ids"])
+        labels = state["labels"].tolist()
+        vectors.labels = dict(zip(ids, labels))
+        vectors.ids_by_label = dict(zip(labels, ids))
+        vectors.texts = dict(zip(labels, _unpack_strings(state["texts"])))
+        vectors.text_bytes = sum(len(text) for text in vectors.texts.values())
+        vectors.next_label = int(state["next_label"])
+        return vectors
+
+
+BACKENDS = {cls.kind: cls for cls in (UserVectors, IVFVectors, HNSWVectors)}
+
+
+def index_backend() -> str:
+    """MEMORY_VECTOR_INDEX, falling back to ivf when hnswlib is missing"""
+    kind = (os.getenv("MEMORY_VECTOR_INDEX") or "ivf").strip().lower()
+    if kind == "hnsw":
+        try:
+            import hnswlib  # noqa: F401
+        except ImportError:
+            print("MEMORY_VECTOR_INDEX=hnsw unavailable (hnswlib not installed); using ivf")
+            return "ivf"
+    if kind not in BACKENDS:
+        print(f"Unknown MEMORY_VECTOR_INDEX={kind!r}; using ivf")
+        return "ivf"
+    return kind
+
+
+class VectorIndex:
+    """
+    Per-user vector indexes, kept in process memory
+
+    Entries are updated in place by the process that saves a summary or
+    clears a conversation. All users share one byte budget
+    (MEMORY_VECTOR_INDEX_MAX_BYTES, 0 = unbounded); once it is exceeded
+    the least recently used indexes are evicted. With a persist_dir,
+    indexes are saved after MEMORY_VECTOR_INDEX_SAVE_EVERY changes, at
+    shutdown and when evicted with unsaved changes, and loaded from
+    there on first use after a restart or eviction.
+
+    An evicted index with unsaved changes is parked until it has been
+    saved (evict_listeners start the save, release() drops it after);
+    get() brings it back if the user returns first, so a reload never
+    reads a file older than what was in memory.
+    """
+
+    def __init__(self, persist_dir: Optional[Path] = None, kind: str = None, max_bytes: Optional[int] = None):
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.kind = kind or index_backend()
+        if max_bytes is None:
+            max_bytes = int(os.getenv("MEMORY_VECTOR_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.max_bytes = max_bytes
+        self.save_every = int(os.getenv("MEMORY_VECTOR_INDEX_SAVE_EVERY", "32"))
+        # Least recently used first
+        self._users: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.bytes = 0
+        # Evicted with unsaved changes, waiting for their save job
+        self._parked: Dict[str, object] = {}
+        self._changes: Dict[str, int] = {}
+        # Called with (user_id, evicted index) after an eviction
+        self.evict_listeners: List[Callable[[str, object], None]] = []
+        self.searches = 0
+        self.rebuilds = 0
+        self.loads = 0
+        self.saves = 0
+        self.trainings = 0
+        self.evictions = 0
+
+    def get(self, user_id: str):
+        vectors = self._users.get(user_id)
+        if vectors is not None:
+            self._users.move_to_end(user_id)
+            return vectors
+        vectors = self._parked.pop(user_id, None)
+        if vectors is not None:
+            # Evicted but not yet saved: take it back rather than reload
+            self._install(user_id, vectors)
+        return vectors
+
+    def create(self, user_id: str, dim: int):
+        self.rebuilds += 1
+        vectors = BACKENDS[self.kind](dim)
+        self._parked.pop(user_id, None)
+        self._changes[user_id] = 0
+        self._install(user_id, vectors)
+        return vectors
+
+    def changed(self, user_id: str, count: int = 1):
+        if user_id in self._users:
+            self._changes[user_id] = self._changes.get(user_id, 0) + count
+            self._account(user_id)
+
+    def _install(self, user_id: str, vectors):
+        self._users[user_id] = vectors
+        self._users.move_to_end(user_id)
+        self._account(user_id)
+
+    def _account(self, user_id: str):
+        """Re-measure one user's index, then evict others if over budget"""
+        size = self._users[user_id].nbytes()
+        self.bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        if self.max_bytes <= 0:
+            return
+        # The index just used is the newest, so it is only evicted if alone
+        while self.bytes > self.max_bytes and len(self._users) > 1:
+            self._evict(next(iter(self._users)))
+
+    def _evict(self, user_id: str):
+        vectors = self._drop(user_id)
+        self.evictions += 1
+        if self.persist_dir is not None and self._changes.get(user_id, 0):
+            self._parked[user_id] = vectors
+        else:
+            self._changes.pop(user_id, None)
+        for listener in self.evict_listeners:
+            try:
+                listener(user_id, vectors)
+            except Exception as e:
+                print(f"Vector index evict listener failed for user {user_id}: {e}")
+
+    def _drop(self, user_id: str):
+        vectors = self._users.pop(user_id, None)
+        self.bytes -= self._sizes.pop(user_id, 0)
+        return vectors
+
+    def is_parked(self, user_id: str) -> bool:
+        return user_id in self._parked
+
+    def release(self, user_id: str):
+        """Forget a parked index once everything in it has been saved"""
+        if user_id in self._parked and not self._changes.get(user_id, 0):
+            del self._parked[user_id]
+            self._changes.pop(user_id, None)
+
+    def upsert(self, user_id: str, item_id: str, vector, text: str):
+        """Update a loaded user's entry (unloaded users are built on next search)"""
+        vectors = self.get(user_id)
+        if vectors is None:
+            return
+        if vectors.upsert(item_id, vector, text):
+            self.changed(user_id)
+        else:
+            # Dimension changed (e.g. new embedding model): rebuild lazily
+            self._drop(user_id)
+            self._changes.pop(user_id, None)
+
+    def remove(self, user_id: str, item_id: str):
+        vectors = self.get(user_id)
+        if vectors is not None and item_id in vectors:
+            vectors.remove(item_id)
+            self.changed(user_id)
+
+    # Persistence
+
+    def _path(self, user_id: str) -> Optional[Path]:
+        if self.persist_dir is None:
+            return None
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return self.persist_dir / digest[:2] / f"{digest}.npz"
+
+    def needs_save(self, user_id: str) -> bool:
+        return self.persist_dir is not None and self._changes.get(user_id, 0) >= self.save_every
+
+    def dirty_users(self) -> List[str]:
+        return [
+            user_id for user_id, count in self._changes.items()
+            if count and (user_id in self._users or user_id in self._parked)
+        ]
+
+    def save_job(self, user_id: str) -> Optional[Callable[[], None]]:
+        """Snapshot a user's index and return a blocking write job (None if nothing to save)"""
+        path = self._path(user_id)
+        vectors = self._users.get(user_id) or self._parked.get(user_id)
+        if path is None or vectors is None or not self._changes.get(user_id, 0):
+            return None
+        state = vectors.snapshot()
+        self._changes[user_id] = 0
+
+        def job():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **state)
+            os.replace(tmp_path, path)
+            self.saves += 1
+
+        return job
+
+    def load_sync(self, user_id: str, dim: Optional[int]):
+        """Read a saved index (blocking); returns it, or None if missing or unusable (dim=None: any)"""
+        path = self._path(user_id)
+        if path is None or not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                state = {name: data[name] for name in data.files}
+            kind = str(state["kind"])
+            if kind != self.kind or (dim is not None and int(state["dim"]) != dim):
+                return None
+            self.loads += 1
+            return BACKENDS[kind].restore(state)
+        except Exception as e:
+            print(f"Ignoring unreadable vector index {path}: {e}")
+            return None
+
+    def adopt(self, user_id: str, vectors):
+        """Register an index loaded by load_sync"""
+        self._parked.pop(user_id, None)
+        self._changes[user_id] = 0
+        self._install(user_id, vectors)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.kind,
+            "users": len(self._users),
+            "vectors": sum(len(v) for v in self._users.values()),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "parked": len(self._parked),
+            "searches": self.searches,
+            "rebuilds": self.rebuilds,
+            "loads": self.loads,
+            "saves": self.saves,
+            "trainings": self.trainings,
+        }
@@ -0,0 +1,77 @@
+"""
+Vectors - Content hashing and compact float32 encoding for embeddings
+Shared by the memory store backends and the retriever
+"""
+import os
+import sys
+import hashlib
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from shared.lru_cache import BoundedLRU
+
+# Rough per-entry overhead on top of the vector data: key tuple and
+# strings, ndarray header, LRU bookkeeping
+_ENTRY_OVERHEAD = 256
+
+
+def content_hash(text: str) -> str:
+    """Stable key for an embedded text (sha256 hex of its UTF-8 bytes)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_float32(vector: List[float]) -> bytes:
+    """Little-endian float32 bytes (4 bytes per dimension)"""
+    values = array("f", vector)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack_float32(data: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    In-process embedding cache bounded by bytes
+
+    Keyed by (model, content hash) rather than the text itself, holding
+    read-only contiguous float32 arrays (4 bytes per dimension instead
+    of ~32 for a list of Python floats). Least recently used vectors are
+    evicted past MEMORY_EMBEDDING_CACHE_MAX_BYTES (64 MB, about 5k
+    3072-dim vectors; 0 disables) or MEMORY_EMBEDDING_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, max_bytes: int = None, max_entries: int = None):
+        if max_bytes is None:
+            max_bytes = int(os.getenv("MEMORY_EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        if max_entries is None:
+            max_entries = int(os.getenv("MEMORY_EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        self.enabled = max_bytes > 0
+        self._lru = BoundedLRU(max_entries=max_entries, max_bytes=max_bytes)
+
+    def get(self, model: str, key: str) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        return self._lru.get((model, key))
+
+    def set(self, model: str, key: str, vector) -> np.ndarray:
+        """Cache a vector and return it as the stored float32 array"""
+        values = np.array(vector, dtype=np.float32)
+        values.setflags(write=False)
+        if self.enabled:
+            self._lru.set((model, key), values, size=values.nbytes + _ENTRY_OVERHEAD)
+        return values
+
+    def pop(self, model: str, key: str):
+        self._lru.pop((model, key))
+
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, **self._lru.stats()}
@@ -0,0 +1,367 @@
+"""
+Write-Behind Store - Buffers turn and state writes, flushes in group commits
+Wraps any memory store backend with the same async API
+"""
+import os
+import time
+import asyncio
+from typing import Callable, List, Dict, Optional, Tuple
+from datetime import datetime
+from shared.deadline import spawn_detached
+
+
+def write_behind_enabled() -> bool:
+    return (os.getenv("MEMORY_WRITE_BEHIND") or "").strip().lower() in ("1", "true", "yes")
+
+
+class _Pending:
+    """Buffered writes for one conversation"""
+
+    __slots__ = ("turns", "state", "since", "lock")
+
+    def __init__(self):
+        self.turns: List[Dict] = []
+        self.state: Dict = {}
+        self.since: Optional[float] = None
+        # Held while this conversation is flushed, and by readers merging
+        # durable + buffered data, so a turn is never seen twice or missed
+        self.lock = asyncio.Lock()
+
+    def empty(self) -> bool:
+        return not self.turns and not self.state
+
+
+class WriteBehindStore:
+    """
+    Memory store wrapper with write-behind buffering
+
+    save_turn(s) and update_conversation_state return once the write is
+    buffered. Buffered writes are flushed per conversation (all turns in
+    one save_turns call, state updates merged into one write) when
+    MEMORY_WRITE_BEHIND_MAX_TURNS turns are pending, or at the latest
+    MEMORY_WRITE_BEHIND_FLUSH_MS after they were buffered, which bounds
+    what a crash can lose. close() (app shutdown) flushes everything.
+
+    Reads merge the buffer, so callers see their own writes immediately.
+    Summaries are written through (after flushing that conversation).
+    """
+
+    def __init__(self, inner, flush_interval: float = None, max_turns: int = None):
+        self.inner = inner
+        self.flush_interval = flush_interval if flush_interval is not None else (
+            float(os.getenv("MEMORY_WRITE_BEHIND_FLUSH_MS", "500")) / 1000
+        )
+        self.max_turns = max_turns or int(os.getenv("MEMORY_WRITE_BEHIND_MAX_TURNS", "64"))
+
+        self._pending: Dict[Tuple[str, str], _Pending] = {}
+        self._buffered_turns = 0
+        self._wake = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+        # Notified when turns are buffered, since reads already include them
+        self.turn_listeners: List[Callable[[str, str], None]] = []
+
+        self.flushes = 0
+        self.turns_flushed = 0
+        self.states_flushed = 0
+        self.flush_errors = 0
+        self.max_window_seconds = 0.0
+
+    # Buffering
+
+    def _entry(self, user_id: str, conversation_id: str) -> _Pending:
+        key = (str(user_id), str(conversation_id))
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = _Pending()
+            self._pending[key] = entry
+        if entry.since is None:
+            entry.since = time.monotonic()
+        self._ensure_flusher()
+        return entry
+
+    def _ensure_flusher(self):
+        if self._closed:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = spawn_detached(self._flush_loop())
+
+    async def save_turn(
+        self,
+        user_id: str,
+        conversation_id: str,
+        message: str,
+        role: str
+    ):
+        """Buffer a conversation turn"""
+        await self.save_turns(user_id, conversation_id, [{"role": role, "content": message}])
+
+    async def save_turns(
+        self,
+        user_id: str,
+        conversation_id: str,
+        turns: List[Dict]
+    ):
+        """Buffer several turns of one conversation"""
+        if self._closed:
+            await self.inner.save_turns(user_id, conversation_id, turns)
+            if turns:
+                self._notify_turns(user_id, conversation_id)
+            return
+
+        now = datetime.utcnow().isoformat()
+        entry = self._entry(user_id, conversation_id)
+        for turn in turns:
+            # Stamp now so the durable record keeps the real turn time
+            entry.turns.append({
+                "role": turn["role"],
+                "content": turn["content"],
+                "timestamp": turn.get("timestamp") or now
+            })
+        self._buffered_turns += len(turns)
+        if self._buffered_turns >= self.max_turns:
+            self._wake.set()
+        if turns:
+            self._notify_turns(user_id, conversation_id)
+
+    def add_turn_listener(self, listener: Callable[[str, str], None]):
+        """Call listener(user_id, conversation_id) after turns are saved (on the event loop)"""
+        self.turn_listeners.append(listener)
+
+    def _notify_turns(self, user_id: str, conversation_id: str):
+        for listener in self.turn_listeners:
+            try:
+                listener(str(user_id), str(conversation_id))
+            except Exception as e:
+                print(f"Turn listener failed for {user_id}/{conversation_id}: {e}")
+
+    async def update_conversation_state(
+        self,
+        user_id: str,
+        conversation_id: str,
+        state: Dict
+    ):
+        """Buffer a state update (merged with earlier buffered updates)"""
+        if self._closed:
+            await self.inner.update_conversation_state(user_id, conversation_id, state)
+            return
+        self._entry(user_id, conversation_id).state.update(state)
+
+    # Flushing
+
+    async def _flush_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every buffered conversation (one group commit each)"""
+        keys = [key for key, entry in self._pending.items() if not entry.empty()]
+        if keys:
+            await asyncio.gather(*[self._flush_conversation(key) for key in keys])
+
+    async def _flush_conversation(self, key: Tuple[str, str]):
+        entry = self._pending.get(key)
+        if entry is None:
+            return
+
+        async with entry.lock:
+            await self._flush_entry_locked(key, entry)
+
+    async def _flush_entry_locked(self, key: Tuple[str, str], entry: _Pending):
+        user_id, conversation_id = key
+        turns, entry.turns = entry.turns, []
+        state, entry.state = entry.state, {}
+        since, entry.since = entry.since, None
+        if not turns and not state:
+            return
+        self._buffered_turns -= len(turns)
+
+        written = 0
+        try:
+            if turns:
+                await self.inner.save_turns(user_id, conversation_id, turns)
+                written, turns = len(turns), []
+            if state:
+                await self.inner.update_conversation_state(user_id, conversation_id, state)
+        except Exception as e:
+            # Keep what wasn't written (ahead of newer writes) and retry next round
+            self.flush_errors += 1
+            print(f"Write-behind flush failed for {user_id}/{conversation_id}: {e}")
+            entry.turns = turns + entry.turns
+            entry.state = {**state, **entry.state}
+            entry.since = since
+            self._buffered_turns += len(turns)
+            return
+
+        self.flushes += 1
+        self.turns_flushed += written
+        self.states_flushed += 1 if state else 0
+        if since is not None:
+            self.max_window_seconds = max(self.max_window_seconds, time.monotonic() - since)
+
+        # Drop the entry once drained (no await between check and delete)
+        if entry.empty() and self._pending.get(key) is entry:
+            del self._pending[key]
+
+    async def close(self):
+        """Stop the flusher and write everything still buffered (app shutdown)"""
+        self._closed = True
+        if self._flusher is not None and not self._flusher.done():
+            # Let an in-progress flush finish rather than cancelling it mid-write
+            self._wake.set()
+            await self._flusher
+        await self.flush()
+        await self.inner.close()
+
+    # Reads (merged with the buffer)
+
+    async def get_conversation_history(
+        self,
+        user_id: str,
+        conversation_id: str,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """Get conversation history including buffered turns"""
+        entry = self._pending.get((str(user_id), str(conversation_id)))
+        if entry is None:
+            return await self.inner.get_conversation_history(user_id, conversation_id, limit)
+
+        async with entry.lock:
+            if limit and len(entry.turns) >= limit:
+                return [dict(turn) for turn in entry.turns[-limit:]]
+            durable_limit = limit - len(entry.turns) if limit else None
+            durable = await self.inner.get_conversation_history(user_id, conversation_id, durable_limit)
+            return durable + [dict(turn) for turn in entry.turns]
+
+    async def get_turns_since(
+        self,
+        user_id: str,
+        conversation_id: str,
+        start: int
+    ) -> List[Dict]:
+        """Turns from position `start` on, buffered ones included"""
+        entry = self._pending.get((str(user_id), str(conversation_id)))
+        if entry is None:
+            return await self.inner.get_turns_since(user_id, conversation_id, start)
+
+        # Holding the entry lock keeps a flush from moving turns meanwhile
+        async with entry.lock:
+            durable_count = 0
+            for conversation in await self.inner.get_all_conversations(user_id):
+                if conversation["conversation_id"] == str(conversation_id):
+                    durable_count = conversation.get("turn_count", 0)
+            durable = []
+            if start < durable_count:
+                durable = await self.inner.get_turns_since(user_id, conversation_id, start)
+            buffered = entry.turns[max(0, start - durable_count):]
+            return durable + [dict(turn) for turn in buffered]
+
+    async def get_summary(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Optional[str]:
+        """Get conversation summary (a buffered state update wins)"""
+        entry = self._pending.get((str(user_id), str(conversation_id)))
+        if entry is not None and "summary" in entry.state:
+            return entry.state["summary"]
+        return await self.inner.get_summary(user_id, conversation_id)
+
+    async def get_conversation_state(
+        self,
+        user_id: str,
+        conversation_id: str
+    ) -> Dict:
+        """Get conversation state (summary, metadata, etc.)"""
+        state = await self.inner.get_conversation_state(user_id, conversation_id)
+        entry = self._pending.get((str(user_id), str(conversation_id)))
+        if entry is not None and "summary" in entry.state:
+            state["summary"] = entry.state["summary"]
+        return state
+
+    async def get_all_conversations(self, user_id: str) -> List[Dict]:
+        """Get all conversations for a user, counting buffered turns"""
+        conversations = {
+            c["conversation_id"]: dict(c)
+            for c in await self.inner.get_all_conversations(user_id)
+        }
+        for (pending_user, conversation_id), entry in list(self._pending.items()):
+            if pending_user != str(user_id) or not entry.turns:
+                continue
+            conv = conversations.setdefault(conversation_id, {
+                "conversation_id": conversation_id,
+                "turn_count": 0,
+                "last_updated": None,
+                "has_summary": False,
+                "summary_hash": None
+            })
+            conv["turn_count"] += len(entry.turns)
+            conv["last_updated"] = entry.turns[-1]["timestamp"]
+        return list(conversations.values())
+
+    # Write-through operations
+
+    async def save_summary(
+        self,
+        user_id: str,
+        conversation_id: str,
+        summary: str
+    ):
+        """Save conversation summary (flushes this conversation first to keep order)"""
+        key = (str(user_id), str(conversation_id))
+        entry = self._pending.get(key)
+        if entry is None:
+            await self.inner.save_summary(user_id, conversation_id, summary)
+            return
+
+        async with entry.lock:
+            await self._flush_entry_locked(key, entry)
+            await self.inner.save_summary(user_id, conversation_id, summary)
+
+    async def clear_conversation(
+        self,
+        user_id: str,
+        conversation_id: str
+    ):
+        """Drop buffered writes and clear all memory for a conversation"""
+        key = (str(user_id), str(conversation_id))
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            await self.inner.clear_conversation(user_id, conversation_id)
+            return
+
+        async with entry.lock:
+            self._buffered_turns -= len(entry.turns)
+            entry.turns, entry.state, entry.since = [], {}, None
+            await self.inner.clear_conversation(user_id, conversation_id)
+
+    def __getattr__(self, name):
+        # Backend-specific extras (rebuild_manifest, ...) pass through
+        return getattr(self.inner, name)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        oldest = min(
+            (entry.since for entry in self._pending.values() if entry.since is not None),
+            default=None
+        )
+        stats = {
+            "buffered_turns": self._buffered_turns,
+            "buffered_conversations": sum(1 for entry in self._pending.values() if not entry.empty()),
+            "oldest_pending_ms": round((now - oldest) * 1000, 1) if oldest is not None else 0.0,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "flushes": self.flushes,
+            "turns_flushed": self.turns_flushed,
+            "states_flushed": self.states_flushed,
+            "avg_turns_per_flush": round(self.turns_flushed / self.flushes, 2) if self.flushes else 0.0,
+            "flush_errors": self.flush_errors,
+            "max_window_ms": round(self.max_window_seconds * 1000, 1),
+        }
+        if hasattr(self.inner, "stats"):
+            stats["backend"] = self.inner.stats()
+        return stats
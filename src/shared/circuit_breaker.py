@@ -0,0 +1,146 @@
+"""
+Circuit Breaker - Per (provider, model) breakers for upstream LLM calls
+Open models are skipped immediately instead of paying the failure again
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker
+
+    - closed: calls flow; consecutive failures are counted
+    - open: calls are rejected until open_seconds have passed
+    - half_open: a limited number of probe calls are let through;
+      a success closes the breaker, a failure re-opens it
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.last_error: Optional[str] = None
+
+        self.total_failures = 0
+        self.total_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _maybe_half_open(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (no side effects)"""
+        self._maybe_half_open()
+        if self.state == OPEN:
+            return True
+        return self.state == HALF_OPEN and self.probes_in_flight >= self.half_open_max_calls
+
+    def allow(self) -> bool:
+        """Reserve permission for one call; pair with a record_* call"""
+        self._maybe_half_open()
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self.probes_in_flight < self.half_open_max_calls:
+            self.probes_in_flight += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.total_successes += 1
+        self.consecutive_failures = 0
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.probes_in_flight = 0
+
+    def record_failure(self, error: Optional[str] = None):
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def record_cancelled(self):
+        """The call never produced an outcome (e.g. a cancelled hedge)"""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.times_opened += 1
+
+    def stats(self) -> Dict:
+        self._maybe_half_open()
+        retry_in = 0.0
+        if self.state == OPEN:
+            retry_in = max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(retry_in, 2),
+            "times_opened": self.times_opened,
+            "failures": self.total_failures,
+            "successes": self.total_successes,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class BreakerRegistry:
+    """Breakers keyed by (provider, model), configured via env"""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.open_seconds = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+        self.half_open_max_calls = int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", "1"))
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name=f"{provider}:{model}",
+                failure_threshold=self.failure_threshold,
+                open_seconds=self.open_seconds,
+                half_open_max_calls=self.half_open_max_calls,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    def stats(self) -> Dict:
+        return {breaker.name: breaker.stats() for breaker in self._breakers.values()}
+
+
+_registry: Optional[BreakerRegistry] = None
+
+
+def get_breakers() -> BreakerRegistry:
+    """Get or create the breaker registry singleton"""
+    global _registry
+    if _registry is None:
+        _registry = BreakerRegistry()
+    return _registry
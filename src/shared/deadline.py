@@ -0,0 +1,88 @@
+"""
+Deadline - Per-request time budget propagated through the call stack
+Stored in a contextvar so the route, memory pipeline and LLM client all
+see the same budget without threading it through every signature
+"""
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute deadline (time.monotonic()) for the current request, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the request's time budget has run out"""
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Run the enclosed block with a time budget
+
+    Nested scopes can only shorten the budget, never extend it.
+    """
+    if seconds is None:
+        yield
+        return
+
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def spawn_detached(coro) -> asyncio.Task:
+    """
+    Start a task with no deadline, whatever the caller's budget
+
+    Tasks copy the current context when created, so background jobs and
+    batches shared by several requests would otherwise inherit (and be
+    cut short by) the deadline of whichever request happened to start them.
+    """
+    token = _deadline.set(None)
+    try:
+        return asyncio.ensure_future(coro)
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget (None = no deadline)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def has_budget(seconds: float) -> bool:
+    """True if there is no deadline or at least `seconds` are left"""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def check(stage: str = "request"):
+    """Raise DeadlineExceeded if the budget is already spent"""
+    if expired():
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def bounded(seconds: float) -> float:
+    """Cap a timeout to the remaining budget"""
+    left = remaining()
+    if left is None:
+        return seconds
+    return max(0.0, min(seconds, left))
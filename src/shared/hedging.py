@@ -0,0 +1,153 @@
+"""
+Hedging - Latency tracking and hedged requests across fallback models
+Fires a duplicate request at the next model when the primary is slow
+"""
+import os
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def hedging_enabled(options: Optional[Dict[str, Any]] = None) -> bool:
+    if options and "hedge" in options:
+        return bool(options["hedge"])
+    return (os.getenv("LLM_HEDGE_ENABLED") or "").strip().lower() in ("1", "true", "yes")
+
+
+class ModelStats:
+    """Recent latencies and hedge outcomes for one model"""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.fired_as_backup = 0
+        self.wins_as_primary = 0
+        self.wins_as_backup = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> Dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "requests": self.requests,
+            "samples": len(self.latencies),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "fired_as_backup": self.fired_as_backup,
+            "wins_as_primary": self.wins_as_primary,
+            "wins_as_backup": self.wins_as_backup,
+        }
+
+
+class HedgeOutcome:
+    """Filled in by Hedger.run: whether the backup call was started"""
+
+    def __init__(self):
+        self.backup_launched = False
+
+
+class Hedger:
+    """
+    Runs a primary call and, if it is slower than the configured
+    percentile of its recent latency, a backup call on another model.
+    The first successful result wins and the other call is cancelled.
+    """
+
+    def __init__(self):
+        self.percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.default_delay = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "2000")) / 1000
+        self._models: Dict[str, ModelStats] = {}
+
+    def model_stats(self, model: str) -> ModelStats:
+        stats = self._models.get(model)
+        if stats is None:
+            stats = ModelStats()
+            self._models[model] = stats
+        return stats
+
+    def record_latency(self, model: str, seconds: float):
+        self.model_stats(model).latencies.append(seconds)
+
+    def hedge_delay(self, model: str) -> float:
+        stats = self.model_stats(model)
+        if len(stats.latencies) < self.min_samples:
+            return self.default_delay
+        return stats.percentile(self.percentile)
+
+    async def run(
+        self,
+        primary_model: str,
+        backup_model: str,
+        call: Callable[[str], Awaitable[Any]],
+        outcome: Optional[HedgeOutcome] = None
+    ) -> Any:
+        """
+        Call `call(primary_model)`, hedging to `call(backup_model)`
+
+        Raises the backup's error if both fail (the primary's error if
+        the backup was never started). `outcome.backup_launched` tells
+        the caller whether the backup model was already tried.
+        """
+        primary_stats = self.model_stats(primary_model)
+        backup_stats = self.model_stats(backup_model)
+        primary_stats.requests += 1
+
+        primary = asyncio.ensure_future(call(primary_model))
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(primary_model))
+            if done:
+                return primary.result()
+
+            primary_stats.hedged += 1
+            backup_stats.fired_as_backup += 1
+            backup = asyncio.ensure_future(call(backup_model))
+            if outcome is not None:
+                outcome.backup_launched = True
+
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            primary_stats.wins_as_primary += 1
+                        else:
+                            backup_stats.wins_as_backup += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the loser (or both, if the caller itself was cancelled)
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": hedging_enabled(),
+            "percentile": self.percentile,
+            "models": {model: stats.to_dict() for model, stats in self._models.items()},
+        }
+
+
+_hedger: Optional[Hedger] = None
+
+
+def get_hedger() -> Hedger:
+    """Get or create the hedger singleton"""
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
@@ -0,0 +1,181 @@
+"""
+HTTP Client - Shared, pooled httpx client for all upstream LLM/embedding calls
+Created once in the FastAPI lifespan and reused so connections stay alive
+"""
+import os
+import httpx
+from typing import Dict, Optional
+from shared import deadline
+from shared.mock_llm import llm_mock_enabled, embedding_mock_enabled, mock_transport, MOCK_HOST
+
+# Per-provider request timeouts (seconds), overridable via env
+DEFAULT_TIMEOUTS = {
+    "gemini": 60.0,
+    "grok": 60.0,
+    "embedding": 15.0,
+}
+
+_client: Optional[httpx.AsyncClient] = None
+_stats = {
+    "requests": 0,
+    "in_flight": 0,
+    "pool_waits": 0,
+    "clients_created": 0,
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def _http2_enabled() -> bool:
+    if (os.getenv("HTTP2_ENABLED") or "").strip().lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401  (optional dependency: pip install httpx[http2])
+    except ImportError:
+        print("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1")
+        return False
+    return True
+
+
+def get_timeout(provider: str) -> httpx.Timeout:
+    """
+    Get the request timeout for a provider (gemini, grok, embedding)
+
+    Capped to the current request's remaining deadline, so call this
+    right before each attempt rather than once per retry loop.
+    """
+    seconds = _env_float(
+        f"HTTP_TIMEOUT_{provider.upper()}",
+        DEFAULT_TIMEOUTS.get(provider, 60.0)
+    )
+    deadline.check(f"{provider} request")
+    seconds = deadline.bounded(seconds)
+    return httpx.Timeout(seconds, connect=min(seconds, _env_float("HTTP_CONNECT_TIMEOUT", 10.0)))
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=_env_int("HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+    pool_timeout = _env_float("HTTP_POOL_TIMEOUT", 10.0)
+
+    async def _on_request(request: httpx.Request):
+        _stats["requests"] += 1
+
+    # Route the mock upstream's host to an in-process transport (load testing)
+    mounts = None
+    if llm_mock_enabled() or embedding_mock_enabled():
+        mounts = {f"all://{MOCK_HOST}": mock_transport()}
+
+    _stats["clients_created"] += 1
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(60.0, pool=pool_timeout),
+        http2=_http2_enabled(),
+        event_hooks={"request": [_on_request]},
+        mounts=mounts,
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Create the shared client (called from the app lifespan)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client and release pooled connections"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared pooled client
+
+    Falls back to creating it lazily so scripts that call the LLM
+    outside the FastAPI app still work.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+class _RequestTracker:
+    """Counts in-flight requests and requests that had to wait for a pooled connection"""
+
+    def __enter__(self):
+        pool = _get_pool()
+        if pool is not None and _pool_is_saturated(pool):
+            _stats["pool_waits"] += 1
+        _stats["in_flight"] += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stats["in_flight"] -= 1
+        return False
+
+
+def track_request() -> _RequestTracker:
+    """Context manager wrapped around each upstream request for pool stats"""
+    return _RequestTracker()
+
+
+def _get_pool():
+    if _client is None:
+        return None
+    transport = getattr(_client, "_transport", None)
+    return getattr(transport, "_pool", None)
+
+
+def _pool_is_saturated(pool) -> bool:
+    connections = list(getattr(pool, "connections", []))
+    max_connections = getattr(pool, "_max_connections", None)
+    if max_connections is None or len(connections) < max_connections:
+        return False
+    return not any(conn.is_available() for conn in connections)
+
+
+def get_pool_stats() -> Dict:
+    """Get connection pool statistics for monitoring"""
+    pool = _get_pool()
+    connections = list(getattr(pool, "connections", [])) if pool is not None else []
+    idle = sum(1 for conn in connections if conn.is_idle())
+    queued = 0
+    if pool is not None:
+        queued = sum(
+            1 for req in getattr(pool, "_requests", [])
+            if getattr(req, "connection", None) is None
+        )
+
+    return {
+        "client_open": _client is not None and not _client.is_closed,
+        "http2": bool(getattr(pool, "_http2", False)),
+        "connections": len(connections),
+        "in_use": len(connections) - idle,
+        "idle": idle,
+        "queued": queued,
+        "in_flight_requests": _stats["in_flight"],
+        "pool_waits": _stats["pool_waits"],
+        "total_requests": _stats["requests"],
+        "clients_created": _stats["clients_created"],
+    }
@@ -0,0 +1,188 @@
+"""
+LLM Response Cache - Exact-match cache for call_llm completions
+In-process LRU tier plus an optional on-disk tier that survives restarts
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+from shared.lru_cache import BoundedLRU
+
+# Payload fields that determine the completion (transport details are ignored)
+KEY_FIELDS = ("systemInstruction", "contents", "generationConfig", "messages",
+              "temperature", "top_p", "max_tokens", "stop")
+
+
+def _env_flag(name: str) -> bool:
+    return (os.getenv(name) or "").strip().lower() in ("1", "true", "yes")
+
+
+def make_cache_key(provider: str, model: str, payload: Dict[str, Any]) -> str:
+    """
+    Canonical hash of a normalized request
+
+    Keys are sorted and whitespace-free so semantically identical payloads
+    hash the same regardless of dict ordering.
+    """
+    normalized = {
+        "provider": provider,
+        "model": model,
+        "request": {k: payload[k] for k in KEY_FIELDS if k in payload},
+    }
+    canonical = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Opt-in exact-match cache of LLM responses
+
+    Enabled globally with LLM_CACHE_ENABLED=1. Per call, options["cache"]
+    overrides the global setting (False bypasses, True opts in).
+    """
+
+    def __init__(self):
+        self.enabled = _env_flag("LLM_CACHE_ENABLED")
+        self.ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+        self.memory = BoundedLRU(
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl_seconds=self.ttl_seconds,
+            sizeof=lambda text: len(text.encode("utf-8")),
+        )
+
+        cache_dir = os.getenv("LLM_CACHE_DIR")
+        self.disk_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_bytes = int(os.getenv("LLM_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+        self._disk_writes = 0
+        self.disk_hits = 0
+        # Running total of the disk tier, so stats() never scans it;
+        # counted once on first disk access, re-synced by each prune
+        self._disk_total: Optional[int] = None
+        self._disk_lock = threading.Lock()
+
+    def is_enabled(self, options: Optional[Dict[str, Any]] = None) -> bool:
+        if options and "cache" in options:
+            return bool(options["cache"])
+        return self.enabled
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self.memory.get(key)
+        if text is not None or self.disk_dir is None:
+            return text
+
+        text = await asyncio.to_thread(self._disk_get, key)
+        if text is not None:
+            self.disk_hits += 1
+            # Promote to the in-process tier
+            self.memory.set(key, text)
+        return text
+
+    async def set(self, key: str, text: str):
+        self.memory.set(key, text)
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._disk_set, key, text)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if data.get("expires_at", 0) < time.time():
+            self._disk_remove(path)
+            return None
+        return data.get("text")
+
+    def _disk_set(self, key: str, text: str):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"text": text, "expires_at": time.time() + self.ttl_seconds}, f)
+        size = tmp_path.stat().st_size
+        with self._disk_lock:
+            self._count_disk()
+            replaced = _file_size(path)
+            os.replace(tmp_path, path)
+            self._disk_total += size - replaced
+
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _count_disk(self):
+        # Caller holds _disk_lock
+        if self._disk_total is None:
+            self._disk_total = sum(_file_size(path) for path in self.disk_dir.glob("*/*.json"))
+
+    def _disk_remove(self, path: Path):
+        with self._disk_lock:
+            self._count_disk()
+            size = _file_size(path)
+            path.unlink(missing_ok=True)
+            self._disk_total -= size
+
+    def _prune_disk(self):
+        """Drop expired entries, then the oldest ones until under the byte cap"""
+        with self._disk_lock:
+            files = []
+            total = 0
+            now = time.time()
+            for path in self.disk_dir.glob("*/*.json"):
+                stat = path.stat()
+                if stat.st_mtime + self.ttl_seconds < now:
+                    path.unlink(missing_ok=True)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            files.sort()
+            for _, size, path in files:
+                if total <= self.disk_max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+            self._disk_total = total
+
+    def stats(self) -> Dict:
+        memory_stats = self.memory.stats()
+        return {
+            "enabled": self.enabled,
+            "hits": memory_stats["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": memory_stats["misses"] - self.disk_hits,
+            "entries": memory_stats["entries"],
+            "bytes": memory_stats["bytes"],
+            "evictions": memory_stats["evictions"],
+            "disk_enabled": self.disk_dir is not None,
+            "disk_bytes": self._disk_total or 0,
+        }
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Get or create the response cache singleton"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -1,7 +1,19 @@
 import os
+import json
+import time
 import asyncio
 import httpx
-from typing import List, Dict, Optional, Any
+from contextlib import aclosing
+from typing import List, Dict, Optional, Any, AsyncIterator, Awaitable, Callable
+from shared import deadline
+from shared.deadline import DeadlineExceeded
+from shared.http_client import get_http_client, get_timeout, track_request
+from shared.llm_cache import get_response_cache, make_cache_key
+from shared.single_flight import get_single_flight
+from shared.rate_limiter import get_rate_limiter, PRIORITIES, DEFAULT_PRIORITY
+from shared.hedging import HedgeOutcome, get_hedger, hedging_enabled
+from shared.circuit_breaker import get_breakers
+from shared.mock_llm import llm_mock_enabled, MOCK_BASE_URL
 
 DEFAULT_GEMINI_MODELS = [
     "models/gemini-2.0-flash",
@@ -15,10 +27,28 @@ def _get_model_list() -> list[str]:
 
 
 def _get_provider() -> str:
-    return (os.getenv("LLM_PROVIDER") or "gemini").strip().lower()
+    """
+    Wire protocol to speak: "gemini" or "grok"
+
+    LLM_PROVIDER=mock speaks the Gemini format to the local mock upstream
+    (or the OpenAI-style format with MOCK_WIRE_FORMAT=openai).
+    """
+    provider = (os.getenv("LLM_PROVIDER") or "gemini").strip().lower()
+    if provider == "mock":
+        wire = (os.getenv("MOCK_WIRE_FORMAT") or "gemini").strip().lower()
+        return "grok" if wire == "openai" else "gemini"
+    return provider
+
+
+def _get_gemini_base_url() -> str:
+    if llm_mock_enabled():
+        return f"{MOCK_BASE_URL}/v1beta"
+    return os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
 
 
 def _get_grok_config() -> tuple[str, str, str]:
+    if llm_mock_enabled():
+        return f"{MOCK_BASE_URL}/v1", os.getenv("GROK_MODEL", "mock-chat"), "mock-key"
     base_url = os.getenv("GROK_BASE_URL", "https://api.x.ai/v1").rstrip("/")
     model = os.getenv("GROK_MODEL", "grok-2-mini")
     api_key = os.getenv("GROK_API_KEY")
@@ -27,11 +57,25 @@ def _get_grok_config() -> tuple[str, str, str]:
     return base_url, model, api_key
 
 
+def _single_flight_enabled(options: Optional[Dict[str, Any]] = None) -> bool:
+    if options and "coalesce" in options:
+        return bool(options["coalesce"])
+    return (os.getenv("LLM_SINGLE_FLIGHT") or "1").strip().lower() not in ("0", "false", "no")
+
+
+def _get_priority(options: Optional[Dict[str, Any]] = None) -> str:
+    """Limiter priority class for a call (interactive unless options say otherwise)"""
+    priority = (options or {}).get("priority", DEFAULT_PRIORITY)
+    return priority if priority in PRIORITIES else DEFAULT_PRIORITY
+
+
 class ModelBusyError(RuntimeError):
     """Raised when the model is rate-limited or unavailable after retries."""
 
 
 def get_api_key() -> str:
+    if llm_mock_enabled():
+        return "mock-key"
     key = os.getenv("GOOGLE_API_KEY")
     if not key:
         raise RuntimeError("GOOGLE_API_KEY is not set")
@@ -81,13 +125,11 @@ def _normalize_generation_config(options: Optional[Dict[str, Any]]) -> Optional[
     return cfg or None
 
 
-async def call_llm(messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
-    provider = _get_provider()
-    if provider == "grok":
-        return await _call_grok(messages, options)
-
-    api_key = get_api_key()
-
+def _build_gemini_payload(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Convert chat messages + options into a Gemini generateContent payload"""
     # Extract system messages and combine them
     system_parts = []
     contents = []
@@ -135,57 +177,251 @@ async def call_llm(messages: List[Dict[str, str]], options: Optional[Dict[str, A
     if generation_config:
         payload["generationConfig"] = generation_config
 
-    models = _get_model_list()
+    return payload
+
+
+def _get_failover_providers() -> List[str]:
+    """Ordered providers to try when the primary provider is unavailable"""
+    env_providers = os.getenv("LLM_FAILOVER_PROVIDERS", "")
+    return [p.strip().lower() for p in env_providers.split(",") if p.strip()]
+
+
+def _provider_configured(provider: str) -> bool:
+    if llm_mock_enabled():
+        return True
+    if provider == "grok":
+        return bool(os.getenv("GROK_API_KEY"))
+    if provider == "gemini":
+        return bool(os.getenv("GOOGLE_API_KEY"))
+    return False
+
+
+def _build_provider_request(
+    provider: str,
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]]
+) -> tuple[Dict[str, Any], str]:
+    """Build (payload, model scope) for a provider"""
+    if provider == "grok":
+        _, model, _ = _get_grok_config()
+        return _build_grok_payload(messages, options, model), model
+    return _build_gemini_payload(messages, options), ",".join(_get_model_list())
+
+
+async def call_llm(messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+    provider = _get_provider()
+    payload, cache_scope = _build_provider_request(provider, messages, options)
+
+    request_key = make_cache_key(provider, cache_scope, payload)
+
+    # Exact-match response cache (opt-in, per-call bypass via options["cache"])
+    cache = get_response_cache()
+    use_cache = cache.is_enabled(options)
+    if use_cache:
+        cached = await cache.get(request_key)
+        if cached is not None:
+            return cached
+
+    priority = _get_priority(options)
+
+    # Primary provider first, then configured failover providers in order
+    providers = [provider] + [
+        p for p in _get_failover_providers()
+        if p != provider and _provider_configured(p)
+    ]
+
+    async def _upstream() -> str:
+        last_error: Optional[ModelBusyError] = None
+        for name in providers:
+            request = payload if name == provider else _build_provider_request(name, messages, options)[0]
+            try:
+                if name == "grok":
+                    return await _call_grok(request, priority)
+                return await _call_gemini(request, priority, hedge=hedging_enabled(options))
+            except ModelBusyError as e:
+                last_error = e
+                if name != providers[-1]:
+                    print(f"LLM provider {name} unavailable, failing over: {e}")
+        raise last_error
+
+    # Stop waiting once the request deadline passes; the per-attempt
+    # timeouts are capped too, but hedging/failover can chain several
+    deadline.check("LLM call")
+    budget = deadline.remaining()
+
+    # Identical concurrent requests share one upstream call
+    if _single_flight_enabled(options):
+        call = get_single_flight("llm").do(request_key, _upstream)
+    else:
+        call = _upstream()
+    try:
+        text = await (call if budget is None else asyncio.wait_for(call, budget))
+    except DeadlineExceeded:
+        raise
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline exceeded waiting for the LLM")
+
+    if use_cache:
+        await cache.set(request_key, text)
+    return text
+
+
+class _ModelUnavailable(Exception):
+    """A single model failed in a way that should fall through to the next one"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+# Upstream statuses that count against a model's circuit breaker
+# (429 is rate limiting and is left to the limiter)
+BREAKER_FAILURE_STATUSES = (403, 404, 500, 502, 503, 504)
+
+# Server errors that aren't worth retrying on the same model
+SERVER_ERROR_STATUSES = (500, 502, 504)
+
+
+async def _guarded(provider: str, model: str, call: Callable[[], Awaitable[str]]) -> str:
+    """Run one model call through its circuit breaker"""
+    breaker = get_breakers().get(provider, model)
+    if not breaker.allow():
+        raise _ModelUnavailable(f"{model} skipped: circuit open")
+
+    try:
+        text = await call()
+    except asyncio.CancelledError:
+        breaker.record_cancelled()
+        raise
+    except _ModelUnavailable as e:
+        if e.status in BREAKER_FAILURE_STATUSES:
+            breaker.record_failure(str(e))
+        else:
+            breaker.record_cancelled()
+        raise
+    except (ModelBusyError, DeadlineExceeded):
+        breaker.record_cancelled()
+        raise
+    except Exception as e:
+        if deadline.expired():
+            # Our budget ran out (timeout was capped to it); not the model's fault
+            breaker.record_cancelled()
+            raise DeadlineExceeded(f"Deadline exceeded calling {model}") from e
+        breaker.record_failure(str(e))
+        if isinstance(e, httpx.TransportError):
+            # Connection failures and timeouts fall through to the next model
+            raise _ModelUnavailable(f"{model} request failed: {e!r}") from e
+        raise
+
+    breaker.record_success()
+    return text
+
+
+async def _call_gemini(
+    payload: Dict[str, Any],
+    priority: str = DEFAULT_PRIORITY,
+    hedge: bool = False
+) -> str:
+    api_key = get_api_key()
+    hedger = get_hedger()
+    breakers = get_breakers()
+
+    # Skip models whose breaker is open without paying the failure again
+    models = [m for m in _get_model_list() if not breakers.get("gemini", m).is_open()]
+    if not models:
+        raise ModelBusyError("All Gemini models are unavailable (circuit open). Please retry.")
+
+    async def _call_model(model: str) -> str:
+        return await _guarded(
+            "gemini", model,
+            lambda: _call_gemini_model(model, payload, priority, api_key)
+        )
 
     last_error: Optional[str] = None
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        for model in models:
-            endpoint = (
-                "https://generativelanguage.googleapis.com/v1beta/"
-                f"{model}:generateContent"
-            )
-            for attempt in range(3):
+    index = 0
+    while index < len(models):
+        model = models[index]
+        backup = models[index + 1] if hedge and index + 1 < len(models) else None
+        outcome = HedgeOutcome()
+        try:
+            if backup is not None:
+                # Race the next model if this one is slower than usual
+                return await hedger.run(model, backup, _call_model, outcome)
+            return await _call_model(model)
+        except _ModelUnavailable as e:
+            last_error = str(e)
+        # A primary that failed before the hedge delay leaves the backup untried
+        index += 2 if outcome.backup_launched else 1
+
+    raise ModelBusyError(last_error or "All models are busy or unavailable. Please retry.")
+
+
+async def _call_gemini_model(
+    model: str,
+    payload: Dict[str, Any],
+    priority: str,
+    api_key: str
+) -> str:
+    """Call one Gemini model, retrying 429/503 up to three times"""
+    client = get_http_client()
+    limiter = get_rate_limiter()
+    hedger = get_hedger()
+
+    endpoint = f"{_get_gemini_base_url()}/{model}:generateContent"
+    last_error: Optional[str] = None
+    status: Optional[int] = None
+
+    for attempt in range(3):
+        async with limiter.slot("gemini", model, priority) as permit:
+            started = time.monotonic()
+            with track_request():
                 response = await client.post(
                     endpoint,
                     params={"key": api_key},
                     headers={"Content-Type": "application/json"},
                     json=payload,
+                    timeout=get_timeout("gemini"),
                 )
-
-                if response.status_code in (429, 503):
-                    last_error = f"{model} returned {response.status_code}: {response.text}"
-                    if attempt < 2:
-                        await asyncio.sleep(0.5 * (2 ** attempt))
-                        continue
-                    # Try next model if available
-                    break
-
-                if response.status_code in (404, 400, 403):
-                    # Model not available or invalid request for this model
-                    last_error = f"{model} returned {response.status_code}: {response.text}"
-                    break
-
-                response.raise_for_status()
-                data = response.json()
-                text = (
-                    data.get("candidates", [{}])[0]
-                    .get("content", {})
-                    .get("parts", [{}])[0]
-                    .get("text", "")
-                )
-                if not text:
-                    last_error = f"{model} returned empty response"
-                    raise ModelBusyError("Model returned empty response. Please retry.")
-                return text
-
-    raise ModelBusyError(last_error or "All models are busy or unavailable. Please retry.")
-
-
-async def _call_grok(messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
-    base_url, model, api_key = _get_grok_config()
-    url = f"{base_url}/chat/completions"
-
+            permit.observe(response)
+        status = response.status_code
+
+        if response.status_code in (429, 503):
+            last_error = f"{model} returned {response.status_code}: {response.text}"
+            if attempt < 2:
+                # The limiter holds this model back (Retry-After or backoff)
+                continue
+            # Try next model if available
+            break
+
+        if response.status_code in (404, 400, 403) + SERVER_ERROR_STATUSES:
+            # Model not available, invalid request for this model or a
+            # server error; try the next model
+            last_error = f"{model} returned {response.status_code}: {response.text}"
+            break
+
+        response.raise_for_status()
+        hedger.record_latency(model, time.monotonic() - started)
+        data = response.json()
+        text = (
+            data.get("candidates", [{}])[0]
+            .get("content", {})
+            .get("parts", [{}])[0]
+            .get("text", "")
+        )
+        if not text:
+            raise ModelBusyError("Model returned empty response. Please retry.")
+        return text
+
+    raise _ModelUnavailable(last_error, status)
+
+
+def _build_grok_payload(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]],
+    model: str
+) -> Dict[str, Any]:
+    """Convert chat messages + options into an OpenAI-style chat payload"""
     chat_messages = []
     for msg in messages:
         role = msg.get("role")
@@ -222,32 +458,307 @@ async def _call_grok(messages: List[Dict[str, str]], options: Optional[Dict[str,
         if "stopSequences" in options and isinstance(options["stopSequences"], list):
             payload["stop"] = options["stopSequences"]
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        for attempt in range(3):
-            response = await client.post(
-                url,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}",
-                },
-                json=payload,
-            )
+    return payload
+
+
+async def _call_grok(payload: Dict[str, Any], priority: str = DEFAULT_PRIORITY) -> str:
+    try:
+        return await _guarded(
+            "grok", payload["model"],
+            lambda: _call_grok_model(payload, priority)
+        )
+    except _ModelUnavailable as e:
+        raise ModelBusyError(str(e))
 
-            if response.status_code in (429, 503):
-                if attempt < 2:
-                    await asyncio.sleep(0.5 * (2 ** attempt))
-                    continue
-                raise ModelBusyError("Model is busy. Please retry.")
-
-            response.raise_for_status()
-            data = response.json()
-            text = (
-                data.get("choices", [{}])[0]
-                .get("message", {})
-                .get("content", "")
+
+async def _call_grok_model(payload: Dict[str, Any], priority: str) -> str:
+    base_url, _, api_key = _get_grok_config()
+    url = f"{base_url}/chat/completions"
+
+    client = get_http_client()
+    limiter = get_rate_limiter()
+
+    for attempt in range(3):
+        async with limiter.slot("grok", payload["model"], priority) as permit:
+            with track_request():
+                response = await client.post(
+                    url,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Authorization": f"Bearer {api_key}",
+                    },
+                    json=payload,
+                    timeout=get_timeout("grok"),
+                )
+            permit.observe(response)
+
+        if response.status_code in (429, 503):
+            if attempt < 2:
+                continue
+            raise _ModelUnavailable("Model is busy. Please retry.", response.status_code)
+
+        if response.status_code in (404, 403) + SERVER_ERROR_STATUSES:
+            raise _ModelUnavailable(
+                f"{payload['model']} returned {response.status_code}: {response.text}",
+                response.status_code,
             )
-            if not text:
-                raise ModelBusyError("Model returned empty response. Please retry.")
-            return text
 
-    raise ModelBusyError("Model is busy. Please retry.")
+        response.raise_for_status()
+        data = response.json()
+        text = (
+            data.get("choices", [{}])[0]
+            .get("message", {})
+            .get("content", "")
+        )
+        if not text:
+            raise ModelBusyError("Model returned empty response. Please retry.")
+        return text
+
+    raise _ModelUnavailable("Model is busy. Please retry.")
+
+
+async def _iter_sse_data(response) -> AsyncIterator[str]:
+    """Yield the data field of each server-sent event in a streamed response"""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+
+async def stream_llm(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Stream the completion as text chunks while it is being generated
+
+    Retries, model fallback and provider failover only happen before the
+    first chunk is sent; once text has been yielded an upstream error is
+    raised to the caller.
+    """
+    provider = _get_provider()
+    priority = _get_priority(options)
+
+    # Primary provider first, then configured failover providers in order
+    providers = [provider] + [
+        p for p in _get_failover_providers()
+        if p != provider and _provider_configured(p)
+    ]
+
+    last_error: Optional[ModelBusyError] = None
+    for name in providers:
+        if name == "grok":
+            stream = _stream_grok(messages, options, priority)
+        else:
+            stream = _stream_gemini(messages, options, priority)
+        emitted = False
+        try:
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    emitted = True
+                    yield chunk
+            return
+        except ModelBusyError as e:
+            if emitted:
+                raise
+            last_error = e
+            if name != providers[-1]:
+                print(f"LLM provider {name} unavailable, failing over: {e}")
+    raise last_error
+
+
+async def _guarded_stream(
+    provider: str,
+    model: str,
+    stream: Callable[[], AsyncIterator[str]]
+) -> AsyncIterator[str]:
+    """Stream one model's completion through its circuit breaker (see _guarded)"""
+    breaker = get_breakers().get(provider, model)
+    if not breaker.allow():
+        raise _ModelUnavailable(f"{model} skipped: circuit open")
+
+    emitted = False
+    try:
+        async with aclosing(stream()) as chunks:
+            async for chunk in chunks:
+                emitted = True
+                yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        # The caller stopped reading (e.g. the client disconnected)
+        breaker.record_cancelled()
+        raise
+    except _ModelUnavailable as e:
+        if e.status in BREAKER_FAILURE_STATUSES:
+            breaker.record_failure(str(e))
+        else:
+            breaker.record_cancelled()
+        raise
+    except DeadlineExceeded:
+        breaker.record_cancelled()
+        raise
+    except Exception as e:
+        if deadline.expired():
+            breaker.record_cancelled()
+            raise DeadlineExceeded(f"Deadline exceeded streaming {model}") from e
+        breaker.record_failure(str(e))
+        if not emitted and isinstance(e, httpx.TransportError):
+            raise _ModelUnavailable(f"{model} request failed: {e!r}") from e
+        raise
+
+    if not emitted:
+        breaker.record_failure(f"{model} returned an empty stream")
+        raise _ModelUnavailable(f"{model} returned an empty response")
+    breaker.record_success()
+
+
+async def _stream_gemini(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]],
+    priority: str
+) -> AsyncIterator[str]:
+    api_key = get_api_key()
+    payload = _build_gemini_payload(messages, options)
+    breakers = get_breakers()
+
+    # Skip models whose breaker is open without paying the failure again
+    models = [m for m in _get_model_list() if not breakers.get("gemini", m).is_open()]
+    if not models:
+        raise ModelBusyError("All Gemini models are unavailable (circuit open). Please retry.")
+
+    last_error: Optional[str] = None
+    for model in models:
+        stream = _guarded_stream(
+            "gemini", model,
+            lambda: _stream_gemini_model(model, payload, priority, api_key)
+        )
+        try:
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            return
+        except _ModelUnavailable as e:
+            # Only raised before the first chunk; try the next model
+            last_error = str(e)
+
+    raise ModelBusyError(last_error or "All models are busy or unavailable. Please retry.")
+
+
+async def _stream_gemini_model(
+    model: str,
+    payload: Dict[str, Any],
+    priority: str,
+    api_key: str
+) -> AsyncIterator[str]:
+    """Stream from one Gemini model, retrying 429/503 up to three times"""
+    client = get_http_client()
+    limiter = get_rate_limiter()
+
+    endpoint = f"{_get_gemini_base_url()}/{model}:streamGenerateContent"
+    last_error: Optional[str] = None
+    status: Optional[int] = None
+
+    for attempt in range(3):
+        async with limiter.slot("gemini", model, priority) as permit:
+            with track_request():
+                async with client.stream(
+                    "POST",
+                    endpoint,
+                    params={"key": api_key, "alt": "sse"},
+                    headers={"Content-Type": "application/json"},
+                    json=payload,
+                    timeout=get_timeout("gemini"),
+                ) as response:
+                    permit.observe(response)
+                    status = response.status_code
+                    if status in (429, 503, 404, 400, 403) + SERVER_ERROR_STATUSES:
+                        await response.aread()
+                        last_error = f"{model} returned {status}: {response.text}"
+                    else:
+                        response.raise_for_status()
+                        async for data in _iter_sse_data(response):
+                            chunk = json.loads(data)
+                            parts = (
+                                chunk.get("candidates", [{}])[0]
+                                .get("content", {})
+                                .get("parts", [])
+                            )
+                            for part in parts:
+                                text = part.get("text", "")
+                                if text:
+                                    yield text
+                        return
+
+        if status in (429, 503) and attempt < 2:
+            continue
+        # Try next model if available
+        break
+
+    raise _ModelUnavailable(last_error, status)
+
+
+async def _stream_grok(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]],
+    priority: str
+) -> AsyncIterator[str]:
+    _, model, _ = _get_grok_config()
+    payload = _build_grok_payload(messages, options, model)
+    payload["stream"] = True
+
+    stream = _guarded_stream("grok", model, lambda: _stream_grok_model(payload, priority))
+    try:
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                yield chunk
+    except _ModelUnavailable as e:
+        raise ModelBusyError(str(e))
+
+
+async def _stream_grok_model(payload: Dict[str, Any], priority: str) -> AsyncIterator[str]:
+    base_url, _, api_key = _get_grok_config()
+    url = f"{base_url}/chat/completions"
+
+    client = get_http_client()
+    limiter = get_rate_limiter()
+
+    for attempt in range(3):
+        async with limiter.slot("grok", payload["model"], priority) as permit:
+            with track_request():
+                async with client.stream(
+                    "POST",
+                    url,
+                    headers={
+                        "Content-Type": "application/json",
+                        "Authorization": f"Bearer {api_key}",
+                    },
+                    json=payload,
+                    timeout=get_timeout("grok"),
+                ) as response:
+                    permit.observe(response)
+                    status = response.status_code
+                    if status in (429, 503):
+                        await response.aread()
+                        if attempt < 2:
+                            continue
+                        raise _ModelUnavailable("Model is busy. Please retry.", status)
+                    if status in (404, 403) + SERVER_ERROR_STATUSES:
+                        await response.aread()
+                        raise _ModelUnavailable(
+                            f"{payload['model']} returned {status}: {response.text}",
+                            status,
+                        )
+
+                    response.raise_for_status()
+                    async for data in _iter_sse_data(response):
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        text = (
+                            chunk.get("choices", [{}])[0]
+                            .get("delta", {})
+                            .get("content")
+                        )
+                        if text:
+                            yield text
+                    return
+
+    raise _ModelUnavailable("Model is busy. Please retry.")
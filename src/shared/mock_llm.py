@@ -0,0 +1,223 @@
+"""
+Mock LLM - Deterministic local stand-in for the Gemini and OpenAI-style APIs
+Mounted on the shared HTTP client so load tests exercise the real call path
+(retries, limiter, breakers, streaming) without calling Google or x.ai
+
+Enable with LLM_PROVIDER=mock and/or EMBEDDING_PROVIDER=mock.
+"""
+import os
+import json
+import random
+import asyncio
+import hashlib
+import httpx
+from typing import Dict, List, Optional
+
+MOCK_HOST = "mock-llm.local"
+MOCK_BASE_URL = f"http://{MOCK_HOST}"
+
+_WORDS = (
+    "closure function scope variable value returns inner outer context "
+    "example array object loop callback promise async await module class "
+    "method state memory python javascript string number list key index "
+    "tutor learn concept step first then because so and the a of to in"
+).split()
+
+
+def llm_mock_enabled() -> bool:
+    return (os.getenv("LLM_PROVIDER") or "").strip().lower() == "mock"
+
+
+def embedding_mock_enabled() -> bool:
+    return (os.getenv("EMBEDDING_PROVIDER") or "").strip().lower() == "mock"
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def _digest(data: bytes) -> int:
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "big")
+
+
+class MockUpstream:
+    """
+    Serves generateContent, streamGenerateContent, embedContent,
+    batchEmbedContents and /chat/completions
+
+    Configuration (env):
+    - MOCK_LLM_LATENCY_MS / MOCK_LLM_LATENCY_SIGMA: lognormal latency
+      (median in ms, sigma of the underlying normal; 0 = fixed)
+    - MOCK_EMBEDDING_LATENCY_MS: median latency for embedding calls
+    - MOCK_LLM_429_RATE / MOCK_LLM_503_RATE: injected error rates (0-1)
+    - MOCK_LLM_RETRY_AFTER: Retry-After seconds sent with injected 429s
+    - MOCK_LLM_UNAVAILABLE_MODELS: comma-separated models that return 404
+    - MOCK_LLM_RESPONSE_WORDS: words per completion (capped by maxOutputTokens)
+    - MOCK_LLM_STREAM_CHUNK_WORDS / MOCK_LLM_STREAM_CHUNK_DELAY_MS: streaming shape
+    - MOCK_EMBEDDING_DIM: embedding dimensions
+    - MOCK_LLM_SEED: seed for latency and error injection
+    """
+
+    def __init__(self):
+        self.latency_ms = _env_float("MOCK_LLM_LATENCY_MS", 200)
+        self.latency_sigma = _env_float("MOCK_LLM_LATENCY_SIGMA", 0.5)
+        self.embedding_latency_ms = _env_float("MOCK_EMBEDDING_LATENCY_MS", 30)
+        self.rate_429 = _env_float("MOCK_LLM_429_RATE", 0)
+        self.rate_503 = _env_float("MOCK_LLM_503_RATE", 0)
+        self.retry_after = os.getenv("MOCK_LLM_RETRY_AFTER")
+        self.unavailable_models = {
+            m.strip() for m in os.getenv("MOCK_LLM_UNAVAILABLE_MODELS", "").split(",") if m.strip()
+        }
+        self.response_words = int(_env_float("MOCK_LLM_RESPONSE_WORDS", 120))
+        self.chunk_words = max(1, int(_env_float("MOCK_LLM_STREAM_CHUNK_WORDS", 4)))
+        self.chunk_delay_ms = _env_float("MOCK_LLM_STREAM_CHUNK_DELAY_MS", 20)
+        self.embedding_dim = int(_env_float("MOCK_EMBEDDING_DIM", 3072))
+        self._rng = random.Random(int(_env_float("MOCK_LLM_SEED", 42)))
+
+        self.requests: Dict[str, int] = {}
+        self.injected_errors: Dict[int, int] = {}
+
+    # ── Deterministic content ────────────────────────────────────────
+
+    def completion_text(self, body: bytes, max_tokens: Optional[int] = None) -> str:
+        """Deterministic completion derived from the request body"""
+        rng = random.Random(_digest(body))
+        count = self.response_words
+        if max_tokens:
+            count = min(count, max(1, int(max_tokens * 0.75)))
+        words = [rng.choice(_WORDS) for _ in range(count)]
+        return f"[mock {_digest(body):016x}] " + " ".join(words)
+
+    def embedding(self, text: str) -> List[float]:
+        """Deterministic unit-length embedding derived from the text"""
+        rng = random.Random(_digest(text.encode("utf-8")))
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+    # ── Behaviour injection ──────────────────────────────────────────
+
+    async def _sleep(self, median_ms: float):
+        if median_ms <= 0:
+            return
+        delay = median_ms
+        if self.latency_sigma > 0:
+            delay = self._rng.lognormvariate(0.0, self.latency_sigma) * median_ms
+        await asyncio.sleep(delay / 1000)
+
+    def _injected_error(self) -> Optional[httpx.Response]:
+        roll = self._rng.random()
+        if roll < self.rate_429:
+            headers = {"retry-after": self.retry_after} if self.retry_after else {}
+            return self._error(429, "RESOURCE_EXHAUSTED", headers)
+        if roll < self.rate_429 + self.rate_503:
+            return self._error(503, "UNAVAILABLE")
+        return None
+
+    def _error(self, status: int, reason: str, headers: Dict = None) -> httpx.Response:
+        self.injected_errors[status] = self.injected_errors.get(status, 0) + 1
+        return httpx.Response(
+            status,
+            headers=headers or {},
+            json={"error": {"code": status, "status": reason, "message": "mock error"}},
+        )
+
+    # ── Routing ──────────────────────────────────────────────────────
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        route = path.rsplit(":", 1)[-1] if ":" in path else path.rsplit("/", 1)[-1]
+        self.requests[route] = self.requests.get(route, 0) + 1
+        body = request.content
+        payload = json.loads(body or b"{}")
+
+        if route in ("embedContent", "batchEmbedContents"):
+            await self._sleep(self.embedding_latency_ms)
+            error = self._injected_error()
+            if error is not None:
+                return error
+            if route == "embedContent":
+                text = payload["content"]["parts"][0]["text"]
+                return httpx.Response(200, json={"embedding": {"values": self.embedding(text)}})
+            return httpx.Response(200, json={"embeddings": [
+                {"values": self.embedding(item["content"]["parts"][0]["text"])}
+                for item in payload.get("requests", [])
+            ]})
+
+        if route in ("generateContent", "streamGenerateContent"):
+            model = path.split("/v1beta/", 1)[-1].rsplit(":", 1)[0]
+            if model in self.unavailable_models:
+                return self._error(404, "NOT_FOUND")
+            await self._sleep(self.latency_ms)
+            error = self._injected_error()
+            if error is not None:
+                return error
+            max_tokens = payload.get("generationConfig", {}).get("maxOutputTokens")
+            text = self.completion_text(body, max_tokens)
+            if route == "generateContent":
+                return httpx.Response(200, json=self._gemini_chunk(text))
+            return self._sse_response(text, self._gemini_chunk)
+
+        if route == "completions":
+            await self._sleep(self.latency_ms)
+            error = self._injected_error()
+            if error is not None:
+                return error
+            text = self.completion_text(body, payload.get("max_tokens"))
+            if not payload.get("stream"):
+                return httpx.Response(200, json={
+                    "model": payload.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                })
+            return self._sse_response(
+                text,
+                lambda chunk: {"choices": [{"index": 0, "delta": {"content": chunk}}]},
+                done_marker=True,
+            )
+
+        return httpx.Response(404, json={"error": {"code": 404, "message": f"mock: no route {path}"}})
+
+    @staticmethod
+    def _gemini_chunk(text: str) -> Dict:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+    def _sse_response(self, text: str, wrap, done_marker: bool = False) -> httpx.Response:
+        words = text.split(" ")
+        chunks = [
+            " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+            for i in range(0, len(words), self.chunk_words)
+        ]
+
+        async def events():
+            for chunk in chunks:
+                yield f"data: {json.dumps(wrap(chunk))}\r\n\r\n".encode()
+                await asyncio.sleep(self.chunk_delay_ms / 1000)
+            if done_marker:
+                yield b"data: [DONE]\r\n\r\n"
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+
+    def stats(self) -> Dict:
+        return {
+            "requests": dict(self.requests),
+            "injected_errors": dict(self.injected_errors),
+        }
+
+
+_mock_upstream: Optional[MockUpstream] = None
+
+
+def get_mock_upstream() -> MockUpstream:
+    """Get or create the mock upstream singleton"""
+    global _mock_upstream
+    if _mock_upstream is None:
+        _mock_upstream = MockUpstream()
+    return _mock_upstream
+
+
+def mock_transport() -> httpx.MockTransport:
+    """httpx transport that serves requests from the mock upstream"""
+    return httpx.MockTransport(get_mock_upstream().handle)
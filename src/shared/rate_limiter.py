@@ -0,0 +1,287 @@
+"""
+Rate Limiter - Adaptive, priority-aware limiter for upstream LLM traffic
+One token bucket + AIMD concurrency window per (provider, model) scope
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from shared import deadline
+from shared.deadline import DeadlineExceeded
+
+# Lower value = served first
+PRIORITIES = {
+    "interactive": 0,
+    "batch": 1,
+    "background": 2,
+}
+DEFAULT_PRIORITY = "interactive"
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class ScopeLimiter:
+    """
+    Limits one upstream scope
+
+    - Token bucket caps the request rate (rate <= 0 disables it)
+    - AIMD window caps concurrency: +1/limit per success,
+      halved on 429/503 (at most once per cooldown)
+    - Retry-After (or exponential backoff) pauses all grants for the scope
+    - Waiters are served by priority class, FIFO within a class
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        decrease_cooldown: float = 1.0,
+        base_backoff: float = 0.5
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_cooldown = decrease_cooldown
+        self.base_backoff = base_backoff
+
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.grants = 0
+        self.deadline_drops = 0
+        self.throttles = 0
+        self.total_wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, priority: str = DEFAULT_PRIORITY):
+        """Wait for a slot; the caller must call release() afterwards"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        rank = PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY])
+        heapq.heappush(self._waiters, (rank, next(self._seq), future))
+        started = time.monotonic()
+
+        self._dispatch()
+        try:
+            # Don't queue past the request's deadline
+            budget = deadline.remaining()
+            if budget is None:
+                await future
+            else:
+                await asyncio.wait_for(future, max(0.0, budget))
+        except asyncio.TimeoutError:
+            self.deadline_drops += 1
+            raise DeadlineExceeded(f"Deadline exceeded waiting for {self.name}")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted, but the caller went away before using it
+                self.release()
+            raise
+        self.total_wait_seconds += time.monotonic() - started
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def on_success(self):
+        self._consecutive_throttles = 0
+        self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        self.throttles += 1
+        self._consecutive_throttles += 1
+
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = now
+
+        if retry_after is None:
+            retry_after = self.base_backoff * (2 ** min(self._consecutive_throttles - 1, 5))
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._refill(now)
+
+        while self._waiters:
+            _, _, future = self._waiters[0]
+            if future.done():
+                # Cancelled while queued
+                heapq.heappop(self._waiters)
+                continue
+
+            if self.in_flight >= max(1, int(self.limit)):
+                return
+
+            if now < self.blocked_until:
+                self._schedule(self.blocked_until - now)
+                return
+
+            if self.rate > 0 and self.tokens < 1:
+                self._schedule((1 - self.tokens) / self.rate)
+                return
+
+            heapq.heappop(self._waiters)
+            if self.rate > 0:
+                self.tokens -= 1
+            self.in_flight += 1
+            self.grants += 1
+            future.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def stats(self) -> Dict:
+        queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        names = {rank: name for name, rank in PRIORITIES.items()}
+        for rank, _, future in self._waiters:
+            if not future.done():
+                queued[names[rank]] += 1
+
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": queued,
+            "tokens": round(self.tokens, 2) if self.rate > 0 else None,
+            "rate_per_second": self.rate or None,
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "grants": self.grants,
+            "deadline_drops": self.deadline_drops,
+            "throttles": self.throttles,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.grants, 2) if self.grants else 0.0,
+        }
+
+
+class Permit:
+    """Slot held for one upstream request; feeds the response back into the limiter"""
+
+    def __init__(self, scope: ScopeLimiter):
+        self.scope = scope
+
+    def observe(self, response):
+        """Record the outcome of an upstream response (httpx.Response)"""
+        if response.status_code in THROTTLE_STATUSES:
+            self.scope.on_throttle(parse_retry_after(response.headers.get("retry-after")))
+        elif response.status_code < 400:
+            self.scope.on_success()
+
+
+class _PermitContext:
+    def __init__(self, scope: ScopeLimiter, priority: str):
+        self.scope = scope
+        self.priority = priority
+
+    async def __aenter__(self) -> Permit:
+        await self.scope.acquire(self.priority)
+        return Permit(self.scope)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.scope.release()
+        return False
+
+
+class RateLimiter:
+    """
+    Registry of scope limiters keyed by (provider, model)
+
+    Configured per traffic kind ("llm" or "embedding") via env:
+    <KIND>_RATE_LIMIT_RPS, <KIND>_RATE_LIMIT_BURST,
+    <KIND>_CONCURRENCY_INITIAL, <KIND>_CONCURRENCY_MIN, <KIND>_CONCURRENCY_MAX
+    """
+
+    def __init__(self):
+        self._scopes: Dict[Tuple[str, str], ScopeLimiter] = {}
+
+    def _create_scope(self, provider: str, model: str, kind: str) -> ScopeLimiter:
+        prefix = kind.upper()
+        rate = _env_float(f"{prefix}_RATE_LIMIT_RPS", 0.0)
+        return ScopeLimiter(
+            name=f"{provider}:{model}",
+            rate=rate,
+            burst=_env_float(f"{prefix}_RATE_LIMIT_BURST", max(1.0, rate)),
+            initial_limit=_env_float(f"{prefix}_CONCURRENCY_INITIAL", 8),
+            min_limit=_env_float(f"{prefix}_CONCURRENCY_MIN", 1),
+            max_limit=_env_float(f"{prefix}_CONCURRENCY_MAX", 64),
+        )
+
+    def scope(self, provider: str, model: str, kind: str = "llm") -> ScopeLimiter:
+        key = (provider, model)
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = self._create_scope(provider, model, kind)
+            self._scopes[key] = scope
+        return scope
+
+    def slot(
+        self,
+        provider: str,
+        model: str,
+        priority: Optional[str] = None,
+        kind: str = "llm"
+    ) -> _PermitContext:
+        """Async context manager holding a slot for one upstream request"""
+        return _PermitContext(self.scope(provider, model, kind), priority or DEFAULT_PRIORITY)
+
+    def stats(self) -> Dict:
+        return {scope.name: scope.stats() for scope in self._scopes.values()}
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create the rate limiter singleton"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
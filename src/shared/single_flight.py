@@ -0,0 +1,90 @@
+"""
+Single Flight - Coalesce identical in-flight upstream requests
+Concurrent callers with the same key share one upstream future
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from shared.deadline import spawn_detached
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key
+
+    - The first caller for a key starts the upstream call (the leader)
+    - Later callers with the same key await the same task
+    - Errors are delivered to every waiter
+    - The upstream call doesn't inherit the leader's request deadline;
+      each caller bounds only its own wait
+    - A cancelled caller only stops waiting; the upstream call is
+      cancelled once no callers are left waiting for it
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled_upstream = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            # Not on the leader's deadline: each waiter bounds its own wait
+            call = _Call(spawn_detached(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is left to receive the result
+                self._forget(key, call)
+                call.task.cancel()
+                self.cancelled_upstream += 1
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _finish(self, key: Hashable, call: _Call):
+        self._forget(key, call)
+        # Mark the exception as retrieved when every waiter already left
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced_callers": self.coalesced,
+            "cancelled_upstream": self.cancelled_upstream,
+        }
+
+
+_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Get or create the named single-flight group"""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = SingleFlight(name)
+        _flights[name] = flight
+    return flight
+
+
+def single_flight_stats() -> Dict:
+    return {name: flight.stats() for name, flight in _flights.items()}